@@ -0,0 +1,519 @@
+"""The interface between flitter and the window system.
+
+A backend is a connection to a window system (an X display, for example).
+Flitter only ever talks to the window system through a backend, so different
+ways of talking to X (or a simulated window system, for tests and benchmarks)
+can be swapped in without changing anything else.
+
+"""
+import collections
+import importlib
+import os
+import time
+
+from flitter import deadline as deadline_
+from flitter import process
+
+
+#: The properties that Window objects' attributes are read from.
+WINDOW_PROPERTIES = ('_NET_WM_DESKTOP', '_NET_WM_PID', 'WM_CLASS',
+                     'WM_CLIENT_MACHINE', '_NET_WM_NAME',
+                     '_NET_WM_WINDOW_TYPE', '_NET_WM_STATE')
+
+#: The window types of application windows, that flitter should focus.
+#: Windows of other types (desktops, docks, panels, menus, splash screens,
+#: notifications...) are never focused.
+NORMAL_TYPES = ('_NET_WM_WINDOW_TYPE_NORMAL', '_NET_WM_WINDOW_TYPE_DIALOG')
+
+#: The EWMH hints that flitter uses, and what it needs each one for. Window
+#: managers list the hints they support in _NET_SUPPORTED.
+EWMH_HINTS = (
+    ('_NET_SUPPORTED', "telling which hints are supported"),
+    ('_NET_CLIENT_LIST', "finding the open windows"),
+    ('_NET_ACTIVE_WINDOW', "raising windows and knowing which is focused"),
+    ('_NET_CURRENT_DESKTOP', "--current-desktop"),
+    ('_NET_WM_DESKTOP', "--current-desktop and prelaunched windows"),
+    ('_NET_WM_STATE', "knowing which windows are minimized"),
+    ('_NET_WM_STATE_HIDDEN', "--ignore-minimized"),
+    ('_NET_WM_STATE_SKIP_TASKBAR', "--ignore-skip-taskbar"),
+    ('_NET_WM_STATE_DEMANDS_ATTENTION', "--urgent-first"),
+    ('_NET_WM_WINDOW_TYPE', "never raising docks, panels and desktops"),
+    ('_NET_WM_PID', "the exe, cmdline, child_cmdline and cwd spec keys"),
+    ('_NET_CLOSE_WINDOW', "--close-all"),
+)
+
+#: The names of the available backends and the modules that implement them.
+BACKENDS = {
+    'ewmh': 'flitter.ewmh_window',
+    'xcb': 'flitter.xcb_window',
+    'sim': 'flitter.simulator',
+}
+
+#: The backends that talk to a real X server, that users can choose between.
+X_BACKENDS = ('ewmh', 'xcb')
+
+#: The ICCCM WM_CHANGE_STATE value for minimizing (iconifying) a window.
+ICONIC_STATE = 3
+
+#: The _NET_ACTIVE_WINDOW source indications. Window managers' focus stealing
+#: prevention is more lenient with requests from pagers and other tools
+#: acting on the user's direct behalf than with requests from applications.
+SOURCE_APPLICATION = 1
+SOURCE_PAGER = 2
+
+#: How much of each property (in 32-bit units) the X backends ask for up
+#: front. Longer properties need a second request.
+PROPERTY_LENGTH = 1024
+
+#: An event from the window system.
+#:
+#: ``type`` is one of ``"clients"`` (windows have been opened or closed),
+#: ``"active"`` (a different window has been focused) or ``"property"``
+#: (``property`` of the window with ID ``window_id`` has changed).
+Event = collections.namedtuple('Event', 'type window_id property')
+
+
+class BackendError(Exception):
+    pass
+
+
+def get_backend(name='ewmh', display=None):
+    """Return a new backend of the given type.
+
+    :param name: one of the names in BACKENDS
+    :param display: the display to connect to, e.g. ":1" (optional, defaults
+        to $DISPLAY)
+
+    """
+    try:
+        module = importlib.import_module(BACKENDS[name])
+    except KeyError:
+        raise BackendError("Unknown backend: {0}".format(name))
+    return module.Backend(display)
+
+
+def log_missed_deadline(logger, timed_out, deadline):
+    """Log the properties that missed the deadline, in one grouped warning.
+
+    :param timed_out: the properties that missed the deadline
+    :type timed_out: list of (window ID, property name) tuples
+
+    """
+    missed = {}
+    for window_id, name in timed_out:
+        missed.setdefault(window_id, []).append(name)
+    first_window_id = timed_out[0][0]
+    first_names = missed[first_window_id]
+    logger.warning("Missed the %d ms deadline waiting for %s of window "
+                   "0x%08x (and %d more properties of %d windows)",
+                   deadline.milliseconds, ", ".join(first_names),
+                   first_window_id, len(timed_out) - len(first_names),
+                   len(missed) - 1)
+
+
+def _first(value):
+    """Return the first item of a CARDINAL property's value, or None."""
+    if value:
+        return value[0]
+    return None
+
+
+class Window(object):
+
+    """An open window.
+
+    Windows are made by their backends from the window's properties. Window
+    attributes whose properties are missing (for example because they couldn't
+    be fetched before the deadline) are None.
+
+    """
+
+    def __init__(self, backend, window_id, properties):
+        self.backend = backend
+        self.window_id = window_id
+        self.desktop = _first(properties.get('_NET_WM_DESKTOP'))
+        self.pid = _first(properties.get('_NET_WM_PID'))
+        wm_class = properties.get('WM_CLASS')
+        if wm_class is not None and len(wm_class.split('\0')) >= 2:
+            self.wm_class = '.'.join(wm_class.split('\0')[:2])
+        else:
+            self.wm_class = None
+        self.machine = properties.get('WM_CLIENT_MACHINE')
+        self.title = properties.get('_NET_WM_NAME')
+        self._types = properties.get('_NET_WM_WINDOW_TYPE') or ()
+        self._states = properties.get('_NET_WM_STATE') or ()
+
+    def __eq__(self, other):
+        if not hasattr(other, "window_id"):
+            return False
+        return self.window_id == other.window_id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        return '{window_id} {wm_class} {title}'.format(
+                window_id=self.window_id, wm_class=self.wm_class,
+                title=self.title)
+
+    def focus(self, confirm_timeout_ms=None):
+        """Focus (activate) this window.
+
+        See Backend.focus().
+
+        """
+        return self.backend.focus(self, confirm_timeout_ms)
+
+    def _has_state(self, name):
+        return self.backend.atom(name) in self._states
+
+    @property
+    def normal(self):
+        """True if this is an application window rather than a dock, etc.
+
+        Windows without a _NET_WM_WINDOW_TYPE are application windows.
+
+        """
+        if not self._types:
+            return True
+        return bool(self.backend.atom_set(NORMAL_TYPES).intersection(
+            self._types))
+
+    @property
+    def minimized(self):
+        return self._has_state('_NET_WM_STATE_HIDDEN')
+
+    @property
+    def skip_taskbar(self):
+        return self._has_state('_NET_WM_STATE_SKIP_TASKBAR')
+
+    @property
+    def urgent(self):
+        """True if this window is demanding the user's attention."""
+        return self._has_state('_NET_WM_STATE_DEMANDS_ATTENTION')
+
+    # The window's process, looked up through /proc when they're first used.
+    # These are None if the process isn't known (or isn't on this machine).
+
+    def _process(self):
+        if self.pid is None or not process.is_local(self.machine):
+            return None
+        return process.CACHE.lookup(self.pid)
+
+    def _foreground_process(self):
+        if self.pid is None or not process.is_local(self.machine):
+            return None
+        return process.CACHE.foreground(self.pid)
+
+    @property
+    def exe(self):
+        """The path to the executable of the window's process."""
+        info = self._process()
+        return info.exe if info is not None else None
+
+    @property
+    def cmdline(self):
+        """The command line of the window's process."""
+        info = self._process()
+        return info.cmdline if info is not None else None
+
+    @property
+    def child_cmdline(self):
+        """The command line of the newest descendant of the window's process.
+
+        For a terminal, that's the command running in it.
+
+        """
+        info = self._foreground_process()
+        return info.cmdline if info is not None else None
+
+    @property
+    def cwd(self):
+        """The current directory of the newest descendant of the window's
+        process (or of the process itself, if it has none).
+
+        """
+        info = self._foreground_process() or self._process()
+        if info is None:
+            return None
+        try:
+            return os.readlink('/proc/{0}/cwd'.format(info.pid))
+        except (IOError, OSError):
+            return None
+
+
+class Backend(object):
+
+    """The base class for backends.
+
+    Subclasses implement the primitive operations (the methods that raise
+    NotImplementedError) and get the rest from this class.
+
+    """
+
+    #: The Window class that this backend makes.
+    window_class = Window
+
+    def __init__(self, display=None):
+        self.display_name = display
+        self._atom_sets = {}
+        # Events that were read while waiting for something else.
+        self._set_aside = []
+
+    def clock(self):
+        """Return the current time in seconds.
+
+        Deadlines for this backend should be measured with this clock.
+
+        """
+        return time.time()
+
+    # Primitive operations.
+
+    def atom(self, name):
+        """Return the atom (integer) for the given name."""
+        raise NotImplementedError
+
+    def client_ids(self):
+        """Return the IDs of all the windows that the window manager manages.
+
+        In _NET_CLIENT_LIST order.
+
+        This is the one round trip of a command that deadlines don't bound:
+        without the client list there are no windows to fetch, and a command
+        that carried on without them would act as if no windows were open.
+        It's a single small reply, and the time it takes still counts
+        against the command's deadline.
+
+        """
+        raise NotImplementedError
+
+    def active_window_id(self, deadline=None):
+        """Return the ID of the active window, or None.
+
+        :param deadline: give up waiting for the reply when this deadline
+            passes, and return None (optional)
+        :type deadline: deadline.Deadline
+
+        """
+        raise NotImplementedError
+
+    def current_desktop(self, deadline=None):
+        """Return the number of the current desktop.
+
+        :param deadline: give up waiting for the reply when this deadline
+            passes, and return None (optional)
+        :type deadline: deadline.Deadline
+
+        """
+        raise NotImplementedError
+
+    def supported_hints(self):
+        """Return the names of the hints that the window manager supports.
+
+        That's the atoms in the root window's _NET_SUPPORTED property.
+
+        """
+        raise NotImplementedError
+
+    def fetch_properties(self, window_ids, names=WINDOW_PROPERTIES,
+                         deadline=None):
+        """Fetch the given properties of all of the given windows in a batch.
+
+        Backends should fetch all of the properties with as few round trips
+        to the window system as they can. If a deadline is given then any
+        properties that haven't been received when it passes are given up on,
+        left out of the returned dicts and logged. That includes the further
+        requests for the rest of properties too long for the first reply.
+
+        :param window_ids: the IDs of the windows
+        :param names: the names of the properties to fetch
+        :type names: sequence of strings
+        :param deadline: the deadline for receiving the properties (optional)
+        :type deadline: deadline.Deadline
+
+        :returns: a dict mapping window IDs to dicts mapping property names to
+            property values: strings for text properties, sequences of
+            integers for others. Properties that the window doesn't have, or
+            that couldn't be fetched, are missing from the dicts.
+
+        """
+        raise NotImplementedError
+
+    def send(self, action, window):
+        """Ask the window manager to do something to a window.
+
+        The request may not be sent until flush() is called.
+
+        :param action: "raise", "raise-as-pager" (raise on the user's direct
+            behalf, which focus stealing prevention is more lenient with),
+            "minimize", "close" or "move-to-current-desktop"
+        :type action: string
+
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """Send any requests that haven't been sent yet."""
+        raise NotImplementedError
+
+    def subscribe(self, window_ids=()):
+        """Start receiving events about the root window and given windows."""
+        raise NotImplementedError
+
+    def fileno(self):
+        """Return a file descriptor that's readable when events are pending."""
+        raise NotImplementedError
+
+    def events(self):
+        """Return the list of pending Events, without blocking."""
+        raise NotImplementedError
+
+    def wait(self, deadline):
+        """Wait until events are pending, or the deadline passes."""
+        raise NotImplementedError
+
+    def close(self):
+        """Close the connection to the window system."""
+
+    # Operations built out of the primitives.
+
+    def atom_set(self, names):
+        """Return the frozenset of the atoms for the given names.
+
+        The sets are cached, so that testing windows' types and states is
+        just integer comparisons.
+
+        """
+        atoms = self._atom_sets.get(names)
+        if atoms is None:
+            atoms = self._atom_sets[names] = frozenset(
+                self.atom(name) for name in names)
+        return atoms
+
+    def windows(self, deadline=None):
+        """Return a list of Window objects for all currently open windows.
+
+        :param deadline: stop waiting for the windows' properties when this
+            deadline passes, any properties not received by then are left
+            unknown (optional)
+        :type deadline: deadline.Deadline
+
+        """
+        window_ids = self.client_ids()
+        properties = self.fetch_properties(window_ids, deadline=deadline)
+        return [self.window_class(self, window_id, properties[window_id])
+                for window_id in window_ids]
+
+    def window(self, window_id):
+        """Return a Window object for the open window with the given window_id.
+
+        Returns None if there's no open window with the given window_id
+        (maybe the window has been closed).
+
+        """
+        if window_id not in self.client_ids():
+            return None
+        properties = self.fetch_properties([window_id])
+        return self.window_class(self, window_id, properties[window_id])
+
+    def focused_window(self, windows=None, deadline=None):
+        """Return the currently focused window.
+
+        :param windows: the already-fetched list of open windows, if given the
+            focused window is taken from this list instead of fetching its
+            properties again (optional)
+        :type windows: list of Window objects
+
+        :param deadline: the deadline for the round trips, if it passes before
+            the active window is known then None is returned (optional)
+        :type deadline: deadline.Deadline
+
+        """
+        window_id = self.active_window_id(deadline=deadline)
+        if window_id is None:
+            return None
+        for window in windows or ():
+            if window.window_id == window_id:
+                return window
+        properties = self.fetch_properties([window_id], deadline=deadline)
+        return self.window_class(self, window_id, properties[window_id])
+
+    def pending_events(self):
+        """Return the list of pending Events, without blocking.
+
+        This is events() plus any events that were read while focus() was
+        waiting for the window manager, so that event loops don't miss them.
+
+        """
+        events, self._set_aside = self._set_aside, []
+        return events + self.events()
+
+    def perform(self, actions):
+        """Perform the given window actions in one batch.
+
+        All of the actions' requests are queued up and then sent with a
+        single flush, rather than one round trip per window.
+
+        :param actions: the actions to perform
+        :type actions: list of (action name, Window) tuples, see send()
+
+        """
+        for action, window in actions:
+            self.send(action, window)
+        self.flush()
+
+    def focus(self, window, confirm_timeout_ms=None):
+        """Focus (activate) the given window.
+
+        If confirm_timeout_ms is given then wait (for up to that long) for the
+        window manager to actually activate the window. If it doesn't, for
+        example because its focus stealing prevention dropped the request,
+        then ask again (this time as a pager rather than an application) and
+        wait once more.
+
+        :param confirm_timeout_ms: how long to wait for the window manager to
+            activate the window, each time we ask it to (optional)
+        :type confirm_timeout_ms: int
+
+        :returns: the number of milliseconds from sending the first request to
+            the window being activated, or None if the window wasn't
+            activated in time (or if confirm_timeout_ms wasn't given)
+        :rtype: float
+
+        """
+        if confirm_timeout_ms is None:
+            self.perform([("raise", window)])
+            return None
+
+        # Subscribe first so that we find out when _NET_ACTIVE_WINDOW changes,
+        # instead of polling it.
+        self.subscribe()
+        start = self.clock()
+        for action in ("raise", "raise-as-pager"):
+            self.perform([(action, window)])
+            if self._wait_for_active_window(window.window_id,
+                                            confirm_timeout_ms):
+                return (self.clock() - start) * 1000.0
+        return None
+
+    def _wait_for_active_window(self, window_id, timeout_ms):
+        """Wait for the window with the given ID to become the active window.
+
+        Returns True if it does within timeout_ms milliseconds, False
+        otherwise.
+
+        """
+        deadline = deadline_.Deadline(timeout_ms, clock=self.clock)
+        while True:
+            if self.active_window_id(deadline=deadline) == window_id:
+                return True
+            while True:
+                events = self.events()
+                # Keep them for pending_events().
+                self._set_aside.extend(events)
+                if any(event.type == "active" for event in events):
+                    break
+                if deadline.expired():
+                    return False
+                self.wait(deadline)
@@ -0,0 +1,101 @@
+"""Running many flitter commands in one process: ``flitter --batch``.
+
+Each line of standard input is a flitter command line (an alias, explicit
+window spec options, ``--print-matching`` queries...) and each command's
+result is written to standard output as one line of JSON, in the same format
+as flitter-daemon's replies (see client.py)::
+
+    $ printf 'firefox\\n--print-matching vim\\n' | flitter --batch
+    {"stdout": null, "result": null, "status": 0}
+    {"stdout": "46137349 gvim.Gvim notes.txt - GVIM", "result": null, ...}
+
+Unlike flitter's own exit status, a --print-matching command that finds
+windows succeeds: the windows are its stdout and its status is 0.
+
+If flitter-daemon is running the commands are handed to it. Otherwise they
+are run in order with one connection to X, one loaded config file and one
+window cache that's kept up to date by X events (rather than fetching every
+window's properties again for each command). Any other command-line
+arguments given with --batch, for example ``-f CONFIG`` or ``--backend
+xcb``, apply to every command.
+
+"""
+import argparse
+import functools
+import json
+import os
+import shlex
+
+from flitter import backend as backend_
+from flitter import client
+from flitter import daemon
+
+
+def _runner(make_backend, backend_name):
+    """Return a daemon that doesn't listen on a socket, publish window tables
+    or keep standby instances: just its display cache and command handling.
+
+    """
+    return daemon.Daemon(
+        None,
+        make_backend=make_backend or functools.partial(
+            backend_.get_backend, backend_name),
+        window_tables=False, prelaunch=False)
+
+
+def run(args, input_, output, display=None, make_backend=None):
+    """Run the commands read from input_, writing their results to output.
+
+    :param args: the command-line arguments that were given with --batch
+    :type args: list of strings
+    :param input_: where to read the commands from, one per line
+    :type input_: file-like object
+    :param output: where to write the results to, one JSON object per line
+    :type output: file-like object
+    :param display: the display to run the commands on (optional, default:
+        $DISPLAY)
+    :param make_backend: the function to call to connect to the display
+        (optional, default: connect with the backend given by --backend)
+    :type make_backend: callable taking one argument: the display name
+
+    """
+    args = [arg for arg in args if arg != "--batch"]
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--backend", choices=backend_.X_BACKENDS,
+                        default="ewmh")
+    backend_name = parser.parse_known_args(args)[0].backend
+    display = display or os.environ.get("DISPLAY")
+
+    # Hand the commands to flitter-daemon if it's running: running them here
+    # as well would race it for the display's most-recently-used journal.
+    forward = client.daemon_running()
+    runner = None
+    try:
+        for line in input_:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                command_args = shlex.split(line)
+            except ValueError as err:
+                reply = {"stdout": None, "status": 2,
+                         "result": "Couldn't parse {0!r}: {1}".format(line,
+                                                                       err)}
+            else:
+                reply = None
+                if forward:
+                    reply = client.forward(args + command_args, display,
+                                           batch=True)
+                    # If the daemon has gone, carry on without it.
+                    forward = reply is not None
+                if reply is None:
+                    if runner is None:
+                        runner = _runner(make_backend, backend_name)
+                    reply = runner.handle_request(
+                        {"display": display, "args": args + command_args,
+                         "batch": True})
+            output.write(json.dumps(reply) + "\n")
+            output.flush()
+    finally:
+        if runner is not None:
+            runner.close()
@@ -0,0 +1,113 @@
+"""Handing commands to a resident flitter process (see daemon.py).
+
+A command is sent to the daemon as one line of JSON and the daemon replies
+with one line of JSON:
+
+    {"display": ":1", "cwd": "/home/me", "args": ["firefox"]}
+    {"stdout": null, "result": null, "status": 0}
+
+The daemon resolves a relative -f path, and runs the commands it launches,
+in the client's current directory.
+
+"""
+import json
+import os
+import socket
+import sys
+
+
+#: How long to wait for the daemon to handle a command, in seconds.
+TIMEOUT = 10
+
+
+def socket_path():
+    """Return the path to the daemon's socket."""
+    path = os.environ.get("FLITTER_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "flitter.sock")
+    return os.path.abspath(os.path.expanduser("~/.flitter.sock"))
+
+
+def daemon_running(path=None):
+    """Return True if a flitter daemon is listening on its socket."""
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def forward(args, display, path=None, batch=False):
+    """Send a command to the daemon and return its reply.
+
+    Returns None if no daemon is running, or if the daemon can't be talked
+    to (it's hung, or died before it replied), so that the caller can handle
+    the command itself.
+
+    :param args: the command-line arguments
+    :type args: list of strings
+    :param display: the display that the command is for, e.g. ":1"
+    :param batch: whether the command is one of flitter --batch's, whose
+        replies give --print-matching's windows as stdout (see batch.py)
+
+    :rtype: dict
+
+    """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        cwd = os.getcwd()
+    except OSError:
+        # The current directory has been removed.
+        cwd = None
+    request = {"display": display, "cwd": cwd, "args": list(args)}
+    if batch:
+        request["batch"] = True
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error:
+            # The daemon's not running (it left its socket behind).
+            return None
+        sock.settimeout(TIMEOUT)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except OSError:
+        # socket.timeout, BrokenPipeError, ConnectionResetError...
+        return None
+    finally:
+        sock.close()
+    if not data:
+        return {"status": 1, "result": "The flitter daemon didn't reply\n"}
+    return json.loads(data.decode("utf-8"))
+
+
+def finish(reply):
+    """Do what the daemon's reply says, return the value for main() to return.
+
+    """
+    if reply.get("stdout") is not None:
+        print(reply["stdout"])
+    if reply.get("status"):
+        result = reply.get("result") or ""
+        if result and not result.endswith("\n"):
+            result += "\n"
+        sys.stderr.write(result)
+        sys.exit(reply["status"])
+    return reply.get("result")
@@ -0,0 +1,993 @@
+"""Loading, compiling and live-reloading of flitter config files."""
+import errno
+import fnmatch
+import itertools
+import json
+import os
+import re
+import struct
+
+from flitter import backend
+
+
+#: Window spec keys that aren't matched against window attributes.
+NON_MATCHING_KEYS = ('command', 'prelaunch')
+
+#: Window spec keys whose window attributes can change without the window
+#: system saying so (they come from /proc), so matches against them can't be
+#: cached.
+LIVE_KEYS = ('child_cmdline', 'cwd')
+
+#: The ways a window spec value can be matched against a window attribute.
+#: Plain string values are regexes, other kinds are given as a one-item dict,
+#: e.g. {"exact": "skype.Skype"}.
+MATCH_KINDS = ('exact', 'prefix', 'suffix', 'glob', 'regex')
+
+
+def match_kind(value):
+    """Return the match kind and the string of the given spec value.
+
+    :raises ValueError: if the value isn't a valid spec value
+
+    """
+    if isinstance(value, dict):
+        if len(value) != 1 or list(value)[0] not in MATCH_KINDS:
+            raise ValueError(
+                "Window spec values must be strings or have one of the keys: "
+                "{0}".format(", ".join(MATCH_KINDS)))
+        kind, value = list(value.items())[0]
+    else:
+        kind = 'regex'
+    if not isinstance(value, str):
+        raise ValueError("Window spec values must be strings: {0!r}"
+                         .format(value))
+    return kind, value
+
+
+def window_attribute(window, key):
+    """Return the window's attribute that spec values are matched against.
+
+    Attributes are matched as strings: unknown (None) attributes as empty
+    strings and numbers (the pid and desktop) as their decimal strings.
+
+    """
+    value = getattr(window, key, '')
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def compile_value(value):
+    """Return a function that tests a window attribute against a spec value.
+
+    The function takes the attribute (a string, see window_attribute()) and
+    returns something truthy if it matches.
+
+    """
+    kind, string = match_kind(value)
+    if kind == 'exact':
+        return string.__eq__
+    elif kind == 'prefix':
+        return lambda attribute: attribute.startswith(string)
+    elif kind == 'suffix':
+        return lambda attribute: attribute.endswith(string)
+    elif kind == 'glob':
+        return re.compile(fnmatch.translate(string)).match
+    try:
+        return re.compile(string).match
+    except re.error as err:
+        raise ValueError("Invalid regex {0!r}: {1}".format(string, err))
+
+
+class WindowSpec(dict):
+
+    """A window spec dict with its regexes compiled ahead of time.
+
+    A WindowSpec is a normal window spec dict (it can be passed anywhere a
+    plain dict window spec can be) that also knows how to match windows
+    against itself without recompiling, or looking up in re's size-limited
+    cache, each of its regexes every time.
+
+    WindowSpecs shouldn't be modified after they've been created, copy them
+    into a new dict instead.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(WindowSpec, self).__init__(*args, **kwargs)
+        self._matchers = [(key, compile_value(self[key]))
+                          for key in sorted(self)
+                          if key not in NON_MATCHING_KEYS]
+
+    def matches(self, window):
+        """Return True if the given window matches this spec.
+
+        This matches in exactly the same way as runraisenext.matches().
+
+        """
+        for key, matcher in self._matchers:
+            if not matcher(window_attribute(window, key)):
+                return False
+        return True
+
+    def index_key(self):
+        """Return the (key, kind, string) that this spec is best indexed by.
+
+        That's an exact value if the spec has one, or else a prefix. Returns
+        None if the spec has neither, and can't be indexed.
+
+        """
+        best = None
+        for key in sorted(self):
+            if key in NON_MATCHING_KEYS:
+                continue
+            kind, string = match_kind(self[key])
+            if kind == 'exact':
+                return key, kind, string
+            if kind == 'prefix' and best is None:
+                best = key, kind, string
+        return best
+
+
+#: A "{name}" parameter placeholder in a spec template.
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+#: What spec template parameter names have to look like.
+_PARAM_NAME = re.compile(r'[A-Za-z_]\w*\Z')
+
+
+def _split(text, params):
+    """Split text into literal strings and the names of parameters.
+
+    Returns a list that alternates literal strings (at even indices) with
+    parameter names (at odd indices). Placeholders that aren't for one of the
+    given params, such as regex quantifiers like "{2}", are left in the
+    literal strings.
+
+    """
+    parts = ['']
+    for i, piece in enumerate(_PLACEHOLDER.split(text)):
+        if i % 2 and piece in params:
+            parts.extend([piece, ''])
+        elif i % 2:
+            parts[-1] += '{' + piece + '}'
+        else:
+            parts[-1] += piece
+    return parts
+
+
+class TemplateInstance(WindowSpec):
+
+    """One window spec of a SpecTemplate.
+
+    Its values are the template's, with the instance's parameter values
+    filled in. Only the values with parameters are compiled for each
+    instance, the parameter-free values are matched by the template's
+    matchers that all of its instances share.
+
+    """
+
+    def __init__(self, template, alias, values, spec):
+        dict.__init__(self, spec)
+        self._matchers = [(key, compile_value(self[key]))
+                          for key, kind, _ in template._templated
+                          if kind is not None]
+        self.template = template
+        self.alias = alias
+        self.values = values
+
+    def matches(self, window):
+        return (self.template._static.matches(window) and
+                super(TemplateInstance, self).matches(window))
+
+    def index_key(self):
+        return None
+
+
+class SpecTemplate(object):
+
+    """A family of window specs that only differ in their parameters' values.
+
+    For example a template with the alias pattern "project-{name}" and the
+    spec {"wm_class": "xterm", "title": "{name}"} and a list of names is the
+    same as a spec "project-foo" with the title "foo" for each name foo.
+
+    Instances are only created when their alias is asked for, or when a
+    window matches them. Windows are matched against all of the instances at
+    once: the template's parameter-free values are compiled and matched
+    once, and each value with placeholders is compiled to a single regex
+    with the parameter's values as alternatives. The value that the regex
+    matched, and any others that are in the window's attribute too, are the
+    only ones whose instances are tested, since more than one of them can
+    match (a title prefix "foo" matches wherever "foobar" does).
+
+    """
+
+    def __init__(self, pattern, raw_template):
+        """Compile a template from a config file.
+
+        :param pattern: the alias pattern, e.g. "project-{name}"
+        :param raw_template: the template's spec, with the parameters' lists
+            of values in a "params" dict
+        :type raw_template: dict
+
+        :raises ValueError: if the template isn't valid
+
+        """
+        if not isinstance(raw_template, dict):
+            raise ValueError(
+                "Spec template {0} must be a JSON object".format(pattern))
+        self.raw = raw_template
+        self.pattern = pattern.lower()
+        params = raw_template.get('params')
+        if not isinstance(params, dict) or not params:
+            raise ValueError(
+                "Spec template {0} has no params".format(pattern))
+        if 'prelaunch' in raw_template:
+            raise ValueError(
+                "Spec template {0} can't be prelaunched".format(pattern))
+
+        self._params = {}
+        self._values = {}
+        for name, values in params.items():
+            if not _PARAM_NAME.match(name):
+                raise ValueError("Spec template {0} has an invalid param "
+                                 "name: {1!r}".format(pattern, name))
+            if not values or not all(isinstance(value, str)
+                                     for value in values):
+                raise ValueError("Spec template {0}'s param {1} must be a "
+                                 "list of strings".format(pattern, name))
+            lowered = dict((value.lower(), value) for value in values)
+            if len(lowered) != len(values):
+                raise ValueError("Spec template {0}'s param {1} has duplicate "
+                                 "values".format(pattern, name))
+            self._params[name] = sorted(values, key=len, reverse=True)
+            self._values[name] = lowered
+
+        self._alias_parts = _split(self.pattern, self._params)
+        placeholders = self._alias_parts[1::2]
+        if sorted(placeholders) != sorted(self._params):
+            raise ValueError(
+                "Spec template {0} must use each of its params exactly once"
+                .format(pattern))
+
+        static = {}
+        self._templated = []
+        for key, value in raw_template.items():
+            if key == 'params':
+                continue
+            if key in NON_MATCHING_KEYS:
+                if not isinstance(value, str):
+                    raise ValueError("Spec template {0}'s {1} must be a "
+                                     "string".format(pattern, key))
+                parts = _split(value, self._params)
+                kind = None
+            else:
+                kind, string = match_kind(value)
+                parts = _split(string, self._params)
+            if len(parts) == 1:
+                static[key] = value
+            elif kind == 'glob':
+                raise ValueError("Spec template {0} can't use params in glob "
+                                 "values".format(pattern))
+            else:
+                if kind == 'regex':
+                    # Only the instances' regexes are compiled, later, so
+                    # check that the value is a valid regex now.
+                    compile_value(''.join(
+                        part if i % 2 == 0 else '(?:)'
+                        for i, part in enumerate(parts)))
+                self._templated.append((key, kind, parts))
+        self._templated.sort()
+
+        #: The keys of the template's specs.
+        self.keys = frozenset(key for key in raw_template if key != 'params')
+
+        self._static = WindowSpec(static)
+        self._matchers = None
+        self._resolved = {}
+
+    def _compile(self):
+        """Compile one regex for each value that has placeholders.
+
+        Each placeholder becomes an alternation of the param's values, so
+        the regex matches whatever any of the instances' values would. A
+        param's first placeholder in each value is a named group, to find
+        out which of its values the window could match.
+
+        """
+        matchers = []
+        for key, kind, parts in self._templated:
+            if kind is None:
+                continue
+            pieces = []
+            seen = set()
+            for i, part in enumerate(parts):
+                if i % 2 == 0:
+                    pieces.append(part if kind == 'regex' else re.escape(part))
+                    continue
+                alternatives = '|'.join(re.escape(value)
+                                        for value in self._params[part])
+                if part in seen:
+                    pieces.append('(?:{0})'.format(alternatives))
+                else:
+                    seen.add(part)
+                    pieces.append('(?P<{0}>{1})'.format(part, alternatives))
+            regex = ''.join(pieces)
+            if kind == 'exact':
+                regex += r'\Z'
+            elif kind == 'suffix':
+                regex = r'[\s\S]*' + regex + r'\Z'
+            matchers.append((key, re.compile(regex).match))
+        return matchers
+
+    def _candidates(self, window):
+        """Return the values of each param that the window might match.
+
+        :returns: a dict mapping param names to lists of values, or None if
+            the window can't match any of the template's specs
+
+        """
+        if not self._static.matches(window):
+            return None
+        if self._matchers is None:
+            self._matchers = self._compile()
+        candidates = dict(self._params)
+        for key, matcher in self._matchers:
+            attribute = window_attribute(window, key)
+            match = matcher(attribute)
+            if match is None:
+                return None
+            for name in self._params:
+                value = match.groupdict().get(name)
+                if value is None:
+                    # The placeholder is optional in the regex.
+                    continue
+                # The alternation picked one value, but others may match
+                # too (a title prefix "foo" matches wherever "foobar" does):
+                # they're all in the attribute.
+                candidates[name] = [other for other in candidates[name]
+                                    if other in attribute]
+        return candidates
+
+    def matching_aliases(self, window):
+        """Return the aliases of the template's specs that the window matches.
+
+        Only the instances for the param values found in the window are
+        created and tested.
+
+        """
+        candidates = self._candidates(window)
+        if candidates is None:
+            return []
+        names = sorted(candidates)
+        aliases = []
+        for values in itertools.product(
+                *[candidates[name] for name in names]):
+            instance = self._instance(dict(zip(names, values)))
+            if all(matcher(window_attribute(window, key))
+                   for key, matcher in instance._matchers):
+                aliases.append(instance.alias)
+        return aliases
+
+    def _alias(self, values):
+        return ''.join(part if i % 2 == 0 else values[part].lower()
+                       for i, part in enumerate(self._alias_parts))
+
+    def _bind_alias(self, alias, i=0, bound=None):
+        """Return the param values that make the given alias, or None."""
+        parts = self._alias_parts
+        bound = bound or {}
+        if i == len(parts):
+            return bound if not alias else None
+        if i % 2 == 0:
+            if alias.startswith(parts[i]):
+                return self._bind_alias(alias[len(parts[i]):], i + 1, bound)
+            return None
+        values = self._values[parts[i]]
+        for end in range(len(alias), 0, -1):
+            value = values.get(alias[:end])
+            if value is not None:
+                result = self._bind_alias(alias[end:], i + 1,
+                                          dict(bound, **{parts[i]: value}))
+                if result is not None:
+                    return result
+        return None
+
+    def resolve(self, alias):
+        """Return the template's spec with the given lowercased alias.
+
+        Returns None if the alias isn't one of the template's. The same
+        TemplateInstance object is returned for the same alias every time.
+
+        """
+        try:
+            return self._resolved[alias]
+        except KeyError:
+            pass
+        values = self._bind_alias(alias)
+        if values is None:
+            return None
+        return self._instance(values)
+
+    def _instance(self, values):
+        """Return the template's spec with the given param values."""
+        alias = self._alias(values)
+        try:
+            return self._resolved[alias]
+        except KeyError:
+            pass
+        spec = dict(self._static)
+        for key, kind, parts in self._templated:
+            string = ''.join(
+                part if i % 2 == 0 else
+                re.escape(values[part]) if kind == 'regex' else
+                values[part]
+                for i, part in enumerate(parts))
+            if kind is None or not isinstance(self.raw[key], dict):
+                spec[key] = string
+            else:
+                spec[key] = {kind: string}
+        instance = self._resolved[alias] = TemplateInstance(
+            self, alias, values, spec)
+        return instance
+
+    def owns(self, alias):
+        """Return True if the given lowercased alias is one of the template's.
+
+        """
+        return self.resolve(alias) is not None
+
+
+class SpecIndex(object):
+
+    """A collection of window specs, indexed for finding the ones a window
+    matches without testing the window against every spec.
+
+    Specs with an exact value are found with one dict lookup of the window's
+    attribute, and specs with a prefix by walking a trie along the attribute.
+    Only the specs found this way, plus any specs that can't be indexed, are
+    then matched against the window in full. Spec templates are each matched
+    once, for all of their specs.
+
+    """
+
+    def __init__(self, specs, templates=()):
+        """Index the given specs.
+
+        :param specs: the specs, either a dict mapping names to specs or a
+            list (where the specs' names are their positions in the list)
+        :param templates: spec templates whose specs (named by their aliases)
+            are part of the collection too
+        :type templates: list of SpecTemplate objects
+
+        """
+        self._templates = list(templates)
+        if isinstance(specs, dict):
+            self._specs = dict(specs)
+        else:
+            self._specs = dict(enumerate(specs))
+        self._exact = {}
+        self._prefix = {}
+        self._unindexed = []
+        for name, spec in sorted(self._specs.items()):
+            index_key = spec.index_key()
+            if index_key is None:
+                self._unindexed.append(name)
+                continue
+            key, kind, string = index_key
+            if kind == 'exact':
+                self._exact.setdefault(key, {}).setdefault(
+                    string, []).append(name)
+            else:
+                node = self._prefix.setdefault(key, {})
+                for char in string:
+                    node = node.setdefault(char, {})
+                # None can't clash with a character, so it marks the names of
+                # the specs whose prefix ends at this node.
+                node.setdefault(None, []).append(name)
+
+    def __iter__(self):
+        return iter(self._specs.values())
+
+    def __len__(self):
+        return len(self._specs)
+
+    def _candidates(self, window):
+        for key, table in self._exact.items():
+            names = table.get(window_attribute(window, key))
+            if names:
+                for name in names:
+                    yield name
+        for key, node in self._prefix.items():
+            for char in window_attribute(window, key):
+                for name in node.get(None, ()):
+                    yield name
+                node = node.get(char)
+                if node is None:
+                    break
+            else:
+                for name in node.get(None, ()):
+                    yield name
+        for name in self._unindexed:
+            yield name
+
+    def matching_names(self, window):
+        """Return the set of names of the specs that the window matches."""
+        names = set(name for name in self._candidates(window)
+                    if self._specs[name].matches(window))
+        for template in self._templates:
+            names.update(template.matching_aliases(window))
+        return names
+
+    def any_match(self, window):
+        """Return True if the window matches any of the specs."""
+        for name in self._candidates(window):
+            if self._specs[name].matches(window):
+                return True
+        for template in self._templates:
+            if template.matching_aliases(window):
+                return True
+        return False
+
+
+def _reuse_or_compile(raw_spec, previous_spec):
+    """Return previous_spec if it's unchanged, or a newly compiled spec."""
+    if previous_spec is not None and previous_spec == raw_spec:
+        return previous_spec
+    return WindowSpec(raw_spec)
+
+
+class Config(object):
+
+    """A parsed and compiled config file.
+
+    Config objects are never modified once loaded. Reloading a config file
+    creates a new Config object, so code that's in the middle of using the old
+    one (for example to handle a keypress) keeps a consistent view of it.
+
+    """
+
+    def __init__(self, path, specs, ignore, groups=None, backend_name=None,
+                 templates=None):
+        #: The absolute path to the file this config was loaded from.
+        self.path = path
+
+        #: A dict mapping lowercased aliases to WindowSpec objects.
+        self.specs = specs
+
+        #: The list of WindowSpecs for windows that should be ignored.
+        self.ignore = ignore
+
+        #: A dict mapping the aliases of specs that match window titles to
+        #: their specs: the only specs that a title change can affect.
+        self.title_specs = dict((alias, spec) for alias, spec in specs.items()
+                                if 'title' in spec)
+
+        #: A dict mapping the aliases of specs with LIVE_KEYS to their specs.
+        self.live_specs = dict(
+            (alias, spec) for alias, spec in specs.items()
+            if any(key in spec for key in LIVE_KEYS))
+
+        #: The list of SpecTemplates, whose specs are only created when
+        #: they're asked for by alias (see spec()).
+        self.templates = templates or []
+
+        #: The templates that match titles, and the ones with LIVE_KEYS.
+        self.title_templates = [template for template in self.templates
+                                if 'title' in template.keys]
+        self.live_templates = [
+            template for template in self.templates
+            if any(key in template.keys for key in LIVE_KEYS)]
+
+        #: SpecIndexes of the specs (by alias, including the templates'
+        #: specs) and of the ignore list.
+        self.index = SpecIndex(specs, self.templates)
+        self.ignore_index = SpecIndex(ignore)
+
+        #: A dict mapping lowercased launch group names to lists of
+        #: lowercased aliases.
+        self.groups = groups or {}
+
+        #: The name of the backend to use to talk to X, or None for the
+        #: default.
+        self.backend = backend_name
+
+    @classmethod
+    def load(cls, path, previous=None):
+        """Load the config file at the given path.
+
+        If a previously loaded Config is given then any window specs that are
+        unchanged since the previous config was loaded are reused instead of
+        being compiled again.
+
+        :raises IOError: if the file can't be read
+        :raises ValueError: if the file isn't a valid config file
+
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        with open(path, 'r') as file_:
+            data = json.loads(file_.read())
+        if not isinstance(data, dict):
+            raise ValueError("{0} must contain a JSON object".format(path))
+        for section, type_, required in (("specs", dict, True),
+                                         ("ignore", list, True),
+                                         ("templates", dict, False),
+                                         ("groups", dict, False)):
+            if section not in data and not required:
+                continue
+            if not isinstance(data.get(section), type_):
+                raise ValueError("{0} must have a \"{1}\" {2}".format(
+                    path, section,
+                    "object" if type_ is dict else "list"))
+
+        previous_specs = previous.specs if previous is not None else {}
+        specs = {}
+        for key in data["specs"]:
+            alias = key.lower()
+            if alias in specs:
+                raise ValueError(
+                    "Window spec {0} is defined more than once (aliases "
+                    "aren't case-sensitive)".format(key))
+            if not isinstance(data["specs"][key], dict):
+                raise ValueError(
+                    "Window spec {0} must be a JSON object".format(key))
+            if data["specs"][key].get("prelaunch") and (
+                    not data["specs"][key].get("command")):
+                raise ValueError(
+                    "Window spec {0} has prelaunch but no command"
+                    .format(key))
+            specs[alias] = _reuse_or_compile(
+                data["specs"][key], previous_specs.get(alias))
+
+        previous_ignore = previous.ignore if previous is not None else []
+        ignore = []
+        for i, raw_spec in enumerate(data["ignore"]):
+            if not isinstance(raw_spec, dict):
+                raise ValueError("The ignore list's window specs must be JSON "
+                                 "objects")
+            previous_spec = None
+            if i < len(previous_ignore):
+                previous_spec = previous_ignore[i]
+            ignore.append(_reuse_or_compile(raw_spec, previous_spec))
+
+        previous_templates = dict(
+            (template.pattern, template)
+            for template in (previous.templates if previous is not None
+                             else []))
+        templates = []
+        for pattern, raw_template in sorted(data.get("templates", {}).items()):
+            template = previous_templates.get(pattern.lower())
+            if template is None or template.raw != raw_template:
+                template = SpecTemplate(pattern, raw_template)
+            templates.append(template)
+
+        groups = {}
+        for name, aliases in data.get("groups", {}).items():
+            if name.lower() in groups:
+                raise ValueError(
+                    "Launch group {0} is defined more than once (names "
+                    "aren't case-sensitive)".format(name))
+            if not isinstance(aliases, list) or not all(
+                    isinstance(alias, str) for alias in aliases):
+                raise ValueError("Launch group {0} must be a list of "
+                                 "window spec names".format(name))
+            groups[name.lower()] = [alias.lower() for alias in aliases]
+            for alias in groups[name.lower()]:
+                if alias not in specs and not any(
+                        template.owns(alias) for template in templates):
+                    raise ValueError(
+                        "Launch group {group} contains unknown window spec "
+                        "{alias}".format(group=name, alias=alias))
+
+        backend_name = data.get("backend")
+        if backend_name is not None and (
+                backend_name not in backend.X_BACKENDS):
+            raise ValueError("Unknown backend {0}, should be one of: {1}"
+                             .format(backend_name,
+                                     ", ".join(backend.X_BACKENDS)))
+
+        return cls(path, specs, ignore, groups, backend_name, templates)
+
+    def spec(self, alias):
+        """Return the window spec with the given alias.
+
+        Specs in the "specs" section take precedence over the templates'.
+
+        :raises KeyError: if there's no spec with the alias
+
+        """
+        alias = alias.lower()
+        try:
+            return self.specs[alias]
+        except KeyError:
+            pass
+        for template in self.templates:
+            instance = template.resolve(alias)
+            if instance is not None:
+                return instance
+        raise KeyError(alias)
+
+    def alias_of(self, window_spec):
+        """Return the alias of the given spec object, or None if it isn't one
+        of this config's specs."""
+        if isinstance(window_spec, TemplateInstance):
+            if window_spec.template in self.templates:
+                return window_spec.alias
+            return None
+        for alias, spec in self.specs.items():
+            if spec is window_spec:
+                return alias
+        return None
+
+    def changed_aliases(self, previous):
+        """Return the aliases of specs added, changed or removed since previous.
+
+        :param previous: the Config that this one was reloaded from
+        :type previous: Config
+
+        :rtype: set of strings
+
+        """
+        changed = set(alias for alias in previous.specs
+                      if alias not in self.specs)
+        for alias, spec in self.specs.items():
+            if previous.specs.get(alias) is not spec:
+                changed.add(alias)
+        return changed
+
+    def changed_templates(self, previous):
+        """Return the templates removed and added since previous.
+
+        A changed template is both removed (the old one) and added (the new
+        one).
+
+        :rtype: (list of SpecTemplate, list of SpecTemplate)
+
+        """
+        return ([template for template in previous.templates
+                 if template not in self.templates],
+                [template for template in self.templates
+                 if template not in previous.templates])
+
+
+class Classifier(object):
+
+    """A cache of which window specs each window matches.
+
+    Classifying a window means matching it against every spec in the config,
+    so the results are cached per window. When the config is reloaded only the
+    specs that were added, changed or removed are re-matched against the
+    cached windows.
+
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def classify(self, window):
+        """Return the set of aliases of the specs that the window matches."""
+        try:
+            aliases = self._cache[window.window_id][1]
+        except KeyError:
+            self.misses += 1
+            aliases = frozenset(self.config.index.matching_names(window))
+            self._cache[window.window_id] = (window, aliases)
+            return aliases
+        self.hits += 1
+        if self.config.live_specs or self.config.live_templates:
+            # Specs that match the window's processes are always re-matched.
+            aliases = self._rematch(window, aliases, self.config.live_specs,
+                                    self.config.live_templates)
+        return aliases
+
+    def _rematch(self, window, aliases, specs, templates):
+        """Return aliases, with the given specs and templates re-matched."""
+        aliases = [alias for alias in aliases if alias not in specs and not
+                   any(template.owns(alias) for template in templates)]
+        aliases.extend(alias for alias, spec in specs.items()
+                       if spec.matches(window))
+        for template in templates:
+            aliases.extend(template.matching_aliases(window))
+        return frozenset(aliases)
+
+    def forget(self, window_id):
+        """Remove the window with the given ID from the cache.
+
+        Call this when a window is closed, or when its attributes change.
+
+        """
+        self._cache.pop(window_id, None)
+
+    def retitle(self, window):
+        """Update the cache for a window whose title (only) has changed.
+
+        Only the specs that match titles are re-matched against the window.
+
+        """
+        try:
+            aliases = self._cache[window.window_id][1]
+        except KeyError:
+            return
+        if self.config.title_specs or self.config.title_templates:
+            aliases = self._rematch(window, aliases, self.config.title_specs,
+                                    self.config.title_templates)
+        self._cache[window.window_id] = (window, aliases)
+
+    def reload(self, config):
+        """Switch to a newly reloaded config.
+
+        :returns: the aliases of the specs that changed
+        :rtype: set of strings
+
+        """
+        changed = config.changed_aliases(self.config)
+        removed, added = config.changed_templates(self.config)
+        self.config = config
+        if not changed and not removed and not added:
+            return changed
+        for window_id, (window, aliases) in list(self._cache.items()):
+            aliases = set(
+                alias for alias in aliases - changed
+                if not any(template.owns(alias) for template in removed))
+            for alias in changed:
+                spec = config.specs.get(alias)
+                if spec is not None and spec.matches(window):
+                    aliases.add(alias)
+            for template in added:
+                aliases.update(template.matching_aliases(window))
+            self._cache[window_id] = (window, frozenset(aliases))
+        return changed
+
+
+# Constants from <sys/inotify.h>.
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _inotify_libc():
+    """Return the C library if it supports inotify, None otherwise."""
+    # Imported here because importing ctypes is slow, and most flitter
+    # commands never watch the config file.
+    import ctypes
+    import ctypes.util
+    name = ctypes.util.find_library('c')
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+class ConfigWatcher(object):
+
+    """Watch a config file for changes.
+
+    Uses inotify where it's available (on Linux) and falls back on comparing
+    the file's modification time otherwise. Watching is done on the file's
+    directory, not the file itself, so that editors that save by writing a new
+    file and renaming it over the old one are noticed too.
+
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self._fd = None
+        self._mtime = self._stat()
+        libc = _inotify_libc()
+        if libc is None:
+            return
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            return
+        directory = os.path.dirname(self.path).encode()
+        mask = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO |
+                _IN_CREATE | _IN_DELETE)
+        if libc.inotify_add_watch(fd, directory, mask) < 0:
+            os.close(fd)
+            return
+        self._fd = fd
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def fileno(self):
+        """Return the inotify file descriptor, or None if polling.
+
+        Long-running code can wait on this file descriptor with select() (or
+        the selectors module) and call changed() when it becomes readable.
+
+        """
+        return self._fd
+
+    def changed(self):
+        """Return True if the config file has changed since the last call."""
+        if self._fd is None:
+            mtime = self._stat()
+            changed = mtime != self._mtime
+            self._mtime = mtime
+            return changed
+
+        name = os.path.basename(self.path).encode()
+        changed = False
+        while True:
+            try:
+                data = os.read(self._fd, 4096)
+            except OSError as err:
+                if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                if data[offset:offset + length].rstrip(b'\0') == name:
+                    changed = True
+                offset += length
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class LiveConfig(object):
+
+    """A config that's reloaded whenever its file changes.
+
+    For long-running flitter processes. ``self.config`` is always the most
+    recently loaded Config object: it's swapped out for a new one on reload,
+    never modified, so callers should grab it once per keypress.
+
+    """
+
+    def __init__(self, path, classifier=None):
+        self.config = Config.load(path)
+        self.watcher = ConfigWatcher(self.config.path)
+        self.classifier = classifier or Classifier(self.config)
+
+    def fileno(self):
+        return self.watcher.fileno()
+
+    def check(self):
+        """Reload the config if its file has changed.
+
+        If the file is currently invalid (for example because it's half
+        written) the previous config is kept.
+
+        :returns: the aliases of the specs that changed
+        :rtype: set of strings
+
+        """
+        if not self.watcher.changed():
+            return set()
+        try:
+            config = Config.load(self.config.path, previous=self.config)
+        except (IOError, OSError, ValueError):
+            return set()
+        changed = self.classifier.reload(config)
+        self.config = config
+        return changed
+
+    def close(self):
+        self.watcher.close()
@@ -0,0 +1,698 @@
+"""A resident flitter process that serves many X displays at once.
+
+Instead of starting a new flitter process (and connecting to X, fetching every
+window's properties and parsing the config file) for every keypress, the
+flitter daemon stays running and the flitter command hands each keypress to it
+(see client.py). One daemon serves all the X displays on the host: the
+commands it receives say which display they're for, and the daemon connects
+to a display the first time it gets a command for it.
+
+Each display has its own window cache, kept up to date by X events in a
+single selector-based event loop, and its own most-recently-used list (kept
+in an append-only journal, see mru.py).
+Displays that haven't been used for a while are disconnected (unless they
+have standby windows, see standby.py), so the daemon's memory and CPU use grow
+with the number of active displays.
+
+Each display's cache is also published as a window table in shared memory
+(see window_table.py), for programs that only want to read it.
+
+"""
+import argparse
+import functools
+import io
+import json
+import logging
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from flitter import backend as backend_
+from flitter import client
+from flitter import config
+from flitter import mru
+from flitter import process
+from flitter import runraisenext
+from flitter import standby
+from flitter import stats as stats_
+from flitter import window_index
+from flitter import window_table
+
+
+log = logging.getLogger(__name__)
+
+#: Disconnect from displays that haven't been used for this many seconds.
+DEFAULT_IDLE_TIMEOUT = 600
+
+#: Wait this many seconds for more title changes before publishing them.
+TITLE_DELAY = 0.25
+
+#: The property that holds a window's title.
+_TITLE = '_NET_WM_NAME'
+
+
+class DaemonError(Exception):
+    pass
+
+
+def _timed_out(properties, names, deadline):
+    """Return the IDs of the windows whose properties may have timed out.
+
+    fetch_properties() leaves the properties that didn't arrive before the
+    deadline out of its dicts, just as it leaves out the properties that
+    windows don't have, so if the deadline has passed any window that's
+    missing one of the properties is counted.
+
+    """
+    if deadline is None or not deadline.expired():
+        return set()
+    return set(window_id for window_id, window_properties in
+               properties.items()
+               if any(name not in window_properties for name in names))
+
+
+class DisplayState(object):
+
+    """The daemon's connection to, and cache of, one X display."""
+
+    def __init__(self, name, backend, start_function=None, table_path=None,
+                 statistics=None):
+        """Start caching the given display.
+
+        :param table_path: the path to publish the display's window table at
+            (optional, default: don't publish one)
+        :param statistics: the daemon's statistics, to count the display's
+            events and report its classifier's hit rate in (optional)
+        :type statistics: stats.Stats
+
+        """
+        self.name = name
+        self.backend = backend
+        self.statistics = statistics
+        self.standby = standby.StandbyPool(backend, start_function)
+        self.last_used = time.time()
+        self.classifier = None
+        self.table = None
+        if table_path is not None:
+            self.table = window_table.TableWriter(table_path)
+        self.mru = self._open_mru()
+        self._mru_reconciled = False
+        self._windows = {}
+        self._client_ids = None
+        self._dirty = set()
+        self._retitled = set()
+        #: The open windows' titles, indexed for --find.
+        self.search_index = window_index.WindowIndex()
+        backend.subscribe()
+
+    def _open_mru(self):
+        """Open the display's most-recently-used journal.
+
+        If flitter has been run without the daemon since the journal was last
+        written then the journal carries on from flitter's pickled list.
+
+        """
+        path = mru.journal_path(self.name)
+        pickle_path = runraisenext.pickle_path(self.name)
+        try:
+            pickle_is_newer = (not os.path.exists(path) or
+                               os.path.getmtime(pickle_path) >
+                               os.path.getmtime(path))
+        except OSError:
+            pickle_is_newer = False
+        journal = mru.Journal(path)
+        if pickle_is_newer:
+            try:
+                journal.reset(runraisenext._load(pickle_path))
+            except (IOError, EOFError):
+                pass
+        return journal
+
+    def handle_events(self):
+        """Update the cache from the display's pending events.
+
+        Changed windows are only marked as changed here, their properties are
+        fetched (all in one batch) when the next command needs them. Windows
+        whose titles are all that changed are marked separately, so that
+        only their titles are fetched: however many times a window is
+        retitled, that's one property fetched once.
+
+        :returns: the number of events handled
+
+        """
+        events = self.backend.pending_events()
+        for event in events:
+            if self.statistics is not None:
+                self.statistics.count_event(event.type)
+            if event.type == "clients":
+                self._client_ids = None
+            elif event.type == "property":
+                if event.property == _TITLE:
+                    self._retitled.add(event.window_id)
+                elif event.property in backend_.WINDOW_PROPERTIES:
+                    self._dirty.add(event.window_id)
+        return len(events)
+
+    def pending_changes(self):
+        """Return what has changed since the cache was last brought up to date.
+
+        :returns: "windows" if windows have been opened, closed or changed,
+            "titles" if only windows' titles have changed, or None
+
+        """
+        if self._client_ids is None or self._dirty:
+            return "windows"
+        if self._retitled:
+            return "titles"
+        return None
+
+    def open_windows(self, deadline=None):
+        """Return the list of open windows, fetching only what has changed."""
+        if self._client_ids is None:
+            client_ids = self.backend.client_ids()
+            current = set(client_ids)
+            closed = [window_id for window_id in self._windows
+                      if window_id not in current]
+            for window_id in closed:
+                del self._windows[window_id]
+                self.search_index.remove(window_id)
+                if self.classifier is not None:
+                    self.classifier.forget(window_id)
+            if closed:
+                # Their processes may have exited too.
+                process.CACHE.prune()
+            new = [window_id for window_id in client_ids
+                   if window_id not in self._windows]
+            self._dirty.update(new)
+            self.backend.subscribe(new)
+            self._client_ids = client_ids
+
+        dirty = [window_id for window_id in self._client_ids
+                 if window_id in self._dirty]
+        timed_out = set()
+        if dirty:
+            properties = self.backend.fetch_properties(dirty,
+                                                       deadline=deadline)
+            timed_out = _timed_out(properties, backend_.WINDOW_PROPERTIES,
+                                   deadline)
+            for window_id in dirty:
+                if window_id in timed_out and window_id in self._windows:
+                    # Keep what we had until the rest arrives.
+                    continue
+                self._windows[window_id] = self.backend.window_class(
+                    self.backend, window_id, properties[window_id])
+                self.search_index.update(self._windows[window_id])
+                if self.classifier is not None:
+                    self.classifier.forget(window_id)
+        # Windows whose properties didn't arrive before the deadline are
+        # fetched again next time. Windows that changed and were then closed
+        # are forgotten.
+        self._dirty = timed_out
+
+        retitled = [window_id for window_id in self._client_ids
+                    if window_id in self._retitled and
+                    window_id not in dirty]
+        timed_out = set()
+        if retitled:
+            properties = self.backend.fetch_properties(
+                retitled, names=(_TITLE,), deadline=deadline)
+            timed_out = _timed_out(properties, (_TITLE,), deadline)
+            for window_id in retitled:
+                if window_id in timed_out:
+                    continue
+                window = self._windows[window_id]
+                window.title = properties[window_id].get(_TITLE)
+                self.search_index.update(window)
+                if self.classifier is not None:
+                    self.classifier.retitle(window)
+        self._retitled = timed_out
+
+        windows = [self._windows[window_id] for window_id in self._client_ids]
+        if self.standby.windows or self.standby.pending:
+            self.standby.adopt(windows)
+        return windows
+
+    def use_config(self, config_):
+        """Classify this display's windows with the given config from now on.
+
+        """
+        if self.classifier is None or (
+                self.classifier.config.path != config_.path):
+            self.classifier = config.Classifier(config_)
+            if self.statistics is not None:
+                self.statistics.add_cache(
+                    "classifier {0}".format(self.name), self.classifier)
+        elif self.classifier.config is not config_:
+            self.classifier.reload(config_)
+
+    def publish(self):
+        """Bring the cache up to date and publish it in the window table."""
+        windows = self.open_windows()
+        if self.table is None:
+            return
+        ranks = dict(
+            (window.window_id, rank) for rank, window in enumerate(
+                runraisenext.sorted_most_recently_used(windows, self.name,
+                                                       self.mru)))
+        if self.classifier is not None:
+            config_ = self.classifier.config
+            classified = [self.classifier.classify(window)
+                          for window in windows]
+            # The templates' aliases are only listed if a window has them.
+            aliases = sorted(set(config_.specs).union(*classified))
+            indices = dict((alias, i) for i, alias in enumerate(aliases))
+        else:
+            config_ = None
+            aliases = []
+        standby_ids = self.standby.window_ids
+        entries = []
+        for i, window in enumerate(windows):
+            if config_ is not None:
+                specs = sorted(indices[alias] for alias in classified[i])
+                ignored = config_.ignore_index.any_match(window)
+            else:
+                specs = []
+                ignored = False
+            entries.append(window_table.Entry(
+                window.window_id, window.desktop, window.pid,
+                ranks[window.window_id],
+                window_table.window_flags(
+                    window, ignored, window.window_id in standby_ids),
+                window.wm_class, window.title, specs))
+        self.table.write(config_.path if config_ is not None else None,
+                         aliases, entries)
+
+    def compact_mru(self):
+        """Compact the most-recently-used journal, if it needs it.
+
+        The first time this is called the journal is always compacted, to
+        reconcile the list that was replayed from it with the windows that
+        are actually open.
+
+        """
+        if self._mru_reconciled and not self.mru.needs_compaction():
+            return
+        self.mru.compact([window.window_id
+                          for window in self.open_windows()])
+        self._mru_reconciled = True
+
+    def close(self):
+        try:
+            self.standby.close()
+        finally:
+            try:
+                if self.table is not None:
+                    self.table.close()
+            finally:
+                try:
+                    # Leave the list where flitter looks for it when the
+                    # daemon isn't running.
+                    runraisenext._dump(self.mru.window_ids(),
+                                       runraisenext.pickle_path(self.name))
+                    self.mru.close()
+                finally:
+                    self.backend.close()
+
+
+class Daemon(object):
+
+    """The daemon's event loop."""
+
+    def __init__(self, path, make_backend=None,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, window_tables=True,
+                 prelaunch=True):
+        """Make a new daemon.
+
+        :param path: the path to listen on
+        :param make_backend: the function to call to connect to a display
+            (optional, default: connect with the ewmh backend)
+        :type make_backend: callable taking one argument: the display name
+        :param idle_timeout: how long to keep idle displays connected for, in
+            seconds (displays with standby windows are kept connected)
+        :param window_tables: publish each display's window table next to the
+            socket, see window_table.py
+        :param prelaunch: keep standby instances of prelaunch specs running,
+            see standby.py
+
+        """
+        self.path = path
+        self.make_backend = make_backend or functools.partial(
+            backend_.get_backend, "ewmh")
+        self.idle_timeout = idle_timeout
+        self.window_tables = window_tables
+        self.prelaunch = prelaunch
+        self.selector = selectors.DefaultSelector()
+        self.displays = {}
+        self._configs = {}
+        self._children = []
+        self._buffers = {}
+        self._unpublished = set()
+        self._publish_at = {}
+        self._socket = None
+        #: The statistics of the commands this daemon has handled, for
+        #: flitter --stats.
+        self.stats = stats_.Stats()
+        self.stats.add_cache("process", process.CACHE)
+
+    # The event loop.
+
+    def listen(self):
+        """Start listening for commands on the daemon's socket.
+
+        :raises DaemonError: if another daemon is already listening on it
+
+        """
+        if client.daemon_running(self.path):
+            raise DaemonError(
+                "Another flitter daemon is already listening on {0}".format(
+                    self.path))
+        if os.path.exists(self.path):
+            # A daemon that's no longer running left it behind.
+            os.unlink(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._socket.listen(16)
+        self._socket.setblocking(False)
+        self.selector.register(self._socket, selectors.EVENT_READ,
+                               self._accept)
+
+    def serve_once(self, timeout=None):
+        """Wait for and handle one round of events."""
+        for key, _ in self.selector.select(timeout):
+            key.data(key.fileobj)
+        self.publish()
+        self._reap()
+        self._disconnect_idle()
+
+    def serve_forever(self):
+        try:
+            while True:
+                self.serve_once(self._idle_check_interval())
+        finally:
+            self.close()
+
+    def publish(self):
+        """Publish the window tables of displays that have changed.
+
+        Their most-recently-used journals are compacted here too, when they
+        need it.
+
+        This is done once per round of the event loop, after any replies
+        have been sent, so publishing doesn't slow commands down and a burst
+        of events is published once. Displays where only titles have
+        changed are published TITLE_DELAY seconds after the first change, so
+        that a storm of title changes is published a few times a second at
+        most.
+
+        """
+        now = time.time()
+        for name, publish_at in list(self._publish_at.items()):
+            if publish_at <= now or name in self._unpublished:
+                del self._publish_at[name]
+                self._unpublished.add(name)
+        unpublished, self._unpublished = self._unpublished, set()
+        for name in unpublished:
+            if name not in self.displays:
+                continue
+            try:
+                self.displays[name].publish()
+                self.displays[name].compact_mru()
+            except Exception:
+                log.exception("Lost the connection to display %s", name)
+                self._disconnect(name)
+
+    def _idle_check_interval(self):
+        timeouts = []
+        if self.displays:
+            timeouts.append(self.idle_timeout)
+        if self._publish_at:
+            timeouts.append(max(min(self._publish_at.values()) - time.time(),
+                                0))
+        if not timeouts:
+            return None
+        return min(timeouts)
+
+    def close(self):
+        for name in list(self.displays):
+            self._disconnect(name)
+        for live_config in self._configs.values():
+            live_config.close()
+        self._configs = {}
+        if self._socket is not None:
+            self.selector.unregister(self._socket)
+            self._socket.close()
+            self._socket = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    # Clients.
+
+    def _accept(self, sock):
+        try:
+            conn, _ = sock.accept()
+        except socket.error:
+            return
+        conn.setblocking(False)
+        self._buffers[conn] = b""
+        self.selector.register(conn, selectors.EVENT_READ, self._read)
+
+    def _read(self, conn):
+        try:
+            chunk = conn.recv(65536)
+        except socket.error:
+            chunk = b""
+        if chunk:
+            self._buffers[conn] += chunk
+            if b"\n" not in self._buffers[conn]:
+                return
+        self.selector.unregister(conn)
+        data = self._buffers.pop(conn)
+        try:
+            if b"\n" in data:
+                line = data.split(b"\n", 1)[0]
+                try:
+                    reply = self.handle_request(
+                        json.loads(line.decode("utf-8")))
+                except Exception as err:
+                    # A bad command mustn't take the daemon down.
+                    log.exception("Couldn't handle a command")
+                    reply = {"stdout": None, "status": 1,
+                             "result": "flitter daemon: {0}".format(err)}
+                conn.setblocking(True)
+                conn.settimeout(client.TIMEOUT)
+                conn.sendall(json.dumps(reply).encode("utf-8") + b"\n")
+        except socket.error as err:
+            log.warning("Couldn't reply to a command: %s", err)
+        finally:
+            conn.close()
+
+    def handle_request(self, request):
+        """Handle one command and return the reply to send back.
+
+        :param request: the command, see client.py. Commands from flitter
+            --batch have "batch": true, see batch.py
+        :type request: dict
+
+        :rtype: dict
+
+        """
+        start_time = time.time()
+        display = request.get("display") or os.environ.get("DISPLAY")
+        cwd = request.get("cwd")
+        configs = []
+
+        def load_config(path):
+            configs.append(self._load_config(path))
+            return configs[-1]
+
+        # Catch anything the argument parser prints, so that it can be sent
+        # back to the client instead.
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = io.StringIO(), io.StringIO()
+        try:
+            arguments = runraisenext.parse_command_line_arguments(
+                request["args"], load_config=load_config, cwd=cwd)
+        except SystemExit as exit_:
+            return {"stdout": sys.stdout.getvalue() or None,
+                    "result": sys.stderr.getvalue() or None,
+                    "status": exit_.code or 0}
+        except Exception as err:
+            # For example a config file that doesn't load.
+            log.exception("Error parsing the command %r", request.get("args"))
+            return {"stdout": None, "status": 1,
+                    "result": "flitter daemon: {0}".format(err)}
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+        start_function = functools.partial(self._start, display=display,
+                                           cwd=cwd)
+        try:
+            state = self._display(display)
+            state.last_used = time.time()
+            state.handle_events()
+            output, result = runraisenext.handle(
+                arguments, backend=state.backend,
+                windows_function=state.open_windows,
+                run_function=start_function, start_function=start_function,
+                start_time=start_time, standby=state.standby,
+                mru=state.mru, search_index=state.search_index,
+                statistics=self.stats)
+            # Confirming the focus may have read events off the connection
+            # that won't make it readable again.
+            state.handle_events()
+            for config_ in configs:
+                if self.prelaunch:
+                    state.standby.keep(config_.specs.values())
+                state.use_config(config_)
+            self._unpublished.add(display)
+        except Exception as err:
+            log.exception("Error handling a command for display %s", display)
+            if display in self.displays:
+                self._disconnect(display)
+            return {"stdout": None, "status": 1,
+                    "result": "flitter daemon: {0}".format(err)}
+        if request.get("batch") and arguments.print_matching:
+            # Matching windows aren't an error in a batch's replies.
+            return {"stdout": result, "result": None, "status": 0}
+        return {"stdout": output, "result": result,
+                "status": 1 if result else 0}
+
+    def _load_config(self, path):
+        """Return the config at the given path, reloading it if it's changed.
+
+        """
+        live_config = self._configs.get(path)
+        if live_config is None:
+            live_config = self._configs[path] = config.LiveConfig(path)
+        else:
+            live_config.check()
+        return live_config.config
+
+    # Displays.
+
+    def _display(self, name):
+        state = self.displays.get(name)
+        if state is None:
+            table_path = None
+            if self.window_tables:
+                table_path = window_table.table_path(name, self.path)
+            state = self.displays[name] = DisplayState(
+                name, self.make_backend(name),
+                start_function=functools.partial(self._start, display=name),
+                table_path=table_path, statistics=self.stats)
+            self.selector.register(state.backend.fileno(),
+                                   selectors.EVENT_READ,
+                                   functools.partial(self._display_events,
+                                                     name))
+            log.info("Connected to display %s", name)
+        return state
+
+    def _display_events(self, name, fileobj):
+        try:
+            state = self.displays[name]
+            state.handle_events()
+            changes = state.pending_changes()
+            if changes == "windows" or state.standby.pending:
+                # Keep the window table up to date (a standby instance may
+                # have opened its window, too).
+                self._unpublished.add(name)
+            elif changes == "titles":
+                self._publish_at.setdefault(name, time.time() + TITLE_DELAY)
+        except Exception:
+            log.exception("Lost the connection to display %s", name)
+            self._disconnect(name)
+
+    def _disconnect(self, name):
+        state = self.displays.pop(name)
+        try:
+            self.selector.unregister(state.backend.fileno())
+        except (KeyError, ValueError):
+            pass
+        try:
+            state.close()
+        except Exception:
+            pass
+        log.info("Disconnected from display %s", name)
+
+    def _disconnect_idle(self):
+        now = time.time()
+        for name, state in list(self.displays.items()):
+            if state.standby.windows or state.standby.pending:
+                # Disconnecting would close the standby windows, and they're
+                # there for the next time the display is used, however long
+                # that is.
+                continue
+            if now - state.last_used > self.idle_timeout:
+                self._disconnect(name)
+
+    # Launching apps.
+
+    def _start(self, command, display, cwd=None):
+        """Start a command on the given display, without waiting for it.
+
+        :param cwd: the directory to run the command in, the client's
+            (optional, default: the daemon's)
+
+        :rtype: subprocess.Popen
+
+        """
+        env = dict(os.environ)
+        if display:
+            env["DISPLAY"] = display
+        if cwd is not None and not os.path.isdir(cwd):
+            cwd = None
+        child = subprocess.Popen(command, shell=True, env=env, cwd=cwd)
+        self._children.append(child)
+        return child
+
+    def _reap(self):
+        self._children = [child for child in self._children
+                          if child.poll() is None]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="a resident flitter process that serves many X displays")
+    parser.add_argument(
+        "--socket", default=client.socket_path(),
+        help="the path of the socket to listen for commands on")
+    parser.add_argument(
+        "--backend", choices=backend_.X_BACKENDS, default="ewmh",
+        help="how to talk to the X servers")
+    parser.add_argument(
+        "--idle-timeout", type=int, default=DEFAULT_IDLE_TIMEOUT,
+        metavar="SECONDS",
+        help="disconnect from displays that haven't been used for this long "
+             "(unless they have standby instances of prelaunch specs)")
+    parser.add_argument(
+        "--no-window-table", action="store_false", dest="window_tables",
+        help="don't publish the displays' window tables for other programs "
+             "to read")
+    parser.add_argument(
+        "--trace-memory", action="store_true",
+        help="trace the daemon's memory allocations, so that flitter --stats "
+             "lists the lines that have allocated the most (this slows the "
+             "daemon down)")
+    args = parser.parse_args(args)
+
+    logging.basicConfig()
+    if args.trace_memory:
+        tracemalloc.start()
+    daemon = Daemon(
+        args.socket,
+        make_backend=functools.partial(backend_.get_backend, args.backend),
+        idle_timeout=args.idle_timeout, window_tables=args.window_tables)
+    try:
+        daemon.listen()
+    except DaemonError as err:
+        daemon.close()
+        parser.exit(status=1, message="flitter-daemon: {0}\n".format(err))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
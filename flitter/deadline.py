@@ -0,0 +1,31 @@
+"""Time budgets for handling keypresses."""
+import time
+
+
+class Deadline(object):
+
+    """A time budget that starts running when it's created.
+
+    Code that talks to the X server checks the deadline before (and while)
+    waiting for replies, and gives up waiting once it has passed, treating
+    any replies it didn't get as unknown.
+
+    """
+
+    def __init__(self, milliseconds, clock=time.time):
+        self.milliseconds = milliseconds
+        self._clock = clock
+        self._start = clock()
+        self._end = self._start + milliseconds / 1000.0
+
+    def remaining(self):
+        """Return the number of seconds left, zero if the deadline's passed."""
+        return max(self._end - self._clock(), 0)
+
+    def expired(self):
+        """Return True if the deadline has passed."""
+        return self._clock() >= self._end
+
+    def elapsed_ms(self):
+        """Return the number of milliseconds since the deadline was created."""
+        return (self._clock() - self._start) * 1000.0
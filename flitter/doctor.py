@@ -0,0 +1,285 @@
+"""Finding out why flitter is slow on this machine: ``flitter --doctor``.
+
+Measures where the time of a flitter command goes, on the user's own X
+server, window manager and config file:
+
+* starting the Python interpreter and importing flitter.runraisenext,
+* one round trip to the X server,
+* fetching the properties of every window in _NET_CLIENT_LIST, and
+* loading the config file and matching every window against it,
+
+checks which of the EWMH hints that flitter uses the window manager
+supports, and recommends whichever of flitter's optional speed-ups (the
+daemon, its caches, batching, spec templates) would help.
+
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from flitter import backend as backend_
+from flitter import client
+from flitter import config
+from flitter import runraisenext
+from flitter import stats as stats_
+
+
+#: How many times to repeat each measurement, the best (startup) or median
+#: (round trips) is reported.
+REPEAT = 3
+
+#: A part of a command that takes longer than this many milliseconds is
+#: worth speeding up.
+SLOW_MS = 10.0
+
+#: The child process that startup is measured in prints how long its import
+#: of flitter.runraisenext took.
+_STARTUP_SCRIPT = (
+    "import time\n"
+    "start = time.time()\n"
+    "import flitter.runraisenext\n"
+    "print(time.time() - start)\n")
+
+
+def _measure_startup(python):
+    """Return the ms it takes to start python, and to import flitter.
+
+    Returns (None, None) if python couldn't be run.
+
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [package_dir] + [path for path in [env.get("PYTHONPATH")] if path])
+    best = None
+    for i in range(REPEAT):
+        start = time.time()
+        try:
+            output = subprocess.check_output([python, "-c", _STARTUP_SCRIPT],
+                                             env=env)
+        except (OSError, subprocess.CalledProcessError):
+            return None, None
+        total_ms = (time.time() - start) * 1000.0
+        import_ms = float(output.decode("utf-8").strip()) * 1000.0
+        if best is None or total_ms < sum(best):
+            best = (total_ms - import_ms, import_ms)
+    return best
+
+
+def measure(config_path, backend, backend_name="ewmh",
+            python=sys.executable):
+    """Measure the parts of a flitter command, return the measurements.
+
+    :param config_path: the config file to load and match windows against
+    :param backend: the connection to the display to measure
+    :type backend: backend.Backend
+    :param backend_name: the name of the backend
+    :param python: the Python interpreter to measure the startup of, or
+        None not to
+
+    :rtype: dict
+
+    """
+    report = {"backend": backend_name, "daemon": client.daemon_running()}
+    if python is None:
+        report["startup_ms"], report["import_ms"] = None, None
+    else:
+        report["startup_ms"], report["import_ms"] = _measure_startup(python)
+
+    # X, timed with the backend's own clock.
+    clock = backend.clock
+    round_trips = []
+    for i in range(REPEAT):
+        start = clock()
+        backend.active_window_id()
+        round_trips.append((clock() - start) * 1000.0)
+    report["round_trip_ms"] = stats_.percentile(round_trips, 50)
+
+    start = clock()
+    window_ids = backend.client_ids()
+    properties = backend.fetch_properties(window_ids)
+    windows = [backend.window_class(backend, window_id,
+                                    properties[window_id])
+               for window_id in window_ids]
+    report["fetch_ms"] = (clock() - start) * 1000.0
+    report["windows"] = len(windows)
+
+    report["supported"] = backend.supported_hints()
+
+    # The config, which is all CPU time.
+    start = time.time()
+    config_ = config.Config.load(config_path)
+    report["load_ms"] = (time.time() - start) * 1000.0
+    report["specs"] = len(config_.specs)
+    report["templates"] = len(config_.templates)
+    report["unindexed"] = len([spec for spec in config_.specs.values()
+                               if spec.index_key() is None])
+
+    start = time.time()
+    for window in windows:
+        config_.index.matching_names(window)
+        config_.ignore_index.any_match(window)
+    report["match_ms"] = (time.time() - start) * 1000.0
+    return report
+
+
+def missing_hints(report):
+    """Return the (hint, what it's for) pairs that the window manager lacks.
+
+    """
+    supported = set(report["supported"])
+    return [(hint, purpose) for hint, purpose in backend_.EWMH_HINTS
+            if hint not in supported]
+
+
+def recommendations(report):
+    """Return what would make flitter faster (or work better) for report.
+
+    :rtype: list of strings
+
+    """
+    recommended = []
+    startup_ms = (report["startup_ms"] or 0.0) + (report["import_ms"] or 0.0)
+    per_command_ms = (report["round_trip_ms"] + report["fetch_ms"] +
+                      report["load_ms"] + report["match_ms"])
+
+    if report["daemon"]:
+        recommended.append(
+            "flitter-daemon is running, so commands don't load the config "
+            "file or fetch the windows ({0:.1f} ms) themselves.".format(
+                per_command_ms))
+    elif per_command_ms > 1.0:
+        recommended.append(
+            "Run flitter-daemon when you log in. It keeps the config file "
+            "loaded and the windows cached (updating them from X events), "
+            "which would save about {0:.1f} ms per command.".format(
+                per_command_ms))
+
+    if report["unindexed"] and report["match_ms"] > SLOW_MS:
+        recommended.append(
+            "{0} of your window specs have no exact or prefix value, so "
+            "every window is matched against each of them. Giving them "
+            "{{\"exact\": ...}} or {{\"prefix\": ...}} values lets flitter's "
+            "index find them instead.".format(report["unindexed"]))
+    if report["load_ms"] > SLOW_MS and not report["templates"]:
+        recommended.append(
+            "Loading your {0} window specs takes {1:.1f} ms. If many of "
+            "them are alike, spec templates are only expanded when "
+            "they're used.".format(report["specs"], report["load_ms"]))
+
+    if startup_ms > SLOW_MS:
+        recommended.append(
+            "Starting Python and importing flitter takes {0:.1f} ms for every "
+            "flitter command, even with the daemon. Scripts that run many "
+            "commands should pipe them to `flitter --batch`, and programs "
+            "that only read which windows are open should read the daemon's "
+            "window table (flitter.window_table.read()).".format(startup_ms))
+
+    if not report["supported"]:
+        recommended.append(
+            "Your window manager doesn't list any EWMH hints in "
+            "_NET_SUPPORTED, flitter needs an EWMH-compliant window manager.")
+    else:
+        for hint, purpose in missing_hints(report):
+            recommended.append(
+                "Your window manager doesn't support {0}, which flitter needs "
+                "for {1}.".format(hint, purpose))
+    return recommended
+
+
+def _ms(value):
+    if value is None:
+        return "       ?"
+    return "{0:6.1f} ms".format(value)
+
+
+def _per_window(total_ms, windows):
+    if not windows:
+        return ""
+    return "  ({0:.3f} ms per window)".format(total_ms / windows)
+
+
+def format_report(report):
+    """Return the report, with recommendations, as text for the user."""
+    windows = report["windows"]
+    rows = [
+        ("Starting Python", report["startup_ms"], ""),
+        ("Importing flitter.runraisenext", report["import_ms"], ""),
+        ("X server round trip", report["round_trip_ms"], ""),
+        ("Fetching {0} windows".format(windows), report["fetch_ms"],
+         _per_window(report["fetch_ms"], windows)),
+        ("Loading the config file", report["load_ms"],
+         "  ({0} specs, {1} templates)".format(report["specs"],
+                                               report["templates"])),
+        ("Matching {0} windows".format(windows), report["match_ms"],
+         _per_window(report["match_ms"], windows)),
+    ]
+    lines = ["Where a flitter command's time goes:"]
+    lines.extend("  {0:<32} {1}{2}".format(label, _ms(value), note)
+                 for label, value, note in rows)
+    lines.extend([
+        "",
+        "EWMH hints: the window manager supports {0} of the {1} that flitter "
+        "uses.".format(len(backend_.EWMH_HINTS) - len(missing_hints(report)),
+                       len(backend_.EWMH_HINTS)),
+        "",
+    ])
+    recommended = recommendations(report)
+    if recommended:
+        lines.append("Recommendations:")
+        lines.extend("- {0}".format(recommendation)
+                     for recommendation in recommended)
+    else:
+        lines.append("Nothing to recommend, flitter is as fast as it gets "
+                     "here.")
+    return "\n".join(lines)
+
+
+def run(args, output, display=None, make_backend=None, python=sys.executable):
+    """Measure flitter on the given display and write the report to output.
+
+    :param args: the command-line arguments that were given with --doctor
+    :type args: list of strings
+    :param output: where to write the report to
+    :type output: file-like object
+    :param display: the display to measure (optional, default: $DISPLAY)
+    :param make_backend: the function to call to connect to the display
+        (optional, default: connect with the backend given by --backend or
+        the config file)
+    :type make_backend: callable taking one argument: the display name
+    :param python: the interpreter to measure the startup of (optional)
+
+    :returns: the value for main() to return
+
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-f", "--file", default="~/.flitter.json")
+    parser.add_argument("--backend", choices=backend_.X_BACKENDS)
+    known_args = parser.parse_known_args(args)[0]
+    try:
+        config_path = runraisenext._config_file_path(known_args)
+    except runraisenext.ConfigFileError as err:
+        return str(err)
+    try:
+        backend_name = (known_args.backend or
+                        config.Config.load(config_path).backend or "ewmh")
+    except ValueError as err:
+        return str(err)
+    display = display or os.environ.get("DISPLAY")
+
+    try:
+        if make_backend is not None:
+            backend = make_backend(display)
+        else:
+            backend = backend_.get_backend(backend_name, display)
+    except backend_.BackendError as err:
+        return str(err)
+    try:
+        report = measure(config_path, backend, backend_name, python)
+    finally:
+        backend.close()
+    output.write(format_report(report) + "\n")
+    return None
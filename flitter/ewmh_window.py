@@ -1,91 +1,223 @@
+"""The ewmh (python-xlib) backend."""
+import logging
+import select
+
 import ewmh
+from Xlib import X
+from Xlib import Xatom
+from Xlib import display as xdisplay
+from Xlib import error
+from Xlib.protocol import request
 
+from flitter import backend
 
-EWMH = ewmh.EWMH()
-
-
-class Window(object):
-
-    def __init__(self, ewmh_window):
-        try:
-            self.desktop = EWMH.getWmDesktop(ewmh_window)
-        except TypeError:
-            # getWmDesktop() raises TypeError for some windows.
-            # This appears to be a bug in the ewmh Python lib.
-            self.desktop = None
-        self.window_id = ewmh_window.id
-        self.pid = EWMH.getWmPid(ewmh_window)
-        self.wm_class = '.'.join(ewmh_window.get_wm_class())
-        self.machine = ewmh_window.get_wm_client_machine()
-        self.title = EWMH.getWmName(ewmh_window)
-
-        for attr in ('wm_class', 'machine', 'title'):
-            # Annoyingly getWmName() seems to alway return unicode strings
-            # _unless_ the window name contains non-ASCII characters then it
-            # returns a byte string (which will cause our code, which expects
-            # to be working with unicode strings, to crash later on).
-            value = getattr(self, attr)
-            if hasattr(value, 'decode'):
-                setattr(self, attr, value.decode())
-
-    def __eq__(self, other):
-        if not hasattr(other, "window_id"):
-            return False
-        return self.window_id == other.window_id
-
-    def __str__(self):
-        return '{window_id} {wm_class} {title}'.format(
-                window_id=self.window_id, wm_class=self.wm_class,
-                title=self.title)
-
-    def focus(self):
-        """Focus (activate) this window."""
-        EWMH.setActiveWindow(self.ewmh_window)
-        EWMH.display.flush()
-
-    @property
-    def ewmh_window(self):
-        """Return the underlying ewmh.Window object for this window."""
-        # Because we don't save the actual ewmh.Window object against self we
-        # have to find it again here.
-        for ewmh_window in EWMH.getClientList():
-            if ewmh_window.id == self.window_id:
-                return ewmh_window
-        assert False, "Tried to focus a window that doesn't exist (anymore)"
-
-    @property
-    def minimized(self):
-        return 323 in EWMH.getWmState(self.ewmh_window)
-
-    @staticmethod
-    def window(window_id):
-        """Return a Window object for the open window with the given window_id.
-
-        Returns None if there's no open window with the given window_id
-        (maybe the window has been closed).
+log = logging.getLogger(__name__)
 
-        """
-        for w in Window.windows():
-            if w.window_id == window_id:
-                return w
-
-    @staticmethod
-    def windows():
-        """Return a list of Window objects for all currently open windows."""
-        windows_ = []
-        for ewmh_window in EWMH.getClientList():
-            windows_.append(Window(ewmh_window))
-        return windows_
-
-    @staticmethod
-    def focused_window():
-        """Return the currently focused window."""
-        active_window = EWMH.getActiveWindow()
-        if active_window is None:
+
+def _decode(prop):
+    """Return the decoded value of the given GetProperty reply."""
+    if prop.format != 8:
+        return prop.value
+    if prop.property_type == Xatom.STRING:
+        return prop.value.decode('ISO-8859-1')
+    return prop.value.decode('UTF-8', 'replace')
+
+
+class EWMHBackend(backend.Backend):
+
+    """A backend that talks to X through the ewmh and python-xlib libraries."""
+
+    def __init__(self, display=None):
+        super(EWMHBackend, self).__init__(display)
+        self.display = xdisplay.Display(display)
+        self.ewmh = ewmh.EWMH(self.display)
+        self._atom_names = {}
+
+    def _xwindow(self, window_id):
+        return self.display.create_resource_object('window', window_id)
+
+    def atom(self, name):
+        return self.display.get_atom(name)
+
+    def _atom_name(self, atom):
+        name = self._atom_names.get(atom)
+        if name is None:
+            name = self._atom_names[atom] = self.display.get_atom_name(atom)
+        return name
+
+    def _root_property(self, name, deadline=None):
+        root_id = self.ewmh.root.id
+        return self.fetch_properties([root_id], [name],
+                                     deadline=deadline)[root_id].get(name)
+
+    def client_ids(self):
+        return [w.id for w in self.ewmh.getClientList()]
+
+    def active_window_id(self, deadline=None):
+        value = self._root_property('_NET_ACTIVE_WINDOW', deadline)
+        if not value or not value[0]:
             return None
-        else:
-            return Window(active_window)
+        return value[0]
+
+    def current_desktop(self, deadline=None):
+        value = self._root_property('_NET_CURRENT_DESKTOP', deadline)
+        if value:
+            return value[0]
+        return None
+
+    def supported_hints(self):
+        prop = self.ewmh.root.get_full_property(self.atom('_NET_SUPPORTED'),
+                                                Xatom.ATOM)
+        if prop is None:
+            return []
+        return [self._atom_name(atom) for atom in prop.value]
 
+    def _wait_for_reply(self, req, deadline):
+        """Wait for the reply to the given deferred request.
 
-def current_desktop():
-    return EWMH.getCurrentDesktop()
+        Returns False if the deadline passes first, True otherwise.
+
+        """
+        if deadline is None:
+            req.reply()
+            return True
+        protocol_display = self.display.display
+        # python-xlib has no timeouts of its own, so read from the connection
+        # ourselves, but only when select() says there's something to read.
+        while req._data is None and req._error is None:
+            readable, _, _ = select.select([protocol_display.socket], [], [],
+                                           deadline.remaining())
+            if not readable:
+                return False
+            protocol_display.send_recv_lock.acquire()
+            protocol_display.send_and_recv(recv=True)
+        if req._error is not None:
+            req.reply()
+        return True
+
+    def _get_property(self, window_id, atom, length=backend.PROPERTY_LENGTH):
+        """Send a GetProperty request without waiting for its reply."""
+        return request.GetProperty(
+            display=self.display.display, defer=True, delete=False,
+            window=window_id, property=atom, type=X.AnyPropertyType,
+            long_offset=0, long_length=length)
+
+    def fetch_properties(self, window_ids, names=backend.WINDOW_PROPERTIES,
+                         deadline=None):
+        """Fetch the given properties of all of the given windows.
+
+        The requests for all the properties of all the windows are sent to the
+        X server at once, and then the replies are read, rather than waiting
+        for each reply before sending the next request. This makes fetching
+        the properties of all open windows cost one round trip instead of one
+        per property per window.
+
+        See Backend.fetch_properties().
+
+        """
+        atoms = [(name, self.atom(name)) for name in names]
+        requests = []
+        for window_id in window_ids:
+            for name, atom in atoms:
+                requests.append((window_id, name, atom,
+                                 self._get_property(window_id, atom)))
+        self.display.flush()
+
+        properties = dict((window_id, {}) for window_id in window_ids)
+        timed_out = []
+        for window_id, name, atom, req in requests:
+            if timed_out or (deadline is not None and deadline.expired()):
+                timed_out.append((window_id, name))
+                continue
+            try:
+                if not self._wait_for_reply(req, deadline):
+                    timed_out.append((window_id, name))
+                    continue
+            except error.XError:
+                # For example BadWindow, if the window was closed after we got
+                # the client list.
+                continue
+            if not req.property_type:
+                # The window doesn't have this property.
+                continue
+            if req.bytes_after:
+                # Ask again for all of it, now that its length is known.
+                req = self._get_property(
+                    window_id, atom,
+                    backend.PROPERTY_LENGTH + (req.bytes_after + 3) // 4)
+                self.display.flush()
+                try:
+                    if not self._wait_for_reply(req, deadline):
+                        timed_out.append((window_id, name))
+                        continue
+                except error.XError:
+                    continue
+            prop = req
+            prop.format, prop.value = req.value
+            properties[window_id][name] = _decode(prop)
+
+        if timed_out:
+            backend.log_missed_deadline(log, timed_out, deadline)
+
+        return properties
+
+    def send(self, action, window):
+        xwindow = self._xwindow(window.window_id)
+        if action == "raise":
+            self.ewmh.setActiveWindow(xwindow)
+        elif action == "raise-as-pager":
+            self.ewmh._setProperty(
+                '_NET_ACTIVE_WINDOW',
+                [backend.SOURCE_PAGER, X.CurrentTime, 0], xwindow)
+        elif action == "minimize":
+            # Clients can't add _NET_WM_STATE_HIDDEN themselves (it's managed
+            # by the window manager) so send the ICCCM WM_CHANGE_STATE message
+            # instead, which EWMH window managers also honour.
+            self.ewmh._setProperty('WM_CHANGE_STATE', [backend.ICONIC_STATE],
+                                   xwindow)
+        elif action == "close":
+            self.ewmh.setCloseWindow(xwindow)
+        elif action == "move-to-current-desktop":
+            self.ewmh.setWmDesktop(xwindow, self.current_desktop())
+        else:
+            raise ValueError("Unknown window action: {0}".format(action))
+
+    def flush(self):
+        self.display.flush()
+
+    def subscribe(self, window_ids=()):
+        self.ewmh.root.change_attributes(event_mask=X.PropertyChangeMask)
+        for window_id in window_ids:
+            self._xwindow(window_id).change_attributes(
+                event_mask=X.PropertyChangeMask)
+        self.display.flush()
+
+    def fileno(self):
+        return self.display.fileno()
+
+    def events(self):
+        events = []
+        while self.display.pending_events():
+            event = self.display.next_event()
+            if event.type != X.PropertyNotify:
+                continue
+            name = self._atom_name(event.atom)
+            if event.window.id != self.ewmh.root.id:
+                events.append(backend.Event(
+                    "property", event.window.id, name))
+            elif name == '_NET_ACTIVE_WINDOW':
+                events.append(backend.Event("active", None, name))
+            elif name == '_NET_CLIENT_LIST':
+                events.append(backend.Event("clients", None, name))
+        return events
+
+    def wait(self, deadline):
+        if not self.display.pending_events():
+            select.select([self.display], [], [], deadline.remaining())
+
+    def close(self):
+        self.display.close()
+
+
+#: The backend class, for backend.get_backend().
+Backend = EWMHBackend
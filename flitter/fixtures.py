@@ -0,0 +1,40 @@
+"""Test fixtures shared by flitter's test modules."""
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    """A test case that gets a new temporary directory for each test.
+
+    The directory is ``self.directory`` and it's $HOME during the test too,
+    so that nothing is read from or written to the real home directory.
+    Subclasses that override setUp() or tearDown() must call the superclass's
+    method.
+
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self._environ = {}
+        self.set_environ("HOME", self.directory)
+
+    def tearDown(self):
+        for name, value in self._environ.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+        shutil.rmtree(self.directory)
+
+    def set_environ(self, name, value):
+        """Set an environment variable until the end of the test.
+
+        Its old value is restored in tearDown(), or it's unset again if it
+        wasn't set before the test.
+
+        """
+        self._environ.setdefault(name, os.environ.get(name))
+        os.environ[name] = value
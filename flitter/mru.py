@@ -0,0 +1,166 @@
+"""An append-only journal of a display's most-recently-used windows.
+
+flitter-daemon keeps each display's most-recently-used list in a journal
+instead of rewriting the whole list (like runraisenext's pickle file) every
+time a window is focused. The journal is a sequence of fixed-size records::
+
+    timestamp (little-endian double), window ID (little-endian uint64)
+
+each one meaning that the window was moved to the front of the list at that
+time. Focusing a window appends one record. Replaying the records in order
+gives the list back, so the order survives the daemon restarting.
+
+Records for windows that have since been refocused or closed are dead weight,
+so once there are enough of them the journal is compacted: rewritten with one
+record per open window, to a new file that's renamed over the old one.
+
+"""
+import os
+import struct
+import time
+
+
+_RECORD = struct.Struct('<dQ')
+
+#: Compact the journal once it has more than this many records...
+MIN_COMPACT_RECORDS = 256
+
+#: ...and more than this many records per window in the list.
+COMPACT_FACTOR = 4
+
+
+def journal_path(display=None):
+    """Return the path to the given display's most-recently-used journal.
+
+    :param display: the name of the display, e.g. ":1" (optional, default:
+        $DISPLAY)
+
+    """
+    if display is None:
+        display = os.environ.get("DISPLAY")
+    if not display:
+        return os.path.abspath(os.path.expanduser("~/.flitter.mru"))
+    return os.path.abspath(os.path.expanduser(
+        "~/.flitter-{0}.mru".format(display.replace("/", "_"))))
+
+
+def _replay(path):
+    """Return the window IDs in the journal at path, most recent first.
+
+    Also returns the number of whole records in the file. A partly written
+    record at the end (from a crash in the middle of an append) is ignored.
+
+    """
+    try:
+        with open(path, 'rb') as file_:
+            data = file_.read()
+    except (IOError, OSError):
+        return [], 0
+    count = len(data) // _RECORD.size
+    window_ids = []
+    seen = set()
+    for i in range(count - 1, -1, -1):
+        window_id = _RECORD.unpack_from(data, i * _RECORD.size)[1]
+        if window_id not in seen:
+            seen.add(window_id)
+            window_ids.append(window_id)
+    return window_ids, count
+
+
+class Journal(object):
+
+    """One display's most-recently-used list, backed by a journal file."""
+
+    def __init__(self, path, clock=time.time):
+        """Open the journal at path, replaying it if it exists.
+
+        :param clock: the function to get the records' timestamps from
+
+        """
+        self.path = path
+        self.clock = clock
+        self._window_ids, self.records = _replay(path)
+        self._file = open(path, 'ab')
+        if self._file.tell() != self.records * _RECORD.size:
+            # Drop the partly written record, or the next one will be
+            # misaligned.
+            self._file.truncate(self.records * _RECORD.size)
+            self._file.seek(0, os.SEEK_END)
+
+    def window_ids(self):
+        """Return the IDs of the windows in the list, most recent first."""
+        return list(self._window_ids)
+
+    def sorted(self, windows):
+        """Return the given open windows in most-recently-used order.
+
+        This is the same reconciliation as
+        runraisenext.sorted_most_recently_used(): windows that aren't in the
+        list (opened since it was last updated) go first, and windows that
+        are in the list but not open are left out. They're dropped from the
+        list too, but their records stay in the journal until it's
+        compacted.
+
+        :param windows: all of the display's open windows
+
+        """
+        windows_by_id = {}
+        for window in windows:
+            windows_by_id.setdefault(window.window_id, window)
+        self._window_ids = [window_id for window_id in self._window_ids
+                            if window_id in windows_by_id]
+        listed = [windows_by_id[window_id] for window_id in self._window_ids]
+        listed_ids = set(self._window_ids)
+        return [window for window in windows
+                if window.window_id not in listed_ids] + listed
+
+    def move_to_front(self, window_ids):
+        """Move the given windows to the front of the list, in the given order.
+
+        Appends one record per window to the journal.
+
+        """
+        now = self.clock()
+        moved = set(window_ids)
+        self._window_ids = list(window_ids) + [
+            window_id for window_id in self._window_ids
+            if window_id not in moved]
+        self._file.write(b''.join(_RECORD.pack(now, window_id)
+                                  for window_id in reversed(window_ids)))
+        self._file.flush()
+        self.records += len(window_ids)
+
+    def needs_compaction(self):
+        """Return True if the journal has grown enough to be compacted."""
+        return self.records > max(MIN_COMPACT_RECORDS,
+                                  COMPACT_FACTOR * len(self._window_ids))
+
+    def compact(self, open_window_ids=None):
+        """Rewrite the journal with one record per window in the list.
+
+        :param open_window_ids: the IDs of the display's open windows, if
+            given then any other windows are dropped from the list
+
+        """
+        window_ids = self._window_ids
+        if open_window_ids is not None:
+            open_ = set(open_window_ids)
+            window_ids = [window_id for window_id in window_ids
+                          if window_id in open_]
+        self.reset(window_ids)
+
+    def reset(self, window_ids):
+        """Replace the list with the given window IDs, most recent first."""
+        now = self.clock()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file_:
+            file_.write(b''.join(_RECORD.pack(now, window_id)
+                                 for window_id in reversed(window_ids)))
+        os.rename(temp_path, self.path)
+        self._file.close()
+        self._file = open(self.path, 'ab')
+        self._window_ids = list(window_ids)
+        self.records = len(window_ids)
+
+    def close(self):
+        self._file.close()
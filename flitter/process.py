@@ -0,0 +1,197 @@
+"""Looking up the processes that windows belong to, through /proc.
+
+Windows' ``exe``, ``cmdline``, ``child_cmdline`` and ``cwd`` attributes (which
+window specs can match, like any other attribute) come from here. They're
+looked up from the window's _NET_WM_PID, so they're only known for windows of
+processes running on this machine, and only on systems with a Linux-style
+/proc.
+
+A process's executable and command line only change when it execs a new
+program, so they're read once and cached. The cache is keyed by pid and
+checked against the process's start time and name (which exec changes), so
+neither a pid that's reused by a new process nor a process that has forked
+and then exec'd is mistaken for what it was before, and entries for
+processes that have exited are dropped.
+
+"""
+import collections
+import os
+import socket
+
+
+#: Prune exited processes from the cache when it grows past this many.
+MAX_ENTRIES = 1024
+
+#: What's cached about a process.
+ProcessInfo = collections.namedtuple('ProcessInfo',
+                                     'pid ppid start_time name exe cmdline')
+
+
+def _read(path):
+    with open(path, 'rb') as file_:
+        return file_.read()
+
+
+def _stat(pid):
+    """Return the given process's (ppid, start time, name).
+
+    Returns None if the process has exited.
+
+    """
+    try:
+        stat = _read('/proc/{0}/stat'.format(pid)).decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return None
+    # The name (in brackets) can contain spaces, so the other fields are
+    # counted from after it: state, ppid, ... start time is field 22.
+    try:
+        name = stat[stat.index('(') + 1:stat.rindex(')')]
+        fields = stat[stat.rindex(')') + 2:].split()
+        return int(fields[1]), int(fields[19]), name
+    except (ValueError, IndexError):
+        return None
+
+
+def _readlink(path):
+    try:
+        return os.readlink(path)
+    except (IOError, OSError):
+        # The process has exited, or belongs to another user.
+        return None
+
+
+def _cmdline(pid):
+    try:
+        data = _read('/proc/{0}/cmdline'.format(pid))
+    except (IOError, OSError):
+        return None
+    return ' '.join(arg.decode('utf-8', 'replace')
+                    for arg in data.split(b'\0') if arg)
+
+
+class ProcessCache(object):
+
+    """A cache of ProcessInfo, keyed by pid, checked by start time and name."""
+
+    def __init__(self):
+        self._processes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._processes)
+
+    def lookup(self, pid):
+        """Return the ProcessInfo of the given process, or None if it's gone.
+
+        """
+        stat = _stat(pid)
+        if stat is None:
+            self._processes.pop(pid, None)
+            return None
+        ppid, start_time, name = stat
+        info = self._processes.get(pid)
+        if info is not None and (info.start_time, info.name) == (start_time,
+                                                                  name):
+            self.hits += 1
+            return info
+        self.misses += 1
+        info = ProcessInfo(pid, ppid, start_time, name,
+                           _readlink('/proc/{0}/exe'.format(pid)),
+                           _cmdline(pid))
+        if not info.cmdline:
+            # A zombie, or a process in the middle of exec'ing: don't cache
+            # it.
+            self._processes.pop(pid, None)
+            return info
+        if len(self._processes) >= MAX_ENTRIES:
+            self.prune()
+        self._processes[pid] = info
+        return info
+
+    def prune(self):
+        """Forget about processes that have exited."""
+        for pid, info in list(self._processes.items()):
+            stat = _stat(pid)
+            if stat is None or stat[1:] != (info.start_time, info.name):
+                del self._processes[pid]
+
+    def children(self, pid):
+        """Return the pids of the given process's children."""
+        children = []
+        try:
+            tids = os.listdir('/proc/{0}/task'.format(pid))
+        except (IOError, OSError):
+            return children
+        for tid in tids:
+            try:
+                data = _read('/proc/{0}/task/{1}/children'.format(pid, tid))
+            except (IOError, OSError):
+                # Kernels without CONFIG_PROC_CHILDREN.
+                return self._children_by_scanning(pid)
+            children.extend(int(child) for child in data.split())
+        return children
+
+    def _children_by_scanning(self, pid):
+        children = []
+        for name in os.listdir('/proc'):
+            if name.isdigit():
+                stat = _stat(int(name))
+                if stat is not None and stat[0] == pid:
+                    children.append(int(name))
+        return children
+
+    def foreground(self, pid):
+        """Return the ProcessInfo of the given process's newest descendant.
+
+        For a terminal that's the command that's running in it (or the shell,
+        if nothing is). Returns None if the process has no children.
+
+        """
+        newest = None
+        pids = self.children(pid)
+        seen = set()
+        while pids:
+            child = pids.pop()
+            if child in seen:
+                continue
+            seen.add(child)
+            info = self.lookup(child)
+            if info is None:
+                continue
+            if newest is None or info.start_time > newest.start_time:
+                newest = info
+            pids.extend(self.children(child))
+        return newest
+
+    def is_descendant(self, pid, ancestor):
+        """Return True if process pid is ancestor or one of its descendants.
+
+        """
+        seen = set()
+        while pid and pid not in seen:
+            if pid == ancestor:
+                return True
+            seen.add(pid)
+            info = self.lookup(pid)
+            pid = info.ppid if info is not None else None
+        return False
+
+
+#: The process cache that Window objects use.
+CACHE = ProcessCache()
+
+_hostname = []
+
+
+def is_local(machine):
+    """Return True if the given WM_CLIENT_MACHINE is this machine.
+
+    Windows that don't say what machine they're from are assumed to be local.
+
+    """
+    if not machine:
+        return True
+    if not _hostname:
+        _hostname.append(socket.gethostname())
+    return machine == _hostname[0]
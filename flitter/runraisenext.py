@@ -2,13 +2,30 @@
 """A script for launching apps and switching windows."""
 import sys
 import argparse
+import collections
 import subprocess
-import json
+import logging
 import os
 import pickle
-import re
+import time
 
-from flitter import ewmh_window
+from flitter import backend as backend_
+from flitter import client
+from flitter import config
+from flitter import deadline as deadline_
+from flitter import stats as stats_
+from flitter import window_index
+from flitter import window_table
+
+
+log = logging.getLogger(__name__)
+
+#: The parsed command-line arguments, see parse_command_line_arguments().
+Arguments = collections.namedtuple('Arguments', [
+    'window_spec', 'all_window_specs', 'ignore', 'others', 'current_desktop',
+    'ignore_minimized', 'print_matching', 'bulk', 'nth', 'find', 'group',
+    'deadline_ms', 'confirm_focus', 'stats', 'backend_name',
+    'ignore_skip_taskbar', 'urgent_first'])
 
 
 def run(command):
@@ -16,6 +33,27 @@ def run(command):
     subprocess.call(command, shell=True)
 
 
+def start(command):
+    """Start the given shell command as a subprocess, without waiting for it.
+
+    """
+    return subprocess.Popen(command, shell=True)
+
+
+def _deadline_missed(deadline):
+    """Return True, and log it, if the given deadline has passed.
+
+    Windows' attributes that arrive after the deadline are given up on, so
+    the app may be running after all: don't risk launching a second copy.
+
+    """
+    if deadline is None or not deadline.expired():
+        return False
+    log.warning("Not launching anything because the %d ms deadline was "
+                "missed", deadline.milliseconds)
+    return True
+
+
 def run_window_spec_command(window_spec, run_function):
     """Run the command from the given window spec, if it has one.
 
@@ -31,43 +69,38 @@ def run_window_spec_command(window_spec, run_function):
         run_function(command)
 
 
-def focus_window(window):
+def focus_window(window, confirm_timeout_ms=None, statistics=None):
     """Focus the given window.
 
     :param window: the window to focus
-    :type window: wmctrl.Window
-
-    """
-    window.focus()
-
+    :type window: backend.Window
 
-def get_all_window_specs_from_file(file_):
-    """Return a list of all the window specs from the given config file."""
-    specs = json.loads(
-        open(os.path.abspath(os.path.expanduser(file_)), 'r').read())["specs"]
-    lowercased_specs = {}
-    for key in specs:
-        assert key.lower() not in lowercased_specs
-        lowercased_specs[key.lower()] = specs[key]
-    return lowercased_specs
+    :param confirm_timeout_ms: if given, wait for up to this many milliseconds
+        for the window manager to confirm that it has activated the window
+        (optional)
+    :type confirm_timeout_ms: int
 
+    :param statistics: the statistics to record how long the window manager
+        took to confirm in, as the "confirm-focus" command (optional, default:
+        record it in the statistics file)
+    :type statistics: stats.Stats
 
-def get_window_spec_from_file(alias, file_):
-    """Get the requested window spec from the config file.
-
-    :rtype: dictionary
+    :returns: False if the window manager didn't confirm that it activated the
+        window, True otherwise
+    :rtype: bool
 
     """
-    specs = get_all_window_specs_from_file(file_)
-    spec = specs[alias.lower()]
-    return spec
-
-
-def get_ignore_from_file(file_):
-    """Return the list of window specs to ignore from the given config file."""
-    return json.loads(
-        open(os.path.abspath(os.path.expanduser(file_)), 'r').read())[
-            "ignore"]
+    latency = window.focus(confirm_timeout_ms=confirm_timeout_ms)
+    if confirm_timeout_ms is None:
+        return True
+    if latency is None:
+        log.warning("The window manager didn't activate window %s within "
+                    "%d ms", window, confirm_timeout_ms)
+        return False
+    log.info("The window manager activated window %s in %.1f ms", window,
+             latency)
+    _record_latency("confirm-focus", latency, statistics=statistics)
+    return True
 
 
 def _load(path):
@@ -92,46 +125,73 @@ def _dump(obj, path):
         pickle.dump(obj, file_)
 
 
-def pickle_path():
-    """Return the path to the file we use to track windows in mru order."""
-    return os.path.abspath(os.path.expanduser("~/.flitter.pickle"))
+def pickle_path(display=None):
+    """Return the path to the file we use to track windows in mru order.
+
+    Each X display has its own file, so that flitters running on different
+    displays don't overwrite each other's lists.
 
+    :param display: the name of the display, e.g. ":1" (optional, default:
+        $DISPLAY)
 
-def sorted_most_recently_used(current_window_list):
+    """
+    if display is None:
+        display = os.environ.get("DISPLAY")
+    if not display:
+        return os.path.abspath(os.path.expanduser("~/.flitter.pickle"))
+    return os.path.abspath(os.path.expanduser(
+        "~/.flitter-{0}.pickle".format(display.replace("/", "_"))))
+
+
+def sorted_most_recently_used(current_window_list, display=None, mru=None):
     """Return the given list of open windows in most-recently-used order.
 
     :param current_window_list: the list of currently open windows,
         in any order
     :type current_window_list: list of Window objects
 
+    :param display: the name of the display the windows are on (optional,
+        default: $DISPLAY)
+
+    :param mru: the display's most-recently-used journal, to use instead of
+        the pickled list (optional)
+    :type mru: mru.Journal
+
     :returns: the given list of currently opened windows, sorted into
         most-recently-used-first order
     :rtype: list of Window objects
 
     """
+    if mru is not None:
+        return mru.sorted(current_window_list)
     try:
-        pickled_window_ids = _load(pickle_path())
+        pickled_window_ids = _load(pickle_path(display))
     except (IOError, EOFError):
         pickled_window_ids = []
 
-    pickled_window_list = [ewmh_window.Window.window(window_id)
-                           for window_id in pickled_window_ids]
+    # Look the pickled window IDs up in the list of windows we already have,
+    # rather than asking the window manager about each one again.
+    windows_by_id = {}
+    for window in current_window_list:
+        windows_by_id.setdefault(window.window_id, window)
 
     # Remove windows that have been closed since the last time we ran.
-    pickled_window_list = [w for w in pickled_window_list if w is not None]
+    pickled_window_list = [windows_by_id[window_id]
+                           for window_id in pickled_window_ids
+                           if window_id in windows_by_id]
+    pickled_ids = set(w.window_id for w in pickled_window_list)
 
     # Add windows that have been opened since the last time we ran to the front
     # of the list.
-    new_windows = []
-    for window in current_window_list:
-        if window not in pickled_window_list:
-            new_windows.append(window)
+    new_windows = [w for w in current_window_list
+                   if w.window_id not in pickled_ids]
     pickled_window_list = new_windows + pickled_window_list
 
     return pickled_window_list
 
 
-def update_pickled_window_list(open_windows, newly_focused_window):
+def update_pickled_window_list(open_windows, newly_focused_window,
+                               skipped_windows=(), display=None, mru=None):
     """Move the newly focused window to the top of the cached list of windows.
 
     We keep a cached list of windows in most-recently-used order so that
@@ -141,14 +201,28 @@ def update_pickled_window_list(open_windows, newly_focused_window):
     Each time after focusing a window we call this function to update the
     cached list on disk for the next time we run.
 
+    If the window was jumped to directly (with --nth or --last) then the
+    windows that were skipped over on the way should be given as
+    skipped_windows, most recently used first. They're moved up the list to
+    just behind the newly focused window, in the same order they'd have ended
+    up in if the user had cycled through them one at a time.
+
+    If the display's most-recently-used journal is given then the move is
+    appended to it, instead of the whole list being pickled again.
+
     """
     assert newly_focused_window in open_windows
-    open_windows.remove(newly_focused_window)
+    moved_windows = [newly_focused_window] + list(reversed(skipped_windows))
+    for window in moved_windows:
+        open_windows.remove(window)
     assert newly_focused_window not in open_windows, (
         "There shouldn't be more than one instance of the same window in "
         "the list of open windows")
-    open_windows.insert(0, newly_focused_window)
-    _dump([w.window_id for w in open_windows], pickle_path())
+    open_windows[0:0] = moved_windows
+    if mru is not None:
+        mru.move_to_front([w.window_id for w in moved_windows])
+        return
+    _dump([w.window_id for w in open_windows], pickle_path(display))
 
 
 def matches(window, window_spec):
@@ -169,6 +243,12 @@ def matches(window, window_spec):
     A window object matches a spec if it has an attribute matching each of
     the items in the spec.
 
+    Specs can also match the window's process (looked up through /proc from
+    its pid): 'exe' (the path to its executable), 'cmdline' (its command
+    line), 'child_cmdline' (the command line of its newest descendant, for
+    a terminal window that's the command running in it) and 'cwd' (the
+    current directory of its newest descendant). See process.py.
+
     A spec doesn't have to contain all of the attributes. For example
     {'wm_class': '.Firefox'} will match all windows with a wm_class
     attribute matching ".Firefox".
@@ -178,21 +258,42 @@ def matches(window, window_spec):
     "Navigator.Firefox".
 
     Window specs can also contain a "command" key (the command to be run to
-    launch the app if it doesn't have any open windows) - this key will be
-    ignored and the window will match the spec as long as all the other keys
-    match.
+    launch the app if it doesn't have any open windows) and a "prelaunch"
+    key - these keys will be ignored and the window will match the spec as
+    long as all the other keys match.
+
+    Values can also be given as one-item dicts that say how to match them
+    instead of as regexes, for example {'wm_class': {'exact': 'skype.Skype'}}.
+    See config.MATCH_KINDS.
+
+    Compiled config.WindowSpec objects are matched using their precompiled
+    matchers.
+
+    Window attributes that are unknown (None), for example because they
+    couldn't be fetched before the deadline, are matched as empty strings,
+    and numbers as their decimal strings. See config.window_attribute().
 
     """
+    if isinstance(window_spec, config.WindowSpec):
+        return window_spec.matches(window)
     for key in window_spec.keys():
-        if key == 'command':
+        if key in config.NON_MATCHING_KEYS:
             continue
-        if not re.match(window_spec[key], getattr(window, key, '')):
+        if not config.compile_value(window_spec[key])(
+                config.window_attribute(window, key)):
             return False
     return True
 
 
 def matches_any(window, specs):
-    """Return True if the given window matches any of the given specs."""
+    """Return True if the given window matches any of the given specs.
+
+    If specs is a config.SpecIndex then only the specs that the index finds
+    for the window are tested.
+
+    """
+    if isinstance(specs, config.SpecIndex):
+        return specs.any_match(window)
     for spec in specs:
         if matches(window, spec):
             return True
@@ -235,7 +336,11 @@ def _get_other_windows(windows, specs):
 def runraisenext(window_spec, run_function, open_windows, focused_window,
                  focus_window_function, others=False, window_specs=None,
                  ignore=None, current_desktop=False, ignore_minimized=False,
-                 return_matching=False):
+                 return_matching=False, bulk=None, perform_function=None,
+                 nth=None, find=None, deadline=None, backend=None,
+                 normal_only=False, ignore_skip_taskbar=False,
+                 urgent_first=False, standby=None, mru=None,
+                 search_index=None):
     """Either run the app, raise the app, or go to the app's next window.
 
     Depending on whether the app has any windows open and whether the app is
@@ -254,7 +359,8 @@ def runraisenext(window_spec, run_function, open_windows, focused_window,
         Window objects from open_windows
     :type focused_window: Window
 
-    :param focus_window_function: the function to call to focus a window
+    :param focus_window_function: the function to call to focus a window, it
+        can return False to say that the window didn't get focused
     :type focus_window_function: callable taking one argument: a Window object
         representing the window to be focused
 
@@ -285,32 +391,107 @@ def runraisenext(window_spec, run_function, open_windows, focused_window,
         raise anything (optional, default: False)
     :type return_matching: bool
 
+    :param bulk: Act on many windows at once instead of focusing one window:
+        ``"raise-all"`` raises all the matching windows (most recently used
+        last, so that it ends up focused), ``"minimize-others"`` minimizes all
+        the windows that don't match and ``"close-all"`` closes all the
+        matching windows (optional, default: None)
+    :type bulk: string
+
+    :param perform_function: the function to call to perform bulk window
+        actions, only needed if ``bulk`` is given
+    :type perform_function: callable taking one argument: a list of
+        (action name, Window) tuples, see backend.Backend.perform()
+
+    :param nth: Jump straight to the nth matching window in most-recently-used
+        order, instead of to the next one. 1 is the most recently used window
+        and -1 is the least recently used one. Numbers past the end of the
+        list mean the least recently used window (optional, default: None)
+    :type nth: int
+
+    :param find: Search for windows whose titles or WM_CLASSes contain the
+        words in this query, instead of matching ``window_spec``. The matching
+        windows are ranked best match first (optional, default: None)
+    :type find: string
+
+    :param deadline: The deadline for handling this command. If the deadline
+        has already passed when no matching windows are found, the app isn't
+        launched because the windows' attributes may not all have been
+        fetched in time (optional, default: None)
+    :type deadline: deadline.Deadline
+
+    :param backend: The window system backend that open_windows came from,
+        needed if ``current_desktop`` is given and to keep a separate
+        most-recently-used list for each display
+    :type backend: backend.Backend
+
+    :param normal_only: Never raise desktops, docks, panels or other windows
+        that aren't application windows, and never minimize them either
+        (optional, default: False)
+    :type normal_only: bool
+
+    :param ignore_skip_taskbar: Don't raise windows that have asked not to be
+        shown in taskbars (optional, default: False)
+    :type ignore_skip_taskbar: bool
+
+    :param urgent_first: Raise windows that are demanding attention before any
+        others (optional, default: False)
+    :type urgent_first: bool
+
+    :param standby: The standby instances of prelaunch specs. Standby windows
+        are never raised as they are, but if the app has no other windows its
+        standby window is shown instead of launching the app (optional,
+        default: None)
+    :type standby: standby.StandbyPool
+
+    :param mru: The display's most-recently-used journal, to keep the list in
+        instead of the pickle file (optional, default: None)
+    :type mru: mru.Journal
+
+    :param search_index: An index of the open windows to search for ``find``
+        in, kept up to date by the caller, instead of indexing open_windows
+        for this one search (optional, default: None)
+    :type search_index: window_index.WindowIndex
+
     """
     def _focus_window(window):
         """Call focus_window_function() on the given window.
 
         Also moves the newly-focused window to the top of the
         most-recently-used-windows list, which we want to do whenever we
-        focus a window.
+        focus a window, unless focus_window_function() returns False to say
+        that the window didn't actually get focused.
 
         """
-        focus_window_function(window)
-        update_pickled_window_list(open_windows, window)
+        if focus_window_function(window) is not False:
+            update_pickled_window_list(open_windows, window, display=display,
+                                       mru=mru)
+
+    def _launch():
+        """Show the app's standby window if it has one, or else launch it."""
+        if _deadline_missed(deadline):
+            return
+        if standby is not None:
+            window = standby.use(window_spec)
+            if window is not None:
+                update_pickled_window_list(open_windows, window,
+                                           display=display, mru=mru)
+                return
+        run_window_spec_command(window_spec, run_function)
 
     if not ignore:
         ignore = []
 
-    open_windows = sorted_most_recently_used(open_windows)
+    standby_ids = standby.window_ids if standby is not None else ()
+
+    # Each display has its own most-recently-used list.
+    display = backend.display_name if backend is not None else None
+    open_windows = sorted_most_recently_used(open_windows, display, mru)
 
     # If no window spec options were given, just run the command
     # (if there is one).
-    if (not others and
-            'id' not in window_spec and
-            'desktop' not in window_spec and
-            'pid' not in window_spec and
-            'wm_class' not in window_spec and
-            'machine' not in window_spec and
-            'title' not in window_spec):
+    if (not others and not find and
+            all(key in config.NON_MATCHING_KEYS for key in window_spec)):
         run_window_spec_command(window_spec, run_function)
         return
 
@@ -319,62 +500,242 @@ def runraisenext(window_spec, run_function, open_windows, focused_window,
         run_window_spec_command(window_spec, run_function)
         return
 
-    if others:
-        matching_windows = _get_other_windows(open_windows, window_specs)
+    if find:
+        if search_index is None:
+            search_index = window_index.WindowIndex(open_windows)
+        windows_by_id = dict((w.window_id, w) for w in open_windows)
+        candidate_windows = [
+            windows_by_id[w.window_id] for w in search_index.search(
+                find, mru_order=open_windows)
+            if w.window_id in windows_by_id]
+        found_ids = set(w.window_id for w in candidate_windows)
+
+        def _matches(window):
+            return window.window_id in found_ids
+    elif others:
+        candidate_windows = open_windows
+
+        def _matches(window):
+            return not matches_any(window, window_specs)
     else:
-        matching_windows = [window for window in open_windows
-                            if matches(window, window_spec)]
+        candidate_windows = open_windows
 
-    matching_windows = [w for w in matching_windows
-                        if not matches_any(w, ignore)]
+        def _matches(window):
+            return matches(window, window_spec)
 
-    if current_desktop:
-        current_desktop_ = ewmh_window.current_desktop()
-        matching_windows = [w for w in matching_windows
-                            if w.desktop == current_desktop_]
+    # The current desktop costs a round trip to the X server, so it's only
+    # asked for if a window gets as far as needing it.
+    current_desktops = []
 
-    if ignore_minimized:
-        matching_windows = [w for w in matching_windows if not w.minimized]
+    def _on_current_desktop(window):
+        if not current_desktops:
+            current_desktops.append(backend.current_desktop(
+                deadline=deadline))
+        return window.desktop == current_desktops[0]
+
+    def _qualifies(window):
+        """Return True if the given window should be raised.
+
+        The cheapest tests (integer comparisons of the window's types and
+        states) come first, then the window spec, then the ignore list.
+
+        """
+        if normal_only and not window.normal:
+            return False
+        if window.window_id in standby_ids:
+            return False
+        if ignore_skip_taskbar and window.skip_taskbar:
+            return False
+        if ignore_minimized and window.minimized:
+            return False
+        if current_desktop and not _on_current_desktop(window):
+            return False
+        return _matches(window) and not matches_any(window, ignore)
+
+    # The windows to raise, lazily, in order (most recently used first).
+    qualifying_windows = (w for w in candidate_windows if _qualifies(w))
+
+    if urgent_first:
+        matching_windows = list(qualifying_windows)
+        qualifying_windows = iter(
+            [w for w in matching_windows if w.urgent] +
+            [w for w in matching_windows if not w.urgent])
+
+    if not return_matching and bulk is None and nth is None:
+        # The common case: raise one window. Unless one of the app's windows
+        # is already focused (and we need to loop to the next one) that's the
+        # first qualifying window, so stop looking once it's found.
+        if (focused_window is not None and focused_window in open_windows and
+                _qualifies(focused_window)):
+            matching_windows = list(qualifying_windows)
+            if len(matching_windows) == 1:
+                # The app has one window open and it's already focused, do
+                # nothing.
+                return
+            # The app has more than one window open, and one of the app's
+            # windows is focused. Loop to the app's next window.
+            unvisited = _unvisited_windows(matching_windows, open_windows)
+            if unvisited:
+                _focus_window(unvisited[0])
+            else:
+                _focus_window(matching_windows[-1])
+            return
+
+        window = next(qualifying_windows, None)
+        if window is not None:
+            # The requested app isn't focused. Focus its most recently used
+            # window.
+            _focus_window(window)
+        else:
+            # The requested app is not open, launch it.
+            _launch()
+        return
+
+    matching_windows = list(qualifying_windows)
 
     if return_matching:
         return matching_windows
 
-    if not matching_windows:
-        # The requested app is not open, launch it.
-        run_window_spec_command(window_spec, run_function)
-    elif focused_window not in matching_windows:
-        # The requested app isn't focused. Focus its most recently used window.
-        _focus_window(matching_windows[0])
-    elif len(matching_windows) == 1 and focused_window in matching_windows:
-        # The app has one window open and it's already focused, do nothing.
-        pass
+    if bulk == "minimize-others":
+        other_windows = [w for w in open_windows
+                         if not _matches(w) and
+                         (not normal_only or w.normal) and
+                         not matches_any(w, ignore)]
+        if current_desktop:
+            other_windows = [w for w in other_windows
+                             if _on_current_desktop(w)]
+        perform_function([("minimize", w) for w in other_windows])
+    elif bulk == "close-all":
+        perform_function([("close", w) for w in matching_windows])
+    elif bulk == "raise-all":
+        if not matching_windows:
+            if not _deadline_missed(deadline):
+                run_window_spec_command(window_spec, run_function)
+            return
+        perform_function([("raise", w) for w in reversed(matching_windows)])
+        update_pickled_window_list(open_windows, matching_windows[0],
+                                   display=display, mru=mru)
+    elif bulk is not None:
+        raise ValueError("Unknown bulk action: {0}".format(bulk))
+    elif not matching_windows:
+        _launch()
     else:
-        # The app has more than one window open, and one of the app's windows
-        # is focused. Loop to the app's next window.
-        assert focused_window in matching_windows and len(matching_windows) > 1
-
-        unvisited = _unvisited_windows(matching_windows, open_windows)
-        if unvisited:
-            _focus_window(unvisited[0])
+        if nth > 0:
+            index = min(nth, len(matching_windows)) - 1
         else:
-            _focus_window(matching_windows[-1])
+            index = max(len(matching_windows) + nth, 0)
+        window = matching_windows[index]
+        if (window != focused_window and
+                focus_window_function(window) is not False):
+            update_pickled_window_list(open_windows, window,
+                                       matching_windows[:index], display,
+                                       mru=mru)
+
+
+def rungroup(window_specs, start_function, open_windows,
+             focus_window_function, ignore=None, backend=None, mru=None,
+             normal_only=False, standby=None, deadline=None):
+    """Launch all the apps in a launch group that aren't already running.
+
+    The apps are all launched at once, without waiting for each one to finish
+    starting before launching the next. Then the first app in the group is
+    raised, if it was already running.
+
+    :param window_specs: the window specs of the apps in the launch group, in
+        order
+    :type window_specs: list of dicts
+
+    :param start_function: the function to use to start window spec commands,
+        this should return without waiting for the command to finish
+    :type start_function: callable taking one argument: the command
+
+    :param open_windows: the list of open windows
+    :type open_windows: list of Window objects
+
+    :param focus_window_function: the function to call to focus a window
+    :type focus_window_function: callable taking one argument: a Window object
+        representing the window to be focused
+
+    :param ignore: A list of window specs matching windows that should be
+        ignored
+    :type ignore: list of dicts
+
+    :param backend: the window system backend that open_windows came from
+        (optional)
+    :type backend: backend.Backend
+
+    :param mru: the display's most-recently-used journal (optional)
+    :type mru: mru.Journal
+
+    :param normal_only: don't count desktops, docks, panels or other windows
+        that aren't application windows as the apps' windows (optional,
+        default: False)
+    :type normal_only: bool
+
+    :param standby: the standby instances of prelaunch specs, an app whose
+        only window is its standby window has that shown instead of being
+        launched (optional)
+    :type standby: standby.StandbyPool
+
+    :param deadline: the deadline that open_windows' attributes were fetched
+        with, if it was missed no apps are launched (optional)
+    :type deadline: deadline.Deadline
+
+    """
+    if not ignore:
+        ignore = []
+
+    standby_ids = standby.window_ids if standby is not None else ()
+
+    display = backend.display_name if backend is not None else None
+    open_windows = sorted_most_recently_used(open_windows, display, mru)
+    candidate_windows = [w for w in open_windows
+                         if (not normal_only or w.normal) and
+                         w.window_id not in standby_ids and
+                         not matches_any(w, ignore)]
+
+    first_window = None
+    for i, window_spec in enumerate(window_specs):
+        matching_windows = [w for w in candidate_windows
+                            if matches(w, window_spec)]
+        if not matching_windows:
+            if _deadline_missed(deadline):
+                continue
+            window = None
+            if standby is not None:
+                window = standby.use(window_spec)
+            if window is None:
+                run_window_spec_command(window_spec, start_function)
+            elif i == 0:
+                first_window = window
+        elif i == 0:
+            first_window = matching_windows[0]
+
+    if (first_window is not None and
+            focus_window_function(first_window) is not False):
+        update_pickled_window_list(open_windows, first_window,
+                                   display=display, mru=mru)
 
 
 class ConfigFileError(Exception):
     pass
 
 
-def _config_file_path(args):
+def _config_file_path(args, cwd=None):
     """Return the absolute path to the config file to use.
 
     This first uses the config file given with the -f/--f command-line
-    argument (which defaults to ~/.flitter.json if not given).
+    argument (which defaults to ~/.flitter.json if not given), relative to
+    cwd if it's given or else to the current directory.
     If that file doesn't exist it falls back on the default flitter.json file
     that ships with Flitter in the same directory as this Python module.
     Failing that it crashes.
 
     """
-    path = os.path.abspath(os.path.expanduser(args.file))
+    path = os.path.expanduser(args.file)
+    if cwd is not None:
+        path = os.path.join(cwd, path)
+    path = os.path.abspath(path)
     if os.path.isfile(path):
         return path
 
@@ -388,8 +749,21 @@ def _config_file_path(args):
         "file {default_file}".format(file=path, default_file=default_path))
 
 
-def parse_command_line_arguments(args):
-    """Parse the command-line arguments."""
+def parse_command_line_arguments(args, load_config=config.Config.load,
+                                 cwd=None):
+    """Parse the command-line arguments.
+
+    :param load_config: the function to call to load the config file
+        (optional, default: config.Config.load)
+    :type load_config: callable taking one argument: the path
+
+    :param cwd: the directory that a relative -f path is relative to, the
+        client's when the daemon parses a command (optional, default: the
+        current directory)
+
+    :rtype: Arguments
+
+    """
     parser = argparse.ArgumentParser(
         description="a script for launching apps and switching windows",
         add_help=True)
@@ -444,6 +818,81 @@ def parse_command_line_arguments(args):
         help="don't raise minimized windows",
         action="store_true")
 
+    parser.add_argument(
+        "--ignore-skip-taskbar",
+        help="don't raise windows that aren't shown in taskbars",
+        action="store_true")
+
+    parser.add_argument(
+        "--urgent-first",
+        help="raise windows that are demanding attention before any others",
+        action="store_true")
+
+    mode_args = parser.add_mutually_exclusive_group()
+    mode_args.add_argument(
+        "--raise-all", dest="bulk", action="store_const", const="raise-all",
+        help="raise all of the matching windows at once")
+    mode_args.add_argument(
+        "--minimize-others", dest="bulk", action="store_const",
+        const="minimize-others",
+        help="minimize all of the windows that don't match")
+    mode_args.add_argument(
+        "--close-all", dest="bulk", action="store_const", const="close-all",
+        help="close all of the matching windows")
+    mode_args.add_argument(
+        "--nth", type=int, metavar="N",
+        help="go straight to the Nth most recently used matching window, "
+             "e.g. 1 for the most recently used one")
+    mode_args.add_argument(
+        "--last", action="store_true",
+        help="go straight to the least recently used matching window")
+
+    parser.add_argument(
+        "--group", metavar="NAME",
+        help="launch all the apps in the given launch group from the config "
+             "file that aren't already running")
+
+    parser.add_argument(
+        "--find", metavar="QUERY",
+        help="go to the window whose title or WM_CLASS best matches the "
+             "given words, e.g. \"flitter readme\"")
+
+    parser.add_argument(
+        "--deadline-ms", type=int, metavar="MS",
+        help="give up waiting for replies from the X server after this many "
+             "milliseconds and make the best decision possible with the "
+             "window attributes received so far")
+
+    parser.add_argument(
+        "--confirm-focus", type=int, metavar="MS",
+        help="wait for up to this many milliseconds for the window manager "
+             "to activate the window (asking it again once if it doesn't) "
+             "and only remember windows that really were focused")
+
+    parser.add_argument(
+        "--backend", choices=backend_.X_BACKENDS,
+        help="how to talk to the X server: through python-xlib (ewmh, the "
+             "default) or through XCB (xcb, needs xcffib)")
+
+    parser.add_argument(
+        "--stats",
+        help="print latency and memory statistics from recent runs (or, if "
+             "flitter-daemon is running, from the daemon's own memory), "
+             "don't run or raise anything",
+        action="store_true")
+    parser.add_argument(
+        "--batch",
+        help="read flitter commands from stdin, one per line, run them all "
+             "with one X connection and write their results to stdout as "
+             "JSON lines (any other options apply to every command)",
+        action="store_true")
+
+    parser.add_argument(
+        "--doctor",
+        help="measure where flitter's time goes on this display and with "
+             "this config file, and recommend ways to make it faster",
+        action="store_true")
+
     parser.add_argument(
         "--print-matching",
         help="just print the matching windows to standard out, don't run or "
@@ -452,6 +901,11 @@ def parse_command_line_arguments(args):
 
     args = parser.parse_args(args)
 
+    if args.nth is not None and args.nth < 1:
+        parser.error("--nth must be 1 or more")
+    if args.last:
+        args.nth = -1
+
     if args.window_id is not None:
         if (args.desktop or args.pid or args.wm_class or args.machine or
                 args.title):
@@ -468,14 +922,41 @@ def parse_command_line_arguments(args):
                 "-c/--command, -i/--id, -d/--desktop, -p/--pid,-w/--wm_class, "
                 "-m/--machine or -t/--title")
 
+    if args.find:
+        if (args.others or args.alias or args.window_id or args.desktop or
+                args.pid or args.wm_class or args.machine or args.title):
+            parser.error(
+                "The --find argument can't be used at the same time as an "
+                "alias, -o/--others or any other window spec arguments")
+
+    if args.group:
+        if (args.others or args.find or args.alias or args.command or
+                args.window_id or args.desktop or args.pid or args.wm_class or
+                args.machine or args.title):
+            parser.error(
+                "The --group argument can't be used at the same time as an "
+                "alias, -o/--others, --find or any window spec arguments")
+
     try:
-        config_file_path = _config_file_path(args)
+        config_file_path = _config_file_path(args, cwd)
     except ConfigFileError as err:
-        parser.exit(err.message)
+        parser.exit(status=1, message="{0}\n".format(err))
+
+    # Parse the config file once, rather than once for each thing we need
+    # from it.
+    try:
+        config_ = load_config(config_file_path)
+    except ValueError as err:
+        parser.exit(status=1, message="{0}\n".format(err))
 
     # Form the window spec dict.
     if args.alias:
-        window_spec = get_window_spec_from_file(args.alias, config_file_path)
+        try:
+            window_spec = dict(config_.spec(args.alias))
+        except KeyError:
+            parser.exit(status=1,
+                        message="No window spec named {alias} in {file}\n"
+                        .format(alias=args.alias, file=config_file_path))
     else:
         window_spec = {}
     if args.window_id is not None:
@@ -493,35 +974,300 @@ def parse_command_line_arguments(args):
     if args.command is not None:
         window_spec['command'] = args.command
 
-    ignore = get_ignore_from_file(config_file_path)
-    all_window_specs = get_all_window_specs_from_file(
-        config_file_path).values()
+    if args.alias and not (args.window_id or args.desktop or args.pid or
+                           args.wm_class or args.machine or args.title or
+                           args.command):
+        # Use the config's compiled spec as-is.
+        window_spec = config_.spec(args.alias)
+
+    ignore = config_.ignore_index
+    all_window_specs = config_.index
+
+    if args.group:
+        try:
+            group = [config_.spec(alias)
+                     for alias in config_.groups[args.group.lower()]]
+        except KeyError:
+            parser.exit(status=1,
+                        message="No launch group named {group} in {file}\n"
+                        .format(group=args.group, file=config_file_path))
+    else:
+        group = None
+
+    return Arguments(
+        window_spec=window_spec, all_window_specs=all_window_specs,
+        ignore=ignore, others=args.others,
+        current_desktop=args.current_desktop,
+        ignore_minimized=args.ignore_minimized,
+        print_matching=args.print_matching, bulk=args.bulk, nth=args.nth,
+        find=args.find, group=group, deadline_ms=args.deadline_ms,
+        confirm_focus=args.confirm_focus, stats=args.stats,
+        backend_name=args.backend or config_.backend or "ewmh",
+        ignore_skip_taskbar=args.ignore_skip_taskbar,
+        urgent_first=args.urgent_first)
+
 
-    return (window_spec, all_window_specs, ignore, args.others,
-            args.current_desktop, args.ignore_minimized, args.print_matching)
+def _record_latency(command, latency_ms, window_count=0, statistics=None):
+    """Record one latency sample in the given statistics.
+
+    If no statistics are given (this process won't be around to report them)
+    the sample is recorded in the statistics file instead, which costs a
+    lock, two writes and reading this process's memory use.
+
+    """
+    if statistics is not None:
+        statistics.record(command, latency_ms, window_count)
+        return
+    try:
+        stats_.StatsFile(stats_.stats_path()).append(
+            command, latency_ms, window_count, stats_.rss_kb())
+    except (IOError, OSError):
+        log.warning("Couldn't record statistics in %s", stats_.stats_path())
+
+
+def _record_stats(command, start_time, window_count, statistics=None):
+    """Record how long this run took, see _record_latency()."""
+    _record_latency(command, (time.time() - start_time) * 1000.0,
+                    window_count, statistics)
+
+
+def handle(arguments, backend=None, windows_function=None, run_function=run,
+           start_function=start, start_time=None, standby=None, mru=None,
+           search_index=None, statistics=None):
+    """Handle one command, given its parsed command-line arguments.
+
+    :param arguments: the parsed arguments, as returned by
+        parse_command_line_arguments()
+    :type arguments: Arguments
+
+    :param backend: the backend to use, if not given a new one is made from
+        the arguments (optional)
+    :type backend: backend.Backend
+
+    :param windows_function: the function to call to get the list of open
+        windows (optional, default: backend.windows)
+    :type windows_function: callable taking a ``deadline`` keyword argument
+
+    :param run_function: the function to use to run commands (optional)
+    :param start_function: the function to use to start commands without
+        waiting for them (optional)
+
+    :param start_time: when the command was received, for statistics
+        (optional, default: now)
+    :type start_time: float
+
+    :param standby: the standby instances of prelaunch specs (optional)
+    :type standby: standby.StandbyPool
+
+    :param mru: the display's most-recently-used journal, to keep the list in
+        instead of the pickle file (optional)
+    :type mru: mru.Journal
+
+    :param search_index: an up-to-date index of the open windows, for --find
+        (optional)
+    :type search_index: window_index.WindowIndex
+
+    :param statistics: the live statistics of the process handling the
+        command, to record the command in and for --stats to report
+        (optional, default: use the statistics file)
+    :type statistics: stats.Stats
+
+    :returns: the text to print to standard out (or None), and the value for
+        main() to return
+    :rtype: 2-tuple
+
+    """
+    if start_time is None:
+        start_time = time.time()
+
+    if arguments.stats:
+        if statistics is None:
+            statistics = stats_.StatsFile(stats_.stats_path()).read()
+        return stats_.format_summary(statistics.summary()), None
+
+    def focus_window_function(window):
+        return focus_window(window,
+                            confirm_timeout_ms=arguments.confirm_focus,
+                            statistics=statistics)
+
+    if backend is None:
+        try:
+            backend = backend_.get_backend(arguments.backend_name)
+        except backend_.BackendError as err:
+            return None, str(err)
+    if windows_function is None:
+        windows_function = backend.windows
+
+    if arguments.deadline_ms is not None:
+        deadline = deadline_.Deadline(arguments.deadline_ms,
+                                      clock=backend.clock)
+    else:
+        deadline = None
+
+    open_windows = windows_function(deadline=deadline)
+
+    if arguments.group is not None:
+        rungroup(arguments.group, start_function, open_windows,
+                 focus_window_function, ignore=arguments.ignore,
+                 backend=backend, mru=mru, normal_only=True, standby=standby,
+                 deadline=deadline)
+        _record_stats("group", start_time, len(open_windows), statistics)
+        return None, None
+
+    result = runraisenext(arguments.window_spec,
+                          run_function,
+                          open_windows,
+                          backend.focused_window(open_windows,
+                                                 deadline=deadline),
+                          focus_window_function,
+                          others=arguments.others,
+                          ignore=arguments.ignore,
+                          window_specs=arguments.all_window_specs,
+                          current_desktop=arguments.current_desktop,
+                          ignore_minimized=arguments.ignore_minimized,
+                          return_matching=arguments.print_matching,
+                          bulk=arguments.bulk,
+                          perform_function=backend.perform,
+                          nth=arguments.nth,
+                          find=arguments.find,
+                          deadline=deadline,
+                          backend=backend,
+                          normal_only=True,
+                          ignore_skip_taskbar=arguments.ignore_skip_taskbar,
+                          urgent_first=arguments.urgent_first,
+                          standby=standby,
+                          mru=mru,
+                          search_index=search_index)
+
+    if deadline is not None and deadline.expired():
+        log.warning("Took %d ms, over the %d ms deadline",
+                    deadline.elapsed_ms(), deadline.milliseconds)
+
+    if arguments.find:
+        command = "find"
+    elif arguments.others:
+        command = "others"
+    elif arguments.print_matching:
+        command = "print-matching"
+    elif arguments.bulk:
+        command = arguments.bulk
+    elif arguments.nth is not None:
+        command = "nth"
+    else:
+        command = "raise"
+    _record_stats(command, start_time, len(open_windows), statistics)
+
+    if arguments.print_matching:
+        if result:
+            return None, '\n'.join([str(w) for w in result])
+        return None, None
+    return None, result
+
+
+def _config_loader(configs):
+    """Return a load_config function that loads each config file once.
+
+    :param configs: the configs that have been loaded, keyed by path, which
+        the returned function adds to
+    :type configs: dict
+
+    """
+    def load_config(path):
+        if path not in configs:
+            configs[path] = config.Config.load(path)
+        return configs[path]
+    return load_config
+
+
+def print_matching_from_table(args, display, configs=None):
+    """Answer a --print-matching command from the daemon's window table.
+
+    Only plain ``--print-matching ALIAS`` commands (with no other options
+    that filter the windows) can be answered this way, and only if the table
+    was classified with the same config file.
+
+    :param configs: the configs that have been loaded, keyed by path: the
+        config file is added to it if it's loaded here, so that the caller
+        doesn't load it again if the table can't answer the command
+    :type configs: dict
+
+    :returns: the value for main() to return, as handle() would have
+        returned it, or False if the command can't be answered from the table
+
+    """
+    if "--print-matching" not in args:
+        return False
+    try:
+        table = window_table.read(window_table.table_path(display))
+    except window_table.TableError as err:
+        log.warning("Couldn't read the window table: %s", err)
+        return False
+    if table is None:
+        return False
+
+    if configs is None:
+        configs = {}
+    loaded = []
+
+    def load_config(path):
+        loaded.append(_config_loader(configs)(path))
+        return loaded[-1]
+
+    arguments = parse_command_line_arguments(args, load_config=load_config)
+    if (arguments.others or arguments.current_desktop or
+            arguments.ignore_minimized or arguments.bulk or arguments.nth or
+            arguments.find or arguments.group or arguments.stats or
+            arguments.ignore_skip_taskbar or arguments.urgent_first):
+        return False
+    if not loaded or loaded[0].path != table.config_path:
+        return False
+    alias = loaded[0].alias_of(arguments.window_spec)
+    if alias is None:
+        return False
+
+    entries = sorted(
+        (entry for entry in table.entries
+         if alias in entry.specs and
+         entry.flags & window_table.NORMAL and
+         not entry.flags & (window_table.IGNORED | window_table.STANDBY)),
+        key=lambda entry: entry.mru_rank)
+    if not entries:
+        return None
+    return '\n'.join('{0} {1} {2}'.format(entry.window_id, entry.wm_class,
+                                           entry.title)
+                     for entry in entries)
 
 
 def main(args=None):
+    start_time = time.time()
     if args is None:
         args = sys.argv[1:]
-    window_spec, all_window_specs, ignore, others, current_desktop, ignore_minimized, print_matching = (
-        parse_command_line_arguments(args))
-
-
-    result = runraisenext(window_spec,
-                          run,
-                          ewmh_window.Window.windows(),
-                          ewmh_window.Window.focused_window(),
-                          focus_window,
-                          others=others,
-                          ignore=ignore,
-                          window_specs=all_window_specs,
-                          current_desktop=current_desktop,
-                          ignore_minimized=ignore_minimized,
-                          return_matching=print_matching)
-
-    if print_matching:
-        if result:
-            return '\n'.join([str(w) for w in result])
-    else:
+    display = os.environ.get("DISPLAY")
+
+    if "--batch" in args:
+        # Imported here because the daemon imports this module.
+        from flitter import batch
+        return batch.run(args, sys.stdin, sys.stdout, display)
+    if "--doctor" in args:
+        from flitter import doctor
+        return doctor.run(args, sys.stdout, display)
+
+    # Read-only commands can be answered from the daemon's window table,
+    # without asking the daemon or X anything.
+    configs = {}
+    result = print_matching_from_table(args, display, configs=configs)
+    if result is not False:
         return result
+
+    # If a resident flitter process is running, let it handle the command.
+    reply = client.forward(args, display)
+    if reply is not None:
+        return client.finish(reply)
+
+    output, result = handle(
+        parse_command_line_arguments(
+            args, load_config=_config_loader(configs)),
+        start_time=start_time)
+    if output is not None:
+        print(output)
+    return result
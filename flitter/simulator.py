@@ -0,0 +1,293 @@
+"""A simulated window system, for tests and benchmarks.
+
+SimulatedBackend keeps its windows in memory and models X's latency with a
+virtual clock instead of sleeping, so tests that use it are deterministic and
+fast however many windows (or however much latency) they simulate.
+
+"""
+import logging
+import os
+import random
+
+from flitter import backend
+
+log = logging.getLogger(__name__)
+
+
+#: Window classes and titles that SimulatedBackend.generate() picks from.
+_APPS = [
+    ('Navigator.Firefox', '{0} - Mozilla Firefox'),
+    ('gnome-terminal.Gnome-terminal', 'user@host: ~/{0}'),
+    ('gvim.Gvim', '{0}.py (~/src) - GVIM'),
+    ('emacs.Emacs', '{0}.el'),
+    ('slack.Slack', 'Slack - {0}'),
+    ('evince.Evince', '{0}.pdf'),
+]
+
+_WORDS = ['flitter', 'notes', 'report', 'inbox', 'build', 'release', 'todo',
+          'draft', 'review', 'meeting', 'budget', 'design']
+
+
+class SimulatedBackend(backend.Backend):
+
+    """An in-memory window system with a virtual clock.
+
+    Every request that needs a reply costs one simulated round trip of
+    ``latency_ms`` milliseconds, however many requests are pipelined into it,
+    plus the extra delay given in ``slow`` for any slow windows in the batch.
+    ``self.round_trips`` and ``self.requests`` count what a real X server
+    would have been sent.
+
+    If ``focus_stealing_prevention`` is True then the simulated window manager
+    ignores activation requests from applications, honouring only those from
+    pagers.
+
+    """
+
+    def __init__(self, display=None, latency_ms=0.0,
+                 focus_stealing_prevention=False):
+        super(SimulatedBackend, self).__init__(display)
+        self.latency_ms = latency_ms
+        self.focus_stealing_prevention = focus_stealing_prevention
+        self.now = 0.0
+        self.round_trips = 0
+        self.requests = 0
+
+        #: A dict mapping window IDs to extra reply delays in milliseconds.
+        self.slow = {}
+
+        #: The hints that the simulated window manager supports.
+        self.supported = [name for name, _ in backend.EWMH_HINTS]
+
+        self.desktop = 0
+        self.active = None
+        self._windows = {}
+        self._client_list = []
+        self._next_id = 0x1000001
+        self._atoms = {}
+        self._queued = []
+        self._subscribed = None
+        self._events = []
+        self._pipe = None
+
+    @classmethod
+    def generate(cls, count, seed=0, desktops=4, **kwargs):
+        """Return a simulated window system with ``count`` random windows.
+
+        The same seed always generates the same windows.
+
+        """
+        backend_ = cls(**kwargs)
+        rand = random.Random(seed)
+        for i in range(count):
+            wm_class, title = rand.choice(_APPS)
+            backend_.add_window(
+                wm_class, title.format(rand.choice(_WORDS)),
+                desktop=rand.randrange(desktops), pid=1000 + i)
+        if backend_._client_list:
+            backend_.active = backend_._client_list[-1]
+        return backend_
+
+    # Changing the simulated window system.
+
+    def add_window(self, wm_class, title, desktop=0, pid=None,
+                   machine='localhost', states=(), types=()):
+        """Open a new window and return its ID.
+
+        :param wm_class: the window's class, "instance.Class"
+        :param states: the names of the window's _NET_WM_STATE atoms
+        :param types: the names of the window's _NET_WM_WINDOW_TYPE atoms
+
+        """
+        window_id = self._next_id
+        self._next_id += 1
+        properties = {
+            'WM_CLASS': '\0'.join(wm_class.split('.', 1)) + '\0',
+            '_NET_WM_NAME': title,
+            '_NET_WM_DESKTOP': (desktop,),
+            'WM_CLIENT_MACHINE': machine,
+            '_NET_WM_STATE': tuple(self.atom(name) for name in states),
+        }
+        if pid is not None:
+            properties['_NET_WM_PID'] = (pid,)
+        if types:
+            properties['_NET_WM_WINDOW_TYPE'] = tuple(
+                self.atom(name) for name in types)
+        self._windows[window_id] = properties
+        self._client_list.append(window_id)
+        self._event("clients", None, '_NET_CLIENT_LIST')
+        return window_id
+
+    def remove_window(self, window_id):
+        """Close the window with the given ID."""
+        del self._windows[window_id]
+        self._client_list.remove(window_id)
+        if self._subscribed is not None:
+            self._subscribed.discard(window_id)
+        if self.active == window_id:
+            self.active = None
+            self._event("active", None, '_NET_ACTIVE_WINDOW')
+        self._event("clients", None, '_NET_CLIENT_LIST')
+
+    def set_property(self, window_id, name, value):
+        """Change a property of the window with the given ID."""
+        self._windows[window_id][name] = value
+        self._event("property", window_id, name)
+
+    def set_title(self, window_id, title):
+        self.set_property(window_id, '_NET_WM_NAME', title)
+
+    def activate(self, window_id):
+        """Activate the window with the given ID, as the window manager."""
+        self.active = window_id
+        hidden = self.atom('_NET_WM_STATE_HIDDEN')
+        states = self._windows[window_id]['_NET_WM_STATE']
+        if hidden in states:
+            self._windows[window_id]['_NET_WM_STATE'] = tuple(
+                state for state in states if state != hidden)
+        self._event("active", None, '_NET_ACTIVE_WINDOW')
+
+    def _event(self, type_, window_id, name):
+        if self._subscribed is None:
+            return
+        if window_id is not None and window_id not in self._subscribed:
+            return
+        self._events.append(backend.Event(type_, window_id, name))
+        if self._pipe is not None and len(self._events) == 1:
+            # The pipe holds one byte whenever there are pending events.
+            os.write(self._pipe[1], b'.')
+
+    def _round_trip(self, extra_ms=0.0):
+        self.round_trips += 1
+        self.now += (self.latency_ms + extra_ms) / 1000.0
+
+    # The backend interface.
+
+    def clock(self):
+        return self.now
+
+    def atom(self, name):
+        return self._atoms.setdefault(name, len(self._atoms) + 1)
+
+    def client_ids(self):
+        self.requests += 1
+        self._round_trip()
+        return list(self._client_list)
+
+    def _root_reply(self, deadline):
+        """Make one round trip for a root window property.
+
+        Returns False if the deadline passes before the reply arrives.
+
+        """
+        self.requests += 1
+        if deadline is not None and (
+                self.latency_ms / 1000.0 > deadline.remaining()):
+            self.round_trips += 1
+            self.now += deadline.remaining()
+            return False
+        self._round_trip()
+        return True
+
+    def active_window_id(self, deadline=None):
+        if not self._root_reply(deadline):
+            return None
+        return self.active
+
+    def current_desktop(self, deadline=None):
+        if not self._root_reply(deadline):
+            return None
+        return self.desktop
+
+    def supported_hints(self):
+        self.requests += 1
+        self._round_trip()
+        return list(self.supported)
+
+    def fetch_properties(self, window_ids, names=backend.WINDOW_PROPERTIES,
+                         deadline=None):
+        self.requests += len(window_ids) * len(names)
+        self.round_trips += 1
+        start = self.now
+        properties = dict((window_id, {}) for window_id in window_ids)
+        timed_out = []
+        for window_id in window_ids:
+            arrival = start + (self.latency_ms +
+                               self.slow.get(window_id, 0)) / 1000.0
+            if deadline is not None and (
+                    timed_out or arrival > self.now + deadline.remaining()):
+                self.now += deadline.remaining()
+                timed_out.extend((window_id, name) for name in names)
+                continue
+            self.now = max(self.now, arrival)
+            window = self._windows.get(window_id)
+            if window is None:
+                # BadWindow.
+                continue
+            for name in names:
+                if name in window:
+                    properties[window_id][name] = window[name]
+        if timed_out:
+            backend.log_missed_deadline(log, timed_out, deadline)
+        return properties
+
+    def send(self, action, window):
+        if action not in ("raise", "raise-as-pager", "minimize", "close",
+                          "move-to-current-desktop"):
+            raise ValueError("Unknown window action: {0}".format(action))
+        self.requests += 1
+        self._queued.append((action, window.window_id))
+
+    def flush(self):
+        queued, self._queued = self._queued, []
+        for action, window_id in queued:
+            if window_id not in self._windows:
+                continue
+            if action == "raise":
+                if not self.focus_stealing_prevention:
+                    self.activate(window_id)
+            elif action == "raise-as-pager":
+                self.activate(window_id)
+            elif action == "minimize":
+                states = self._windows[window_id]['_NET_WM_STATE']
+                self.set_property(window_id, '_NET_WM_STATE',
+                                  states + (self.atom('_NET_WM_STATE_HIDDEN'),))
+            elif action == "close":
+                self.remove_window(window_id)
+            elif action == "move-to-current-desktop":
+                self.set_property(window_id, '_NET_WM_DESKTOP',
+                                  (self.desktop,))
+
+    def subscribe(self, window_ids=()):
+        if self._subscribed is None:
+            self._subscribed = set()
+        self._subscribed.update(window_ids)
+
+    def fileno(self):
+        if self._pipe is None:
+            self._pipe = os.pipe()
+            if self._events:
+                os.write(self._pipe[1], b'.')
+        return self._pipe[0]
+
+    def events(self):
+        events, self._events = self._events, []
+        if self._pipe is not None and events:
+            os.read(self._pipe[0], 1)
+        return events
+
+    def wait(self, deadline):
+        # Nothing happens in the simulated window system unless the test makes
+        # it happen, so there's nothing to wait for but the deadline.
+        if not self._events:
+            self.now += deadline.remaining()
+
+    def close(self):
+        if self._pipe is not None:
+            os.close(self._pipe[0])
+            os.close(self._pipe[1])
+            self._pipe = None
+
+
+#: The backend class, for backend.get_backend().
+Backend = SimulatedBackend
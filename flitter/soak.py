@@ -0,0 +1,354 @@
+"""A soak test for flitter's long-running, event-driven mode.
+
+Runs a flitter daemon against a simulated window system for hours of
+simulated time, compressed into however long it takes to process, with:
+
+* terminals retitling themselves many times a second,
+* windows being opened and closed all the time, and
+* flitter commands being handled in the middle of it all.
+
+The run is split into segments. At the end of each segment the soak records
+the segment's command latency percentiles and the memory allocated by Python,
+and checks that the daemon's cached windows, the specs they match and the
+most-recently-used list all agree with recomputing them from scratch.
+
+Run it with ``python -m flitter.soak``. It exits with status 1 if memory
+grew, latency drifted or the daemon's state went stale.
+
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from flitter import daemon as daemon_
+from flitter import mru
+from flitter import runraisenext
+from flitter import simulator
+from flitter import stats as stats_
+
+
+#: The simulated display's name.
+DISPLAY = ":99"
+
+#: How long a soak simulates by default, in seconds.
+DEFAULT_DURATION = 4 * 60 * 60
+
+#: How much simulated time passes between rounds of events, in seconds.
+TICK = 1.0
+
+
+def _alias(wm_class):
+    return wm_class.split('.')[-1].lower()
+
+
+def _config():
+    """Return a config file's contents with a spec for each simulated app."""
+    return {
+        "ignore": [],
+        "specs": dict(
+            (_alias(wm_class), {"wm_class": {"exact": wm_class},
+                                "command": _alias(wm_class)})
+            for wm_class, _ in simulator._APPS),
+    }
+
+
+def _window_state(window):
+    """Return everything about a window that flitter caches."""
+    return (window.window_id, window.desktop, window.pid, window.wm_class,
+            window.machine, window.title, tuple(window._types),
+            tuple(window._states))
+
+
+class Soak(object):
+
+    """One soak run."""
+
+    def __init__(self, directory, windows=50, terminals=5, retitle_hz=10.0,
+                 churn_hz=0.2, command_hz=0.5, seed=0):
+        """Set up a simulated window system and a daemon to soak.
+
+        :param directory: a directory for the config file and the daemon's
+            most-recently-used list (which is kept in $HOME)
+        :param windows: how many windows to keep open, on average
+        :param terminals: how many of the windows are retitling terminals
+        :param retitle_hz: how many times a second each terminal retitles
+        :param churn_hz: how many windows are opened or closed a second
+        :param command_hz: how many flitter commands are handled a second
+
+        """
+        self.rand = random.Random(seed)
+        self.windows = windows
+        self.retitle_hz = retitle_hz
+        self.churn_hz = churn_hz
+        self.command_hz = command_hz
+        self.config_path = os.path.join(directory, "flitter.json")
+        with open(self.config_path, "w") as file_:
+            file_.write(json.dumps(_config()))
+
+        self.sim = simulator.SimulatedBackend.generate(
+            windows - terminals, seed=seed, display=DISPLAY)
+        self.terminals = [
+            self.sim.add_window('xterm.XTerm', 'user@host: ~',
+                                pid=100 + i)
+            for i in range(terminals)]
+        self.daemon = daemon_.Daemon(
+            os.path.join(directory, "flitter.sock"),
+            make_backend=lambda name: self.sim)
+        self.daemon._start = self._start
+        self.aliases = sorted(_config()["specs"])
+
+        self.peak_windows = windows
+        self.events = 0
+        self.commands = 0
+        self.latencies = []
+
+    def _start(self, command, display, cwd=None):
+        """Launch an app by opening a window for it."""
+        for wm_class, title in simulator._APPS:
+            if _alias(wm_class) == command:
+                self.sim.add_window(wm_class, title.format("new"))
+
+    def _churn(self):
+        """Open or close a window, keeping the number open near the target."""
+        closable = [window_id for window_id in self.sim.client_ids()
+                    if window_id not in self.terminals]
+        count = len(closable) + len(self.terminals)
+        if count > self.windows or (count == self.windows and
+                                    self.rand.random() < 0.5):
+            if closable:
+                self.sim.remove_window(self.rand.choice(closable))
+        else:
+            wm_class, title = self.rand.choice(simulator._APPS)
+            self.sim.add_window(wm_class,
+                                title.format(self.rand.choice(
+                                    simulator._WORDS)),
+                                desktop=self.rand.randrange(4))
+            self.peak_windows = max(self.peak_windows, count + 1)
+        self.events += 1
+
+    def _command(self):
+        """Handle one flitter command and record how long it took."""
+        args = ["-f", self.config_path]
+        roll = self.rand.random()
+        if roll < 0.1:
+            args += ["--find", self.rand.choice(simulator._WORDS)]
+        elif roll < 0.2:
+            args += ["--nth", "2", self.rand.choice(self.aliases)]
+        else:
+            args.append(self.rand.choice(self.aliases))
+        start = time.time()
+        self.daemon.handle_request({"display": DISPLAY, "args": args})
+        self.latencies.append((time.time() - start) * 1000.0)
+        self.commands += 1
+
+    def tick(self):
+        """Simulate TICK seconds of events and commands."""
+        for window_id in self.terminals:
+            for i in range(int(self.retitle_hz * TICK)):
+                self.sim.set_title(window_id, 'user@host: ~/{0}'.format(
+                    self.rand.choice(simulator._WORDS)))
+                self.events += 1
+        if self.rand.random() < self.churn_hz * TICK:
+            self._churn()
+        if DISPLAY in self.daemon.displays:
+            # What the daemon's selector does when the X connection is
+            # readable.
+            self.daemon._display_events(DISPLAY, None)
+        if self.rand.random() < self.command_hz * TICK:
+            self._command()
+        # What the daemon does at the end of each round of its event loop.
+        self.daemon.publish()
+        self.sim.now += TICK
+
+    def mismatches(self):
+        """Compare the daemon's state with recomputing it from scratch.
+
+        :returns: descriptions of any differences
+        :rtype: list of strings
+
+        """
+        if DISPLAY not in self.daemon.displays:
+            return []
+        state = self.daemon.displays[DISPLAY]
+        state.handle_events()
+        cached = state.open_windows()
+        fresh = self.sim.windows()
+        mismatches = []
+
+        if [_window_state(w) for w in cached] != [
+                _window_state(w) for w in fresh]:
+            mismatches.append("cached windows differ from the open windows")
+
+        config = self.daemon._load_config(self.config_path)
+        for cached_window, fresh_window in zip(cached, fresh):
+            if (config.index.matching_names(cached_window) !=
+                    config.index.matching_names(fresh_window)):
+                mismatches.append("window 0x{0:08x} is misclassified".format(
+                    cached_window.window_id))
+
+        # The order the daemon uses, against the order that replaying its
+        # journal from disk gives (as a restarted daemon would).
+        cached_mru = [w.window_id for w in
+                      runraisenext.sorted_most_recently_used(cached, DISPLAY,
+                                                             state.mru)]
+        open_ids = set(w.window_id for w in fresh)
+        replayed = [window_id for window_id in mru._replay(state.mru.path)[0]
+                    if window_id in open_ids]
+        fresh_mru = [w.window_id for w in fresh
+                     if w.window_id not in set(replayed)] + replayed
+        if cached_mru != fresh_mru:
+            mismatches.append("the most-recently-used order is stale")
+        # Closed windows are only dropped from the list when the journal is
+        # compacted, so it can't be compared with the open windows exactly.
+        listed = len(state.mru.window_ids())
+        if listed > self.peak_windows:
+            mismatches.append(
+                "the most-recently-used list has {0} windows but no more "
+                "than {1} were ever open".format(listed, self.peak_windows))
+        if state.mru.needs_compaction():
+            mismatches.append("the most-recently-used journal has {0} records"
+                              .format(state.mru.records))
+
+        if len(state._windows) != len(fresh) or state._dirty:
+            mismatches.append("the daemon's window cache has grown")
+        return mismatches
+
+    def close(self):
+        self.daemon.close()
+
+
+def run(duration=DEFAULT_DURATION, segments=8, **kwargs):
+    """Run a soak and return its report.
+
+    :param duration: how long to simulate, in seconds
+    :param segments: how many segments to split the run into
+    :param kwargs: passed to Soak()
+
+    :returns: a dict with a list of per-segment dicts (the simulated time at
+        the segment's end, its p50 and p95 latencies in milliseconds, the
+        bytes allocated by Python and any state mismatches) and the totals
+    :rtype: dict
+
+    """
+    directory = tempfile.mkdtemp()
+    home = os.environ.get("HOME")
+    os.environ["HOME"] = directory
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    soak = Soak(directory, **kwargs)
+    try:
+        ticks = int(duration / TICK)
+        report = {"segments": []}
+        for segment in range(segments):
+            start = len(soak.latencies)
+            for i in range(ticks // segments):
+                soak.tick()
+            latencies = soak.latencies[start:]
+            report["segments"].append({
+                "time": soak.sim.now,
+                "p50": stats_.percentile(latencies, 50),
+                "p95": stats_.percentile(latencies, 95),
+                "memory": tracemalloc.get_traced_memory()[0],
+                "mismatches": soak.mismatches(),
+            })
+        report["events"] = soak.events
+        report["commands"] = soak.commands
+        return report
+    finally:
+        soak.close()
+        if not was_tracing:
+            tracemalloc.stop()
+        if home is None:
+            del os.environ["HOME"]
+        else:
+            os.environ["HOME"] = home
+        shutil.rmtree(directory)
+
+
+def check(report, latency_factor=2.0, latency_slack_ms=2.0,
+          memory_slack_bytes=512 * 1024):
+    """Return the ways in which a soak's report shows a problem.
+
+    The first segment is a warm-up (caches filling, modules being imported)
+    and is only checked for mismatches. Later segments' latency percentiles
+    must stay within ``latency_factor`` times (plus ``latency_slack_ms``) of
+    the second segment's, and the memory allocated at the end must be within
+    ``memory_slack_bytes`` of what was allocated at the end of the second.
+
+    :rtype: list of strings
+
+    """
+    problems = []
+    segments = report["segments"]
+    for segment in segments:
+        for mismatch in segment["mismatches"]:
+            problems.append("At {0:.0f}s: {1}".format(segment["time"],
+                                                      mismatch))
+    if len(segments) < 3:
+        return problems
+
+    baseline = segments[1]
+    for segment in segments[2:]:
+        for key in ("p50", "p95"):
+            if baseline[key] is None or segment[key] is None:
+                continue
+            limit = baseline[key] * latency_factor + latency_slack_ms
+            if segment[key] > limit:
+                problems.append(
+                    "At {0:.0f}s: {1} latency drifted from {2:.2f} ms to "
+                    "{3:.2f} ms".format(segment["time"], key, baseline[key],
+                                        segment[key]))
+    growth = segments[-1]["memory"] - baseline["memory"]
+    if growth > memory_slack_bytes:
+        problems.append("Memory grew by {0} bytes after the warm-up".format(
+            growth))
+    return problems
+
+
+def _ms(value):
+    if value is None:
+        # No commands were handled in the segment.
+        return "     -"
+    return "{0:6.2f}".format(value)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="soak test flitter's daemon against a simulated window "
+                    "system")
+    parser.add_argument("--hours", type=float,
+                        default=DEFAULT_DURATION / 3600.0,
+                        help="how many hours to simulate")
+    parser.add_argument("--windows", type=int, default=50)
+    parser.add_argument("--terminals", type=int, default=5)
+    parser.add_argument("--retitle-hz", type=float, default=10.0)
+    parser.add_argument("--churn-hz", type=float, default=0.2)
+    parser.add_argument("--command-hz", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(args)
+
+    report = run(duration=args.hours * 3600, windows=args.windows,
+                 terminals=args.terminals, retitle_hz=args.retitle_hz,
+                 churn_hz=args.churn_hz, command_hz=args.command_hz,
+                 seed=args.seed)
+    for segment in report["segments"]:
+        print("{0:>8.0f}s  p50 {1} ms  p95 {2} ms  {3:>10} bytes".format(
+            segment["time"], _ms(segment["p50"]), _ms(segment["p95"]),
+            segment["memory"]))
+    print("{0} events, {1} commands".format(report["events"],
+                                            report["commands"]))
+    problems = check(report)
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Warm standby instances of slow-starting apps.
+
+Window specs with ``"prelaunch": true`` in the config file (for apps like
+Thunderbird or an IDE, that take seconds to start) have an instance of their
+app kept running, minimized, by the flitter daemon. When the app's key is
+pressed and none of its visible windows match the standby window is moved to
+the current desktop and focused instead of launching the app from cold, and a
+new standby instance is started in the background to replace it.
+
+Standby instances need a resident process to keep track of them, so they're
+only used when flitter's commands are handled by flitter-daemon.
+
+"""
+import logging
+import time
+
+from flitter import process
+from flitter import runraisenext
+
+log = logging.getLogger(__name__)
+
+#: Give up waiting for a standby instance's window after this many seconds.
+PENDING_TIMEOUT = 60
+
+
+class StandbyPool(object):
+
+    """The standby instances of one display's prelaunch specs.
+
+    The pool is keyed by the specs' commands: specs with the same command
+    share one standby instance.
+
+    """
+
+    def __init__(self, backend, start_function, clock=time.time):
+        """Make a new, empty pool.
+
+        :param backend: the backend of the display that the pool's windows
+            are on
+        :type backend: backend.Backend
+
+        :param start_function: the function to call to start a standby
+            instance without waiting for it
+        :type start_function: callable taking one argument, the command, and
+            returning the subprocess.Popen of the started process
+
+        """
+        self.backend = backend
+        self.start_function = start_function
+        self.clock = clock
+
+        #: A dict mapping commands to their standby windows.
+        self.windows = {}
+
+        #: A dict mapping commands to (spec, process, start time) tuples for
+        #: standby instances whose windows haven't appeared yet.
+        self.pending = {}
+
+        #: The commands whose standby instances never opened a window that
+        #: could be adopted. They aren't prelaunched again: single-instance
+        #: apps (and apps that hand off to a server process) open their
+        #: windows from a process that isn't a child of the command, and
+        #: retrying would open a new visible window every PENDING_TIMEOUT.
+        self.failed = set()
+
+    @property
+    def window_ids(self):
+        """The IDs of all the standby windows, which shouldn't be raised."""
+        return set(window.window_id for window in self.windows.values())
+
+    def keep(self, window_specs):
+        """Start standby instances of any prelaunch specs that don't have one.
+
+        :type window_specs: iterable of dicts
+
+        """
+        for window_spec in window_specs:
+            if not window_spec.get("prelaunch"):
+                continue
+            command = window_spec.get("command")
+            if (command in self.windows or command in self.pending or
+                    command in self.failed):
+                continue
+            log.info("Starting a standby instance of %s", command)
+            child = self.start_function(command)
+            self.pending[command] = (window_spec, child, self.clock())
+
+    def adopt(self, open_windows):
+        """Hide the windows of any standby instances that have opened one.
+
+        Also forgets about standby windows that have been closed, and gives
+        up on standby instances that never opened a window.
+
+        :param open_windows: the list of open windows
+        :type open_windows: list of Window objects
+
+        """
+        open_ids = set(window.window_id for window in open_windows)
+        for command, window in list(self.windows.items()):
+            if window.window_id not in open_ids:
+                del self.windows[command]
+
+        taken = self.window_ids
+        adopted = []
+        for command, (window_spec, child, started) in list(
+                self.pending.items()):
+            for window in open_windows:
+                if (window.window_id not in taken and
+                        window.pid is not None and
+                        process.CACHE.is_descendant(window.pid,
+                                                    child.pid) and
+                        runraisenext.matches(window, window_spec)):
+                    del self.pending[command]
+                    self.windows[command] = window
+                    taken.add(window.window_id)
+                    adopted.append(("minimize", window))
+                    break
+            else:
+                if self.clock() - started > PENDING_TIMEOUT:
+                    log.warning("The standby instance of %s didn't open a "
+                                "window that flitter could adopt, not "
+                                "prelaunching it again", command)
+                    del self.pending[command]
+                    self.failed.add(command)
+        if adopted:
+            self.backend.perform(adopted)
+
+    def use(self, window_spec):
+        """Show and focus the standby window of the given spec, if it has one.
+
+        A new standby instance is started to replace it.
+
+        :returns: the window that was shown, or None if the spec had no
+            standby window ready
+        :rtype: Window
+
+        """
+        if not window_spec.get("prelaunch"):
+            return None
+        window = self.windows.pop(window_spec.get("command"), None)
+        if window is None:
+            return None
+        self.backend.perform([("move-to-current-desktop", window),
+                              ("raise", window)])
+        self.keep([window_spec])
+        return window
+
+    def close(self):
+        """Close all the standby windows."""
+        self.backend.perform([("close", window)
+                              for window in self.windows.values()])
+        self.windows = {}
+        self.pending = {}
+
@@ -0,0 +1,221 @@
+"""Latency and memory statistics for flitter's hot path.
+
+Statistics are kept in fixed-size ring buffers so that collecting them has a
+bounded cost, however long flitter runs for.
+
+"""
+import collections
+import fcntl
+import math
+import os
+import resource
+import struct
+import time
+import tracemalloc
+
+
+#: How many latency samples to keep per command.
+DEFAULT_SIZE = 1024
+
+_HEADER = struct.Struct('<4sII')
+_MAGIC = b'FLST'
+_RECORD = struct.Struct('<d16sfII')
+
+
+def stats_path():
+    """Return the path to the file we record per-run statistics in."""
+    return os.path.abspath(os.path.expanduser("~/.flitter.stats"))
+
+
+def rss_kb():
+    """Return the current resident set size of this process in kilobytes."""
+    try:
+        with open('/proc/self/statm', 'r') as file_:
+            pages = int(file_.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except (IOError, OSError, IndexError, ValueError):
+        # Not Linux, fall back on the peak RSS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def top_allocations(limit=10):
+    """Return the source lines that have allocated the most memory.
+
+    Only works if tracemalloc is tracing, returns an empty list otherwise.
+
+    :rtype: list of (string, int) tuples: the file and line number, and the
+        number of bytes allocated there that are still alive
+
+    """
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot()
+    return [(str(stat.traceback), stat.size)
+            for stat in snapshot.statistics('lineno')[:limit]]
+
+
+def percentile(samples, percent):
+    """Return the given percentile of the given samples (nearest rank)."""
+    if not samples:
+        return None
+    samples = sorted(samples)
+    rank = int(math.ceil(percent / 100.0 * len(samples))) - 1
+    return samples[min(max(rank, 0), len(samples) - 1)]
+
+
+class Stats(object):
+
+    """Statistics about one flitter process (or a series of them).
+
+    Latency samples are kept in one ring buffer per command, so only the most
+    recent ``size`` samples of each command are kept.
+
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.latencies = {}
+        self.events = collections.Counter()
+        self.window_count = 0
+        self.rss_kb = None
+        self._caches = {}
+
+    def record(self, command, latency_ms, window_count=None):
+        """Record how long it took to handle one command."""
+        samples = self.latencies.get(command)
+        if samples is None:
+            samples = self.latencies[command] = collections.deque(
+                maxlen=self.size)
+        samples.append(latency_ms)
+        if window_count is not None:
+            self.window_count = window_count
+
+    def count_event(self, event_type):
+        """Count one handled X event of the given type."""
+        self.events[event_type] += 1
+
+    def add_cache(self, name, cache):
+        """Report the hit rate of the given cache in summaries.
+
+        :param cache: any object with ``hits`` and ``misses`` attributes
+
+        """
+        self._caches[name] = cache
+
+    def summary(self):
+        """Return a dict summarizing these statistics."""
+        commands = {}
+        for command, samples in self.latencies.items():
+            commands[command] = {
+                "count": len(samples),
+                "p50": percentile(samples, 50),
+                "p99": percentile(samples, 99),
+                "max": max(samples),
+            }
+        caches = {}
+        for name, cache in self._caches.items():
+            total = cache.hits + cache.misses
+            caches[name] = {
+                "hits": cache.hits,
+                "misses": cache.misses,
+                "hit_rate": float(cache.hits) / total if total else None,
+            }
+        return {
+            "commands": commands,
+            "events": dict(self.events),
+            "caches": caches,
+            "window_count": self.window_count,
+            "rss_kb": self.rss_kb if self.rss_kb is not None else rss_kb(),
+            "top_allocations": top_allocations(),
+        }
+
+
+def format_summary(summary):
+    """Return the given Stats.summary() dict as human-readable text."""
+    lines = ["{0:<16} {1:>6} {2:>9} {3:>9} {4:>9}".format(
+        "command", "count", "p50 ms", "p99 ms", "max ms")]
+    for command in sorted(summary["commands"]):
+        latency = summary["commands"][command]
+        lines.append("{0:<16} {1:>6} {2:>9.1f} {3:>9.1f} {4:>9.1f}".format(
+            command, latency["count"], latency["p50"], latency["p99"],
+            latency["max"]))
+    lines.append("")
+    for event_type in sorted(summary["events"]):
+        lines.append("{0} events: {1}".format(
+            event_type, summary["events"][event_type]))
+    for name in sorted(summary["caches"]):
+        cache = summary["caches"][name]
+        if cache["hit_rate"] is None:
+            hit_rate = "-"
+        else:
+            hit_rate = "{0:.1%}".format(cache["hit_rate"])
+        lines.append("{0} cache: {1} hits, {2} misses ({3})".format(
+            name, cache["hits"], cache["misses"], hit_rate))
+    lines.append("windows: {0}".format(summary["window_count"]))
+    lines.append("rss: {0} KB".format(summary["rss_kb"]))
+    for location, size in summary["top_allocations"]:
+        lines.append("{0:>10} B {1}".format(size, location))
+    return "\n".join(lines)
+
+
+class StatsFile(object):
+
+    """A fixed-size ring buffer of per-run statistics, stored in a file.
+
+    Each flitter run appends one record to the file, overwriting the oldest
+    record once the file is full, so the file never grows past ``slots``
+    records and appending costs the same however many runs there have been.
+
+    """
+
+    def __init__(self, path, slots=DEFAULT_SIZE):
+        self.path = path
+        self.slots = slots
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        return os.fdopen(fd, 'r+b')
+
+    def append(self, command, latency_ms, window_count, rss_kb_):
+        """Append one record to the file."""
+        with self._open() as file_:
+            fcntl.flock(file_, fcntl.LOCK_EX)
+            header = file_.read(_HEADER.size)
+            if len(header) == _HEADER.size:
+                magic, slots, next_slot = _HEADER.unpack(header)
+            if len(header) != _HEADER.size or magic != _MAGIC or (
+                    slots != self.slots):
+                file_.truncate(0)
+                next_slot = 0
+            file_.seek(_HEADER.size + next_slot * _RECORD.size)
+            file_.write(_RECORD.pack(time.time(), command.encode()[:16],
+                                     latency_ms, window_count, rss_kb_))
+            file_.seek(0)
+            file_.write(_HEADER.pack(_MAGIC, self.slots,
+                                     (next_slot + 1) % self.slots))
+
+    def read(self, size=DEFAULT_SIZE):
+        """Return a Stats object made from the records in the file."""
+        stats = Stats(size)
+        try:
+            with open(self.path, 'rb') as file_:
+                fcntl.flock(file_, fcntl.LOCK_SH)
+                data = file_.read()
+        except (IOError, OSError):
+            return stats
+        if len(data) < _HEADER.size:
+            return stats
+        magic, _, _ = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            return stats
+        records = []
+        offset = _HEADER.size
+        while offset + _RECORD.size <= len(data):
+            records.append(_RECORD.unpack_from(data, offset))
+            offset += _RECORD.size
+        for timestamp, command, latency_ms, window_count, rss_kb_ in sorted(
+                records):
+            stats.record(command.rstrip(b'\0').decode(), latency_ms,
+                         window_count)
+            stats.rss_kb = rss_kb_
+        return stats
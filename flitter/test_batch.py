@@ -0,0 +1,99 @@
+"""Tests for batch.py."""
+import io
+import json
+import os
+import threading
+
+import flitter.batch as batch
+import flitter.daemon as daemon
+import flitter.fixtures as fixtures
+import flitter.simulator as simulator
+
+
+class TestBatch(fixtures.TempDirTestCase):
+
+    """Tests for running many commands in one process."""
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.set_environ("FLITTER_SOCKET",
+                         os.path.join(self.directory, "flitter.sock"))
+        self.config_path = os.path.join(self.directory, "flitter.json")
+        with open(self.config_path, "w") as file_:
+            file_.write(json.dumps({
+                "ignore": [],
+                "specs": {
+                    "firefox": {"wm_class": "Navigator.Firefox",
+                                "command": "firefox"},
+                    "vim": {"wm_class": "gvim.Gvim", "command": "gvim"},
+                },
+            }))
+        self.sim = simulator.SimulatedBackend(":1")
+        self.firefox = self.sim.add_window("Navigator.Firefox", "Firefox")
+        self.vim = self.sim.add_window("gvim.Gvim", "notes.txt - GVIM")
+
+    def run_batch(self, commands):
+        output = io.StringIO()
+        batch.run(["--batch", "-f", self.config_path],
+                  io.StringIO(commands), output, display=":1",
+                  make_backend=lambda display: self.sim)
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_commands_run_in_order(self):
+        replies = self.run_batch("vim\n"
+                           "# A comment.\n"
+                           "\n"
+                           "--print-matching firefox\n"
+                           "--wm_class 'gvim.*' --print-matching\n"
+                           "--nth 0\n"
+                           "'unbalanced\n")
+
+        assert len(replies) == 5
+        assert replies[0]["status"] == 0
+        assert self.sim.active == self.vim
+        assert replies[1]["status"] == 0
+        assert replies[1]["stdout"].startswith(str(self.firefox))
+        assert replies[2]["stdout"].startswith(str(self.vim))
+        assert replies[3]["status"] == 2
+        assert "--nth must be 1 or more" in replies[3]["result"]
+        assert replies[4]["status"] == 2
+
+    def test_unknown_alias_doesnt_stop_the_batch(self):
+        replies = self.run_batch("nonexistent\n"
+                           "vim\n")
+
+        assert replies[0]["status"] == 1
+        assert "No window spec named nonexistent" in replies[0]["result"]
+        assert replies[1]["status"] == 0
+        assert self.sim.active == self.vim
+
+    def test_commands_are_handed_to_a_running_daemon(self):
+        running = daemon.Daemon(os.environ["FLITTER_SOCKET"],
+                                make_backend=lambda display: self.sim)
+        running.listen()
+        output = io.StringIO()
+        thread = threading.Thread(target=lambda: batch.run(
+            ["--batch", "-f", self.config_path],
+            io.StringIO("vim\n--print-matching firefox\n"), output,
+            display=":1", make_backend=None))
+        try:
+            thread.start()
+            while thread.is_alive():
+                running.serve_once(0.01)
+            thread.join()
+            replies = [json.loads(line)
+                       for line in output.getvalue().splitlines()]
+
+            assert [reply["status"] for reply in replies] == [0, 0]
+            assert replies[1]["stdout"].startswith(str(self.firefox))
+            assert self.sim.active == self.vim
+            assert list(running.displays) == [":1"]
+        finally:
+            running.close()
+
+    def test_windows_are_fetched_once(self):
+        self.run_batch("--print-matching firefox\n" * 10)
+
+        # The client list, both windows' properties and the active window
+        # once, then just the active window for each of the other commands.
+        assert self.sim.round_trips == 3 + 9
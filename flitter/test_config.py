@@ -0,0 +1,417 @@
+"""Tests for config.py."""
+import json
+import os
+
+import flitter.config as config
+import flitter.fixtures as fixtures
+import flitter.runraisenext as runraisenext
+
+
+class Window(object):
+
+    """A minimal stand-in for a window object."""
+
+    def __init__(self, window_id, wm_class='', title=''):
+        self.window_id = window_id
+        self.wm_class = wm_class
+        self.title = title
+
+
+def _write_config(path, specs, ignore=None, **kwargs):
+    data = {"specs": specs, "ignore": ignore or []}
+    data.update(kwargs)
+    with open(path, 'w') as file_:
+        file_.write(json.dumps(data))
+
+
+class TestConfig(fixtures.TempDirTestCase):
+
+    """Tests for loading, reloading and watching config files."""
+
+    def setUp(self):
+        super(TestConfig, self).setUp()
+        self.path = os.path.join(self.directory, "flitter.json")
+
+    def test_window_spec_matches(self):
+        """WindowSpec.matches() should match like runraisenext.matches()."""
+        spec = config.WindowSpec(wm_class="Navigator", command="firefox")
+        assert spec.matches(Window("1", "Navigator.Firefox"))
+        assert not spec.matches(Window("1", "Mail.Thunderbird"))
+
+    def test_match_kinds(self):
+        window = Window("1", "skype.Skype", "Skype - Call")
+
+        assert config.WindowSpec(wm_class={"exact": "skype.Skype"}).matches(
+            window)
+        assert not config.WindowSpec(wm_class={"exact": "skype"}).matches(
+            window)
+        assert config.WindowSpec(title={"prefix": "Skype"}).matches(window)
+        assert config.WindowSpec(title={"suffix": "Call"}).matches(window)
+        assert config.WindowSpec(title={"glob": "Sk*Call"}).matches(window)
+        assert not config.WindowSpec(title={"glob": "Sk*Cal"}).matches(
+            window)
+        assert config.WindowSpec(title={"regex": "S.ype"}).matches(window)
+
+    def test_invalid_match_kind(self):
+        try:
+            config.WindowSpec(title={"fuzzy": "Skype"})
+        except ValueError:
+            pass
+        else:
+            assert False, "WindowSpec() should have raised ValueError"
+
+    def test_spec_index_agrees_with_matching_every_spec(self):
+        specs = {
+            "skype": config.WindowSpec(wm_class={"exact": "skype.Skype"}),
+            "firefox": config.WindowSpec(wm_class={"prefix": "Navigator"}),
+            "nav": config.WindowSpec(wm_class={"prefix": "Nav"}),
+            "all": config.WindowSpec(wm_class={"prefix": ""}),
+            "mail": config.WindowSpec(wm_class={"exact": "Mail.Thunderbird"},
+                                      title={"prefix": "Inbox"}),
+            "vim": config.WindowSpec(title=".*Vim"),
+        }
+        index = config.SpecIndex(specs)
+        windows = [
+            Window("1", "skype.Skype"),
+            Window("2", "Navigator.Firefox", "Tips for Vim - Firefox"),
+            Window("3", "Nav"),
+            Window("4", "Mail.Thunderbird", "Inbox - Thunderbird"),
+            Window("5", "Mail.Thunderbird", "Drafts - Thunderbird"),
+            Window("6", None, None),
+        ]
+
+        for window in windows:
+            assert index.matching_names(window) == set(
+                alias for alias, spec in specs.items()
+                if spec.matches(window))
+        assert index.any_match(Window("7", "x"))
+        assert not config.SpecIndex([specs["skype"]]).any_match(
+            Window("7", "x"))
+
+    def test_int_attributes_are_matched_as_strings(self):
+        specs = {"pid": {"pid": {"exact": "111"}},
+                 "desktop": {"desktop": {"prefix": "1"}},
+                 "other_pid": {"pid": "2.2"}}
+        index = config.SpecIndex(dict(
+            (alias, config.WindowSpec(spec)) for alias, spec in specs.items()))
+        windows = [Window("1"), Window("2"), Window("3")]
+        for window, pid, desktop in zip(windows, (111, 222, None), (1, 0, 12)):
+            window.pid = pid
+            window.desktop = desktop
+
+        for window in windows:
+            assert index.matching_names(window) == set(
+                alias for alias, spec in specs.items()
+                if runraisenext.matches(window, spec))
+        assert [index.matching_names(window) for window in windows] == [
+            set(["pid", "desktop"]), set(["other_pid"]), set(["desktop"])]
+
+    def test_load_lowercases_aliases(self):
+        _write_config(self.path, {"Firefox": {"wm_class": "Navigator"}},
+                      [{"wm_class": "Conky"}])
+
+        config_ = config.Config.load(self.path)
+
+        assert list(config_.specs.keys()) == ["firefox"]
+        assert config_.specs["firefox"] == {"wm_class": "Navigator"}
+        assert config_.ignore == [{"wm_class": "Conky"}]
+
+    def test_load_groups(self):
+        _write_config(self.path, {"Firefox": {"wm_class": "Navigator"},
+                                  "Vim": {"title": "Vim"}},
+                      groups={"Work": ["firefox", "VIM"]})
+
+        config_ = config.Config.load(self.path)
+
+        assert config_.groups == {"work": ["firefox", "vim"]}
+
+    def test_load_groups_with_unknown_alias(self):
+        _write_config(self.path, {"Firefox": {"wm_class": "Navigator"}},
+                      groups={"work": ["firefox", "thunderbird"]})
+
+        try:
+            config.Config.load(self.path)
+        except ValueError:
+            pass
+        else:
+            assert False, "Should have raised ValueError"
+
+    def test_reload_reuses_unchanged_specs(self):
+        """Only added and changed specs should be compiled again."""
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"},
+                                  "vim": {"title": "Vim"},
+                                  "skype": {"wm_class": "skype"}})
+        old = config.Config.load(self.path)
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"},
+                                  "vim": {"title": "VIM"},
+                                  "gvim": {"wm_class": "Gvim"}})
+
+        new = config.Config.load(self.path, previous=old)
+
+        assert new.specs["firefox"] is old.specs["firefox"]
+        assert new.specs["vim"] is not old.specs["vim"]
+        assert new.changed_aliases(old) == set(["vim", "gvim", "skype"])
+
+    def test_classifier_reload_only_rematches_changed_specs(self):
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"},
+                                  "vim": {"title": "Vim"}})
+        old = config.Config.load(self.path)
+        classifier = config.Classifier(old)
+        firefox = Window("1", "Navigator.Firefox", "Tips for Vim - Firefox")
+        assert classifier.classify(firefox) == frozenset(["firefox"])
+
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"},
+                                  "vim": {"title": ".*Vim"}})
+        changed = classifier.reload(config.Config.load(self.path,
+                                                       previous=old))
+
+        assert changed == set(["vim"])
+        assert classifier.classify(firefox) == frozenset(["firefox", "vim"])
+
+    def test_classifier_retitle_only_rematches_title_specs(self):
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"},
+                                  "vim": {"title": ".*Vim"}})
+        classifier = config.Classifier(config.Config.load(self.path))
+        firefox = Window("1", "Navigator.Firefox", "Inbox - Firefox")
+        assert classifier.classify(firefox) == frozenset(["firefox"])
+
+        def fail(window):
+            assert False, "specs without titles shouldn't be re-matched"
+        classifier.config.specs["firefox"].matches = fail
+        firefox.title = "Tips for Vim - Firefox"
+        classifier.retitle(firefox)
+
+        assert classifier.classify(firefox) == frozenset(["firefox", "vim"])
+
+    def test_classifier_always_rematches_live_specs(self):
+        _write_config(self.path, {"terminal": {"wm_class": "xterm"},
+                                  "vim": {"wm_class": "xterm",
+                                          "child_cmdline": "vim"}})
+        classifier = config.Classifier(config.Config.load(self.path))
+        xterm = Window("1", "xterm.XTerm", "xterm")
+        xterm.child_cmdline = "bash"
+        assert classifier.classify(xterm) == frozenset(["terminal"])
+
+        xterm.child_cmdline = "vim notes.txt"
+
+        assert classifier.classify(xterm) == frozenset(["terminal", "vim"])
+
+    def _write_project_templates(self):
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"}},
+                      templates={"Project-{name}": {
+                          "params": {"name": ["flitter", "Notes", "web",
+                                              "webapp"]},
+                          "wm_class": {"exact": "xterm.XTerm"},
+                          "title": "{name}: ",
+                          "command": "xterm -T '{name}: '"}})
+
+    def test_template_aliases_resolve_lazily(self):
+        self._write_project_templates()
+        config_ = config.Config.load(self.path)
+
+        spec = config_.spec("Project-Notes")
+
+        assert spec == {"wm_class": {"exact": "xterm.XTerm"},
+                        "title": "Notes: ", "command": "xterm -T 'Notes: '"}
+        assert config_.spec("project-notes") is spec
+        assert config_.alias_of(spec) == "project-notes"
+        assert config_.spec("firefox") is config_.specs["firefox"]
+        for alias in ("project-nope", "project-", "projectnotes"):
+            try:
+                config_.spec(alias)
+            except KeyError:
+                pass
+            else:
+                assert False, "Should have raised KeyError"
+
+    def test_template_matching(self):
+        self._write_project_templates()
+        config_ = config.Config.load(self.path)
+        windows = [Window("1", "xterm.XTerm", "Notes: ~/notes"),
+                   Window("2", "xterm.XTerm", "webapp: ~/src"),
+                   Window("3", "xterm.XTerm", "bash"),
+                   Window("4", "Navigator.Firefox", "Notes: - Firefox")]
+
+        assert [config_.index.matching_names(window) for window in windows] == [
+            set(["project-notes"]), set(["project-webapp"]), set(),
+            set(["firefox"])]
+        assert [config_.index.any_match(window) for window in windows] == [
+            True, True, False, True]
+        # Instances match the same windows that the template says they do.
+        for alias in ("project-notes", "project-web", "project-webapp"):
+            assert [window.window_id for window in windows
+                    if config_.spec(alias).matches(window)] == [
+                window.window_id for window in windows
+                if alias in config_.index.matching_names(window)]
+
+    def test_template_matching_agrees_with_instances(self):
+        _write_config(self.path, {}, templates={
+            "tab-{name}": {"params": {"name": ["foo", "foobar", "c++"]},
+                           "title": "{name}"},
+            "scratch-{name}": {"params": {"name": ["a", "b"]},
+                               "title": "{name}: |scratch"}})
+        config_ = config.Config.load(self.path)
+        windows = [Window("1", "xterm.XTerm", "foobar: ~"),
+                   Window("2", "xterm.XTerm", "c++: ~"),
+                   Window("3", "xterm.XTerm", "cc: ~"),
+                   Window("4", "xterm.XTerm", "scratch")]
+
+        assert [config_.index.matching_names(window) for window in windows] == [
+            set(["tab-foo", "tab-foobar"]), set(["tab-c++"]), set(),
+            set(["scratch-a", "scratch-b"])]
+        for alias in ("tab-foo", "tab-foobar", "tab-c++", "scratch-a"):
+            plain_spec = config.WindowSpec(dict(config_.spec(alias)))
+            assert [window.window_id for window in windows
+                    if plain_spec.matches(window)] == [
+                window.window_id for window in windows
+                if alias in config_.index.matching_names(window)]
+
+    def test_template_matching_only_creates_matching_instances(self):
+        names = ["project{0}".format(i) for i in range(500)]
+        _write_config(self.path, {}, templates={"p-{name}-{pane}": {
+            "params": {"name": names,
+                       "pane": ["pane{0}".format(i) for i in range(40)]},
+            "wm_class": {"exact": "xterm.XTerm"},
+            "title": {"suffix": "{pane} ({name})"}}})
+        config_ = config.Config.load(self.path)
+        template = config_.templates[0]
+        window = Window("1", "xterm.XTerm", "vim\nnotes pane12 (project42)")
+
+        assert config_.index.matching_names(window) == set(
+            ["p-project42-pane12"])
+        assert config_.index.any_match(window)
+        assert not config_.index.any_match(
+            Window("2", "xterm.XTerm", "pane12 (project500)"))
+        assert len(template._resolved) <= 4
+
+    def test_classifier_rematches_title_templates(self):
+        self._write_project_templates()
+        classifier = config.Classifier(config.Config.load(self.path))
+        xterm = Window("1", "xterm.XTerm", "flitter: ~/flitter")
+        assert classifier.classify(xterm) == frozenset(["project-flitter"])
+
+        xterm.title = "Notes: ~/notes"
+        classifier.retitle(xterm)
+
+        assert classifier.classify(xterm) == frozenset(["project-notes"])
+
+    def test_reload_reuses_unchanged_templates(self):
+        self._write_project_templates()
+        old = config.Config.load(self.path)
+        classifier = config.Classifier(old)
+        xterm = Window("1", "xterm.XTerm", "flitter: ~/flitter")
+        classifier.classify(xterm)
+
+        assert config.Config.load(
+            self.path, previous=old).templates == old.templates
+
+        _write_config(self.path, {}, templates={"todo-{list}": {
+            "params": {"list": ["home", "flitter"]},
+            "title": "{list}"}})
+        new = config.Config.load(self.path, previous=old)
+        classifier.reload(new)
+
+        assert new.templates != old.templates
+        assert classifier.classify(xterm) == frozenset(["todo-flitter"])
+
+    def test_invalid_templates(self):
+        for template in ({"title": "{name}"},
+                         {"params": {"name": []}, "title": "{name}"},
+                         {"params": {"name": ["a", "A"]}, "title": "{name}"},
+                         {"params": {"name": ["a"], "other": ["b"]},
+                          "title": "{name}"},
+                         {"params": {"name": ["a"]},
+                          "title": {"glob": "*{name}"}},
+                         {"params": {"name": ["a"]}, "title": "{name}",
+                          "command": "a", "prelaunch": True}):
+            _write_config(self.path, {}, templates={"x-{name}": template})
+            try:
+                config.Config.load(self.path)
+            except ValueError:
+                pass
+            else:
+                assert False, "Should have raised ValueError for {0}".format(
+                    template)
+
+    # Config files that are valid JSON but not valid configs, such as a
+    # file that's saved while it's being edited.
+    invalid_configs = (
+        [],
+        {"ignore": []},
+        {"specs": [], "ignore": []},
+        {"specs": {}},
+        {"specs": {"firefox": "Navigator"}, "ignore": []},
+        {"specs": {"firefox": {"wm_class": "Navigator"},
+                   "Firefox": {"wm_class": "Navigator"}}, "ignore": []},
+        {"specs": {"firefox": {"wm_class": "Navigator("}}, "ignore": []},
+        {"specs": {}, "ignore": ["Navigator"]},
+        {"specs": {}, "ignore": [{"wm_class": "["}]},
+        {"specs": {}, "ignore": [], "templates": {"x-{name}": "x"}},
+        {"specs": {}, "ignore": [], "templates": {
+            "x-{name}": {"params": {"name": ["a"]}, "title": "{name}("}}},
+        {"specs": {}, "ignore": [], "templates": {
+            "x-{name}": {"params": {"name": ["a"]}, "title": "{name}",
+                         "command": ["a"]}}},
+        {"specs": {}, "ignore": [], "groups": {"work": "firefox"}},
+        {"specs": {}, "ignore": [], "groups": {"work": [], "Work": []}},
+    )
+
+    def test_invalid_configs(self):
+        """Any invalid config should raise ValueError, nothing else."""
+        for data in self.invalid_configs:
+            with open(self.path, 'w') as file_:
+                file_.write(json.dumps(data))
+            try:
+                config.Config.load(self.path)
+            except ValueError:
+                pass
+            else:
+                assert False, "Should have raised ValueError for {0}".format(
+                    data)
+
+    def test_live_config_keeps_previous_config_if_config_invalid(self):
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"}})
+        live_config = config.LiveConfig(self.path)
+        try:
+            old = live_config.config
+            for data in self.invalid_configs:
+                with open(self.path, 'w') as file_:
+                    file_.write(json.dumps(data))
+                os.utime(self.path, (0, 0))
+
+                assert live_config.check() == set()
+                assert live_config.config is old
+        finally:
+            live_config.close()
+
+    def test_watcher_notices_changes(self):
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"}})
+        watcher = config.ConfigWatcher(self.path)
+        try:
+            assert not watcher.changed()
+
+            # Save the file the way many editors do: write a new file then
+            # rename it over the old one.
+            new_path = self.path + ".new"
+            _write_config(new_path, {"firefox": {"wm_class": "Firefox"}})
+            os.utime(new_path, (0, 0))
+            os.rename(new_path, self.path)
+
+            assert watcher.changed()
+            assert not watcher.changed()
+        finally:
+            watcher.close()
+
+    def test_live_config_keeps_previous_config_if_file_invalid(self):
+        _write_config(self.path, {"firefox": {"wm_class": "Navigator"}})
+        live_config = config.LiveConfig(self.path)
+        try:
+            old = live_config.config
+            with open(self.path, 'w') as file_:
+                file_.write('{"specs": {')
+            os.utime(self.path, (0, 0))
+
+            assert live_config.check() == set()
+            assert live_config.config is old
+        finally:
+            live_config.close()
@@ -0,0 +1,448 @@
+"""Tests for daemon.py and client.py."""
+import json
+import os
+import threading
+
+import flitter.client as client
+import flitter.daemon as daemon
+import flitter.deadline as deadline
+import flitter.fixtures as fixtures
+import flitter.runraisenext as runraisenext
+import flitter.simulator as simulator
+import flitter.window_table as window_table
+
+
+class FakeProcess(object):
+
+    def __init__(self, pid):
+        self.pid = pid
+
+
+class TestDaemon(fixtures.TempDirTestCase):
+
+    """Tests for serving several displays from one process."""
+
+    def setUp(self):
+        super(TestDaemon, self).setUp()
+        self.config_path = os.path.join(self.directory, "flitter.json")
+        with open(self.config_path, "w") as file_:
+            file_.write(json.dumps({
+                "ignore": [],
+                "specs": {
+                    "firefox": {"wm_class": "Navigator.Firefox",
+                                "command": "firefox"},
+                    "mail": {"wm_class": "Mail.Thunderbird",
+                             "command": "thunderbird", "prelaunch": True},
+                },
+            }))
+        self.displays = {
+            ":1": simulator.SimulatedBackend(":1"),
+            ":2": simulator.SimulatedBackend(":2"),
+        }
+        self.displays[":1"].add_window("Navigator.Firefox", "Firefox")
+        self.displays[":2"].add_window("Navigator.Firefox", "Firefox")
+        self.displays[":2"].add_window("Navigator.Firefox", "Firefox")
+        self.daemon = daemon.Daemon(
+            os.path.join(self.directory, "flitter.sock"),
+            make_backend=self.displays.get)
+        # Don't really launch anything.
+        self.started = []
+        self.daemon._start = lambda command, display, cwd=None: (
+            self.started.append(command) or FakeProcess(0))
+
+    def tearDown(self):
+        self.daemon.close()
+        super(TestDaemon, self).tearDown()
+
+    def request(self, display, *args):
+        return self.daemon.handle_request(
+            {"display": display, "args": ["-f", self.config_path] +
+             list(args)})
+
+    def test_displays_are_separate(self):
+        reply_1 = self.request(":1", "--print-matching", "firefox")
+        reply_2 = self.request(":2", "--print-matching", "firefox")
+
+        assert len(reply_1["result"].splitlines()) == 1
+        assert len(reply_2["result"].splitlines()) == 2
+
+    def test_displays_have_separate_mru_lists(self):
+        self.request(":2", "firefox")
+
+        assert self.displays[":2"].active is not None
+        assert os.path.getsize(
+            os.path.join(self.directory, ".flitter-:2.mru")) > 0
+        assert not os.path.exists(
+            os.path.join(self.directory, ".flitter-:1.mru"))
+
+    def test_mru_order_survives_restart(self):
+        sim = self.displays[":2"]
+        first, second = sim.client_ids()
+        self.request(":2", "--nth", "2", "firefox")
+        self.daemon.publish()
+        assert self.daemon.displays[":2"].mru.window_ids()[0] == second
+        sim.remove_window(first)
+        # flitter picks up where the daemon left off when it isn't running.
+        self.daemon.close()
+        assert runraisenext._load(runraisenext.pickle_path(":2"))[0] == (
+            second)
+
+        self.daemon = daemon.Daemon(
+            os.path.join(self.directory, "flitter.sock"),
+            make_backend=self.displays.get)
+        self.daemon._start = lambda command, display, cwd=None: FakeProcess(0)
+        self.request(":2", "--print-matching", "firefox")
+        self.daemon.publish()
+
+        assert self.daemon.displays[":2"].mru.window_ids() == [second]
+
+    def test_only_changed_windows_are_fetched(self):
+        sim = self.displays[":1"]
+        self.request(":1", "--print-matching", "firefox")
+        requests = sim.requests
+
+        window_id = sim.add_window("Navigator.Firefox", "Firefox")
+        reply = self.request(":1", "--print-matching", "firefox")
+
+        assert len(reply["result"].splitlines()) == 2
+        assert str(window_id) in reply["result"]
+        # The client list, the new window's properties and the active window.
+        assert sim.requests - requests == (
+            1 + len(simulator.backend.WINDOW_PROPERTIES) + 1)
+
+    def test_title_changes_are_coalesced(self):
+        sim = self.displays[":1"]
+        self.daemon.prelaunch = False
+        self.request(":1", "--print-matching", "firefox")
+        self.daemon.publish()
+        window_id = sim.client_ids()[0]
+        requests = sim.requests
+
+        for i in range(100):
+            sim.set_title(window_id, "Tab {0} - Firefox".format(i))
+        self.daemon._display_events(":1", None)
+
+        # Title changes are published after a short delay, not straight away.
+        assert self.daemon._unpublished == set()
+        assert ":1" in self.daemon._publish_at
+
+        reply = self.request(":1", "--print-matching", "firefox")
+
+        assert "Tab 99 - Firefox" in reply["result"]
+        # One title and the active window.
+        assert sim.requests - requests == 2
+
+    def test_windows_that_miss_the_deadline_are_fetched_again(self):
+        sim = simulator.SimulatedBackend(":3", latency_ms=5)
+        firefox = sim.add_window("Navigator.Firefox", "Firefox")
+        state = daemon.DisplayState(":3", sim)
+        state.open_windows()
+
+        gvim = sim.add_window("gvim.Gvim", "GVIM")
+        sim.set_title(firefox, "Inbox - Firefox")
+        sim.slow[firefox] = sim.slow[gvim] = 100
+        state.handle_events()
+        windows = state.open_windows(
+            deadline=deadline.Deadline(50, clock=sim.clock))
+
+        assert [w.title for w in windows] == ["Firefox", None]
+        assert state.pending_changes() == "windows"
+
+        del sim.slow[firefox], sim.slow[gvim]
+        windows = state.open_windows(
+            deadline=deadline.Deadline(50, clock=sim.clock))
+
+        assert [w.title for w in windows] == ["Inbox - Firefox", "GVIM"]
+        assert state.pending_changes() is None
+        state.backend.close()
+
+    def test_find_uses_the_displays_search_index(self):
+        sim = self.displays[":2"]
+        first, second = sim.client_ids()
+        self.request(":2", "--find", "firefox")
+        search_index = self.daemon.displays[":2"].search_index
+        assert len(search_index) == 2
+
+        sim.set_title(first, "README.markdown - GVIM")
+        sim.remove_window(second)
+        self.request(":2", "--find", "readme")
+
+        assert self.daemon.displays[":2"].search_index is search_index
+        assert [w.window_id for w in search_index.search("readme")] == [first]
+        assert len(search_index) == 1
+        assert sim.active == first
+
+    def test_stats_are_the_daemons_own(self):
+        sim = self.displays[":1"]
+        self.request(":1", "--print-matching", "firefox")
+        sim.set_title(sim.client_ids()[0], "Inbox - Firefox")
+        self.request(":1", "--print-matching", "firefox")
+
+        reply = self.request(":1", "--stats")
+
+        lines = reply["stdout"].splitlines()
+        assert [line.split()[:2] for line in lines[1:2]] == [
+            ["print-matching", "2"]]
+        assert "property events: 1" in lines
+        assert "classifier :1 cache: 0 hits, 0 misses (-)" in lines
+        assert any(line.startswith("process cache: ") for line in lines)
+        # Commands don't touch the stats file while the daemon's running.
+        assert not os.path.exists(
+            os.path.join(self.directory, ".flitter.stats"))
+
+    def test_argument_errors_are_sent_back(self):
+        reply = self.request(":1", "--nth", "0")
+
+        assert reply["status"] == 2
+        assert "--nth must be 1 or more" in reply["result"]
+
+    def test_idle_displays_are_disconnected(self):
+        self.daemon.idle_timeout = -1
+        self.daemon.prelaunch = False
+        self.request(":1", "--print-matching", "firefox")
+
+        self.daemon.serve_once(0)
+
+        assert self.daemon.displays == {}
+
+    def test_displays_with_standby_windows_stay_connected(self):
+        self.daemon.idle_timeout = -1
+        self.request(":1", "firefox")
+        assert self.daemon.displays[":1"].standby.pending
+
+        self.daemon.serve_once(0)
+
+        assert list(self.daemon.displays) == [":1"]
+        assert self.started == ["thunderbird"]
+
+    def test_standby_instances_that_are_never_adopted_arent_retried(self):
+        sim = self.displays[":1"]
+        self.request(":1", "firefox")
+        pool = self.daemon.displays[":1"].standby
+        assert list(pool.pending) == ["thunderbird"]
+        # A single-instance app opens its window from another process.
+        sim.add_window("Mail.Thunderbird", "Inbox")
+        pool.clock = lambda: float("inf")
+
+        for i in range(3):
+            self.request(":1", "firefox")
+
+        assert self.started == ["thunderbird"]
+        assert pool.pending == {}
+        assert pool.failed == set(["thunderbird"])
+        assert len([w for w in sim.windows()
+                    if w.wm_class == "Mail.Thunderbird"]) == 1
+
+    def test_prelaunch(self):
+        sim = self.displays[":1"]
+        sim.desktop = 1
+        started = []
+
+        def start(command, display, cwd=None):
+            started.append(command)
+            return FakeProcess(5000 + len(started))
+        self.daemon._start = start
+
+        # The first time, the app is launched from cold (and a standby
+        # instance is started as well).
+        self.request(":1", "mail")
+        assert started == ["thunderbird", "thunderbird"]
+        cold = sim.add_window("Mail.Thunderbird", "Inbox", pid=5001)
+        warm = sim.add_window("Mail.Thunderbird", "Inbox", desktop=3,
+                              pid=5002)
+        self.daemon.displays[":1"].open_windows()
+
+        # The standby window is hidden and never raised as it is.
+        matching = self.request(":1", "--print-matching", "mail")["result"]
+        assert str(cold) in matching
+        assert str(warm) not in matching
+        assert sim.windows()[-1].minimized
+
+        # Once the app has no other windows, the standby window is shown.
+        sim.remove_window(cold)
+        self.request(":1", "mail")
+
+        assert sim.active == warm
+        assert sim.windows()[-1].desktop == 1
+        assert not sim.windows()[-1].minimized
+        assert started == ["thunderbird"] * 3
+
+    def test_window_table(self):
+        args = ["-f", self.config_path, "--print-matching", "firefox"]
+        reply = self.request(":2", *args[2:])
+        self.daemon.publish()
+        path = window_table.table_path(":2", self.daemon.path)
+
+        table = window_table.read(path)
+        assert [entry.specs for entry in table.entries] == [
+            ("firefox",), ("firefox",)]
+
+        # Title changes are published without any command being handled.
+        sim = self.displays[":2"]
+        window_id = sim.client_ids()[0]
+        sim.set_title(window_id, "Inbox - Firefox")
+        self.daemon._display_events(":2", None)
+        self.daemon.publish()
+        assert window_table.read(path).entries[0].title == "Inbox - Firefox"
+
+        os.environ["FLITTER_SOCKET"] = self.daemon.path
+        try:
+            result = runraisenext.print_matching_from_table(args, ":2")
+        finally:
+            del os.environ["FLITTER_SOCKET"]
+        assert result == self.request(":2", *args[2:])["result"]
+        assert "Inbox - Firefox" in result
+        assert reply["result"] != result
+
+        self.daemon.close()
+        assert window_table.read(path) is None
+
+    def test_window_table_with_template_specs(self):
+        with open(self.config_path, "w") as file_:
+            file_.write(json.dumps({
+                "ignore": [],
+                "specs": {"firefox": {"wm_class": "Navigator.Firefox"}},
+                "templates": {"project-{name}": {
+                    "params": {"name": ["flitter", "notes"]},
+                    "wm_class": "xterm", "title": "{name}",
+                    "command": "xterm -T {name}"}},
+            }))
+        sim = self.displays[":1"]
+        sim.add_window("xterm.XTerm", "notes: ~")
+        args = ["-f", self.config_path, "--print-matching", "project-notes"]
+        reply = self.request(":1", *args[2:])
+        self.daemon.publish()
+
+        table = window_table.read(window_table.table_path(":1",
+                                                          self.daemon.path))
+        assert table.aliases == ["firefox", "project-notes"]
+        assert [entry.specs for entry in table.entries] == [
+            ("firefox",), ("project-notes",)]
+        os.environ["FLITTER_SOCKET"] = self.daemon.path
+        try:
+            assert runraisenext.print_matching_from_table(
+                args, ":1") == reply["result"]
+        finally:
+            del os.environ["FLITTER_SOCKET"]
+
+        self.request(":1", "project-flitter")
+        assert self.started == ["xterm -T flitter"]
+
+    def test_window_table_skips_standby_windows(self):
+        sim = self.displays[":1"]
+        self.daemon._start = lambda command, display, cwd=None: (
+            FakeProcess(5000))
+        self.request(":1", "firefox")
+        standby_id = sim.add_window("Mail.Thunderbird", "Inbox", pid=5000)
+        args = ["-f", self.config_path, "--print-matching", "mail"]
+        reply = self.request(":1", *args[2:])
+        self.daemon.publish()
+
+        table = window_table.read(window_table.table_path(":1",
+                                                          self.daemon.path))
+        assert [entry.flags & window_table.STANDBY for entry in table.entries
+                if entry.window_id == standby_id] == [window_table.STANDBY]
+        os.environ["FLITTER_SOCKET"] = self.daemon.path
+        try:
+            assert runraisenext.print_matching_from_table(args, ":1") is None
+        finally:
+            del os.environ["FLITTER_SOCKET"]
+        assert reply["result"] is None
+
+    def test_config_is_loaded_once_when_the_table_cant_answer(self):
+        self.request(":1", "--print-matching", "firefox")
+        self.daemon.publish()
+        args = ["-f", self.config_path, "--print-matching", "--others",
+                "firefox"]
+        configs = {}
+        os.environ["FLITTER_SOCKET"] = self.daemon.path
+        try:
+            assert runraisenext.print_matching_from_table(
+                args, ":1", configs=configs) is False
+        finally:
+            del os.environ["FLITTER_SOCKET"]
+
+        load_config = runraisenext._config_loader(configs)
+        assert load_config(self.config_path) is configs[self.config_path]
+        assert list(configs) == [self.config_path]
+
+    def test_forward(self):
+        self.daemon.listen()
+        replies = []
+        thread = threading.Thread(target=lambda: replies.append(
+            client.forward(["-f", self.config_path, "--print-matching",
+                            "firefox"], ":2", path=self.daemon.path)))
+        thread.start()
+        while thread.is_alive():
+            self.daemon.serve_once(0.01)
+        thread.join()
+
+        assert len(replies[0]["result"].splitlines()) == 2
+
+    def test_bad_commands_dont_stop_the_daemon(self):
+        broken_path = os.path.join(self.directory, "broken.json")
+        with open(broken_path, "w") as file_:
+            file_.write('{"ignore": [], "specs": {"vim": {"title": "GVIM"}, '
+                        '"VIM": {"title": "GVIM"}}}')
+        self.daemon.listen()
+        replies = []
+
+        def send_commands():
+            for args in (["-f", self.config_path, "nonexistent"],
+                         ["-f", broken_path, "vim"],
+                         ["-f", self.config_path, "--print-matching",
+                          "firefox"]):
+                replies.append(client.forward(args, ":2",
+                                              path=self.daemon.path))
+        thread = threading.Thread(target=send_commands)
+        thread.start()
+        while thread.is_alive():
+            self.daemon.serve_once(0.01)
+        thread.join()
+
+        assert replies[0]["status"] == 1
+        assert "No window spec named nonexistent" in replies[0]["result"]
+        assert replies[1]["status"] == 1
+        assert "VIM is defined more than once" in replies[1]["result"]
+        assert len(replies[2]["result"].splitlines()) == 2
+
+    def test_commands_run_in_the_clients_directory(self):
+        starts = []
+        self.daemon._start = lambda command, display, cwd=None: (
+            starts.append((command, cwd)) or FakeProcess(0))
+
+        reply = self.daemon.handle_request(
+            {"display": ":1", "cwd": self.directory,
+             "args": ["-f", "flitter.json", "mail"]})
+
+        assert reply["status"] == 0
+        # The standby instance isn't any one client's.
+        assert starts == [("thunderbird", self.directory),
+                          ("thunderbird", None)]
+
+    def test_second_daemon_refuses_to_start(self):
+        self.daemon.listen()
+        second = daemon.Daemon(self.daemon.path,
+                               make_backend=self.displays.get)
+        try:
+            second.listen()
+        except daemon.DaemonError as err:
+            assert "already listening" in str(err)
+        else:
+            assert False, "listen() should have raised DaemonError"
+        finally:
+            second.close()
+        assert client.daemon_running(self.daemon.path)
+
+    def test_forward_to_hung_daemon(self):
+        self.daemon.listen()
+        client.TIMEOUT, timeout = 0.01, client.TIMEOUT
+        try:
+            # The daemon accepts the connection but never replies.
+            assert client.forward(["firefox"], ":1",
+                                  path=self.daemon.path) is None
+        finally:
+            client.TIMEOUT = timeout
+
+    def test_forward_without_daemon(self):
+        assert client.forward(["firefox"], ":1", path=self.daemon.path) is None
@@ -0,0 +1,67 @@
+"""Tests for doctor.py."""
+import io
+import json
+import os
+import sys
+
+import flitter.doctor as doctor
+import flitter.fixtures as fixtures
+import flitter.simulator as simulator
+
+
+class TestDoctor(fixtures.TempDirTestCase):
+
+    """Tests for flitter --doctor."""
+
+    def setUp(self):
+        super(TestDoctor, self).setUp()
+        self.set_environ("FLITTER_SOCKET",
+                         os.path.join(self.directory, "flitter.sock"))
+        self.config_path = os.path.join(self.directory, "flitter.json")
+        with open(self.config_path, "w") as file_:
+            file_.write(json.dumps({
+                "ignore": [],
+                "specs": {
+                    "firefox": {"wm_class": {"exact": "Navigator.Firefox"}},
+                    "vim": {"title": ".* - GVIM"},
+                },
+            }))
+        self.sim = simulator.SimulatedBackend.generate(20, latency_ms=2.0)
+
+    def test_measure(self):
+        report = doctor.measure(self.config_path, self.sim, python=None)
+
+        assert report["round_trip_ms"] == 2.0
+        assert report["windows"] == 20
+        assert report["fetch_ms"] >= 2.0
+        assert report["specs"] == 2
+        assert report["unindexed"] == 1
+        assert not report["daemon"]
+        assert doctor.missing_hints(report) == []
+
+    def test_recommendations(self):
+        self.sim.supported.remove("_NET_CLOSE_WINDOW")
+        report = doctor.measure(self.config_path, self.sim, python=None)
+        report["import_ms"] = 60.0
+
+        recommended = doctor.recommendations(report)
+
+        assert "Run flitter-daemon" in recommended[0]
+        assert "flitter --batch" in recommended[1]
+        assert recommended[-1] == (
+            "Your window manager doesn't support _NET_CLOSE_WINDOW, which "
+            "flitter needs for --close-all.")
+
+    def test_run(self):
+        output = io.StringIO()
+
+        result = doctor.run(["--doctor", "-f", self.config_path], output,
+                            ":1", make_backend=lambda display: self.sim,
+                            python=sys.executable)
+
+        assert result is None
+        lines = output.getvalue().splitlines()
+        assert lines[1].startswith("  Starting Python")
+        assert "?" not in lines[1] and "?" not in lines[2]
+        assert lines[4].startswith("  Fetching 20 windows")
+        assert "supports 12 of the 12" in output.getvalue()
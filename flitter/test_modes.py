@@ -0,0 +1,328 @@
+"""Tests for runraisenext's modes other than raise-or-run.
+
+That is --raise-all, --minimize-others, --close-all, --nth, --last, --find,
+--group, --deadline-ms and --confirm-focus, on simulated windows.
+
+"""
+import unittest
+
+import mock
+
+import flitter.runraisenext as runraisenext
+import flitter.simulator as simulator
+
+
+class TestModes(unittest.TestCase):
+
+    def setUp(self):
+        """Keep the most-recently-used list in memory instead of on disk."""
+        self.dumped_object = None
+
+        self.dump_patcher = mock.patch('flitter.runraisenext._dump')
+        mock_dump_function = self.dump_patcher.start()
+
+        def dump_(obj, path):
+            self.dumped_object = obj
+
+        mock_dump_function.side_effect = dump_
+
+        self.load_patcher = mock.patch('flitter.runraisenext._load')
+        mock_load_function = self.load_patcher.start()
+
+        def load_(path):
+            if self.dumped_object is None:
+                raise IOError
+            return self.dumped_object
+
+        mock_load_function.side_effect = load_
+
+        self.sim = simulator.SimulatedBackend()
+
+    def tearDown(self):
+        self.dump_patcher.stop()
+        self.load_patcher.stop()
+
+    def windows(self, *wm_classes_and_titles):
+        """Open the given windows, return all the open windows."""
+        for wm_class, title in wm_classes_and_titles:
+            self.sim.add_window(wm_class, title)
+        return self.sim.windows()
+
+    def test_raise_all(self):
+        """--raise-all should raise all the matching windows in one batch.
+
+        The most recently used matching window should be raised last, so that
+        it ends up focused.
+
+        """
+        firefox_window_1, firefox_window_2, terminal_window = self.windows(
+            ("Navigator.Firefox", "My Firefox Window"),
+            ("Navigator.Firefox", "My Other Firefox Window"),
+            ("Terminal.Terminal", "My Terminal Window"))
+        perform_function = mock.MagicMock()
+        focus_window_function = mock.MagicMock()
+
+        runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox"}, mock.MagicMock(),
+            [firefox_window_1, firefox_window_2, terminal_window],
+            terminal_window, focus_window_function, bulk="raise-all",
+            perform_function=perform_function)
+
+        perform_function.assert_called_once_with(
+            [("raise", firefox_window_2), ("raise", firefox_window_1)])
+        assert not focus_window_function.called
+
+    def test_minimize_others(self):
+        """--minimize-others should minimize the non-matching windows.
+
+        Ignored windows shouldn't be minimized.
+
+        """
+        firefox_window, terminal_window, desktop_window = self.windows(
+            ("Navigator.Firefox", "My Firefox Window"),
+            ("Terminal.Terminal", "My Terminal Window"),
+            ("desktop_window.Nautilus", "Desktop"))
+        perform_function = mock.MagicMock()
+
+        runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox"}, mock.MagicMock(),
+            [firefox_window, terminal_window, desktop_window],
+            firefox_window, mock.MagicMock(),
+            ignore=[dict(wm_class="desktop_window.Nautilus")],
+            bulk="minimize-others", perform_function=perform_function)
+
+        perform_function.assert_called_once_with(
+            [("minimize", terminal_window)])
+
+    def test_close_all(self):
+        """--close-all should close all the matching windows in one batch."""
+        firefox_window_1, firefox_window_2, terminal_window = self.windows(
+            ("Navigator.Firefox", "My Firefox Window"),
+            ("Navigator.Firefox", "My Other Firefox Window"),
+            ("Terminal.Terminal", "My Terminal Window"))
+        perform_function = mock.MagicMock()
+
+        runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox"}, mock.MagicMock(),
+            [firefox_window_1, firefox_window_2, terminal_window],
+            terminal_window, mock.MagicMock(), bulk="close-all",
+            perform_function=perform_function)
+
+        perform_function.assert_called_once_with(
+            [("close", firefox_window_1), ("close", firefox_window_2)])
+
+    def test_nth(self):
+        """--nth should jump straight to the nth most recently used window.
+
+        The windows that were skipped over should end up in the
+        most-recently-used list as if they'd been cycled through, so that
+        cycling on from the nth window goes to the (n+1)th window.
+
+        """
+        windows = self.windows(
+            ("Terminal.Terminal", "Terminal Window"),
+            *[("Navigator.Firefox", "Firefox Window {0}".format(i))
+              for i in range(2, 6)])
+        terminal, firefoxes = windows[0], windows[1:]
+        window_spec = {"wm_class": "Navigator.Firefox"}
+
+        focus_window_function = mock.MagicMock()
+        runraisenext.runraisenext(window_spec, mock.MagicMock(), windows,
+                                  terminal, focus_window_function, nth=3)
+        focus_window_function.assert_called_once_with(firefoxes[2])
+
+        focus_window_function = mock.MagicMock()
+        runraisenext.runraisenext(window_spec, mock.MagicMock(), windows,
+                                  firefoxes[2], focus_window_function)
+        focus_window_function.assert_called_once_with(firefoxes[3])
+
+    def test_last(self):
+        """--last should jump to the least recently used matching window."""
+        terminal, firefox_1, firefox_2 = self.windows(
+            ("Terminal.Terminal", "Terminal Window"),
+            ("Navigator.Firefox", "Firefox Window 1"),
+            ("Navigator.Firefox", "Firefox Window 2"))
+        focus_window_function = mock.MagicMock()
+
+        runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox"}, mock.MagicMock(),
+            [terminal, firefox_1, firefox_2], terminal, focus_window_function,
+            nth=-1)
+
+        focus_window_function.assert_called_once_with(firefox_2)
+
+    def test_find(self):
+        """--find should focus the window whose title best matches."""
+        readme, setup, terminal = self.windows(
+            ("gvim.Gvim", "README.markdown (~/flitter) - GVIM"),
+            ("gvim.Gvim", "setup.py (~/flitter) - GVIM"),
+            ("Terminal.Terminal", "Terminal"))
+        run_function = mock.MagicMock()
+        focus_window_function = mock.MagicMock()
+
+        runraisenext.runraisenext(
+            {}, run_function, [terminal, setup, readme], terminal,
+            focus_window_function, find="flitter readme")
+
+        assert not run_function.called
+        focus_window_function.assert_called_once_with(readme)
+
+    def test_group(self):
+        """--group should start the group's apps that aren't running.
+
+        And raise the first app in the group, if it was already running.
+
+        """
+        firefox_window, terminal_window = self.windows(
+            ("Navigator.Firefox", "Firefox Window"),
+            ("Terminal.Terminal", "Terminal Window"))
+        group = [
+            {"wm_class": "Navigator.Firefox", "command": "firefox"},
+            {"wm_class": "Mail.Thunderbird", "command": "thunderbird"},
+            {"wm_class": "Terminal.Terminal", "command": "gnome-terminal"},
+            {"wm_class": "gvim.Gvim", "command": "gvim"},
+        ]
+        start_function = mock.MagicMock()
+        focus_window_function = mock.MagicMock()
+
+        runraisenext.rungroup(group, start_function,
+                              [terminal_window, firefox_window],
+                              focus_window_function)
+
+        assert start_function.call_args_list == [
+            mock.call("thunderbird"), mock.call("gvim")]
+        focus_window_function.assert_called_once_with(firefox_window)
+
+    def test_group_skips_standby_and_non_normal_windows(self):
+        """--group should only count the windows that handle() would raise.
+
+        """
+        self.sim.add_window("Navigator.Firefox", "Firefox",
+                            types=["_NET_WM_WINDOW_TYPE_DOCK"])
+        self.sim.add_window("Mail.Thunderbird", "Inbox")
+        dock_window, standby_window = self.sim.windows()
+        standby = mock.MagicMock(window_ids=set([standby_window.window_id]))
+        standby.use.return_value = None
+        group = [
+            {"wm_class": "Navigator.Firefox", "command": "firefox"},
+            {"wm_class": "Mail.Thunderbird", "command": "thunderbird"},
+        ]
+        start_function = mock.MagicMock()
+        focus_window_function = mock.MagicMock()
+
+        runraisenext.rungroup(group, start_function,
+                              [dock_window, standby_window],
+                              focus_window_function, normal_only=True,
+                              standby=standby)
+
+        assert start_function.call_args_list == [
+            mock.call("firefox"), mock.call("thunderbird")]
+        assert not focus_window_function.called
+
+    def test_no_launch_after_deadline(self):
+        """The app shouldn't be launched if the deadline has passed.
+
+        Its windows might just have been missed because their attributes
+        didn't arrive in time.
+
+        """
+        terminal_window, = self.windows(
+            ("Terminal.Terminal", "Terminal Window"))
+        deadline = mock.MagicMock()
+        deadline.expired.return_value = True
+        run_function = mock.MagicMock()
+
+        runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox", "command": "firefox"},
+            run_function, [terminal_window], terminal_window,
+            mock.MagicMock(), deadline=deadline)
+
+        assert not run_function.called
+
+    def _run_after_deadline(self, **kwargs):
+        """Run a Firefox command after missing the deadline, with no Firefox
+        windows found, and return the function it'd launch Firefox with.
+
+        """
+        terminal_window, = self.windows(
+            ("Terminal.Terminal", "Terminal Window"))
+        deadline = mock.MagicMock()
+        deadline.expired.return_value = True
+        run_function = mock.MagicMock()
+
+        runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox", "command": "firefox"},
+            run_function, [terminal_window], terminal_window,
+            mock.MagicMock(), deadline=deadline,
+            perform_function=mock.MagicMock(), **kwargs)
+        return run_function
+
+    def test_no_nth_launch_after_deadline(self):
+        assert not self._run_after_deadline(nth=2).called
+
+    def test_no_raise_all_launch_after_deadline(self):
+        assert not self._run_after_deadline(bulk="raise-all").called
+
+    def test_no_group_launch_after_deadline(self):
+        firefox_window, = self.windows(("Navigator.Firefox", "Firefox"))
+        deadline = mock.MagicMock()
+        deadline.expired.return_value = True
+        start_function = mock.MagicMock()
+        focus_window_function = mock.MagicMock()
+
+        runraisenext.rungroup(
+            [{"wm_class": "Navigator.Firefox", "command": "firefox"},
+             {"wm_class": "Mail.Thunderbird", "command": "thunderbird"}],
+            start_function, [firefox_window], focus_window_function,
+            deadline=deadline)
+
+        assert not start_function.called
+        focus_window_function.assert_called_once_with(firefox_window)
+
+    def _exit_status(self, *args):
+        """Return the status that parsing the given arguments exits with."""
+        with mock.patch("sys.stderr"):
+            try:
+                runraisenext.parse_command_line_arguments(
+                    ["-f", "/nonexistent/flitter.json"] + list(args))
+            except SystemExit as exit_:
+                return exit_.code
+        assert False, "Should have exited"
+
+    def test_unknown_group_is_an_error(self):
+        assert self._exit_status("--group", "nonexistent") == 1
+
+    def test_conflicting_arguments_are_usage_errors(self):
+        assert self._exit_status("--find", "readme", "-t", "GVIM") == 2
+        assert self._exit_status("--group", "work", "--find", "readme") == 2
+
+    def test_unconfirmed_focus_not_remembered(self):
+        """Windows that didn't really get focused shouldn't go to the top of
+        the most-recently-used list.
+
+        """
+        terminal_window, firefox_window = self.windows(
+            ("Terminal.Terminal", "Terminal Window"),
+            ("Navigator.Firefox", "Firefox Window"))
+        focus_window_function = mock.MagicMock(return_value=False)
+
+        runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox"}, mock.MagicMock(),
+            [terminal_window, firefox_window], terminal_window,
+            focus_window_function)
+
+        focus_window_function.assert_called_once_with(firefox_window)
+        assert self.dumped_object is None
+
+    @mock.patch('flitter.runraisenext._record_latency')
+    def test_confirm_focus_latency_is_recorded(self, record_latency):
+        sim = simulator.SimulatedBackend(latency_ms=5,
+                                         focus_stealing_prevention=True)
+        sim.add_window("Navigator.Firefox", "Firefox Window")
+        window = sim.windows()[0]
+
+        assert runraisenext.focus_window(window, confirm_timeout_ms=100)
+
+        command, latency = record_latency.call_args[0]
+        assert command == "confirm-focus"
+        assert latency >= 5
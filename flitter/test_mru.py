@@ -0,0 +1,71 @@
+"""Tests for mru.py."""
+import os
+
+import flitter.fixtures as fixtures
+import flitter.mru as mru
+
+
+class Window(object):
+
+    def __init__(self, window_id):
+        self.window_id = window_id
+
+
+class TestJournal(fixtures.TempDirTestCase):
+
+    """Tests for the most-recently-used journal."""
+
+    def setUp(self):
+        super(TestJournal, self).setUp()
+        self.path = os.path.join(self.directory, "flitter.mru")
+
+    def test_moves_are_appended_and_replayed(self):
+        journal = mru.Journal(self.path)
+        journal.move_to_front([1])
+        journal.move_to_front([2])
+        size = os.path.getsize(self.path)
+        journal.move_to_front([3, 1])
+
+        assert journal.window_ids() == [3, 1, 2]
+        assert os.path.getsize(self.path) == size + 2 * 16
+        journal.close()
+        assert mru.Journal(self.path).window_ids() == [3, 1, 2]
+
+    def test_partly_written_record_is_dropped(self):
+        journal = mru.Journal(self.path)
+        journal.move_to_front([1])
+        journal.move_to_front([2])
+        journal.close()
+        with open(self.path, "ab") as file_:
+            file_.write(b"\0" * 5)
+
+        journal = mru.Journal(self.path)
+        journal.move_to_front([1])
+        journal.close()
+
+        assert mru.Journal(self.path).window_ids() == [1, 2]
+
+    def test_sorted(self):
+        journal = mru.Journal(self.path)
+        journal.move_to_front([3, 1, 9])
+        windows = [Window(1), Window(2), Window(3)]
+
+        assert [w.window_id for w in journal.sorted(windows)] == [2, 3, 1]
+        assert journal.window_ids() == [3, 1]
+
+    def test_compact(self):
+        journal = mru.Journal(self.path)
+        for i in range(mru.MIN_COMPACT_RECORDS + 1):
+            journal.move_to_front([i % 3])
+        assert journal.needs_compaction()
+        order = journal.window_ids()
+
+        journal.compact(open_window_ids=[0, 1])
+
+        assert not journal.needs_compaction()
+        assert journal.window_ids() == [w for w in order if w != 2]
+        assert os.path.getsize(self.path) == 2 * 16
+        journal.move_to_front([0])
+        journal.close()
+        assert mru.Journal(self.path).window_ids() == [0] + [
+            w for w in order if w not in (0, 2)]
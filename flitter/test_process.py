@@ -0,0 +1,96 @@
+"""Tests for process.py."""
+import os
+import socket
+import subprocess
+import time
+import unittest
+
+import mock
+
+import flitter.process as process
+import flitter.simulator as simulator
+
+
+class TestProcessCache(unittest.TestCase):
+
+    """Tests for looking processes up through /proc."""
+
+    def setUp(self):
+        self.cache = process.ProcessCache()
+        self.children = []
+
+    def tearDown(self):
+        for child in self.children:
+            child.kill()
+            child.wait()
+
+    def spawn(self, command):
+        child = subprocess.Popen(command)
+        self.children.append(child)
+        return child
+
+    def test_lookup(self):
+        info = self.cache.lookup(os.getpid())
+
+        assert info.exe == os.readlink("/proc/self/exe")
+        assert info.ppid == os.getppid()
+
+    def test_processes_are_read_once(self):
+        self.cache.lookup(os.getpid())
+        self.cache.lookup(os.getpid())
+
+        assert (self.cache.misses, self.cache.hits) == (1, 1)
+
+    def test_reused_pids_are_read_again(self):
+        info = self.cache.lookup(os.getpid())
+        with mock.patch('flitter.process._stat') as stat:
+            stat.return_value = (info.ppid, info.start_time + 1, info.name)
+            self.cache.lookup(os.getpid())
+
+        assert self.cache.misses == 2
+
+    def test_exec_is_noticed(self):
+        info = self.cache.lookup(os.getpid())
+        with mock.patch('flitter.process._stat') as stat:
+            stat.return_value = (info.ppid, info.start_time, "vim")
+            self.cache.lookup(os.getpid())
+
+        assert self.cache.misses == 2
+
+    def test_exited_processes_are_forgotten(self):
+        child = self.spawn(["sleep", "10"])
+        for i in range(100):
+            if self.cache.lookup(child.pid).cmdline == "sleep 10":
+                break
+            time.sleep(0.01)
+        assert len(self.cache) == 1
+
+        child.kill()
+        child.wait()
+
+        assert self.cache.lookup(child.pid) is None
+        assert len(self.cache) == 0
+
+    def test_foreground(self):
+        child = self.spawn(["sh", "-c", "sleep 10; true"])
+        for i in range(100):
+            foreground = self.cache.foreground(child.pid)
+            if foreground is not None and foreground.cmdline == "sleep 10":
+                break
+            time.sleep(0.01)
+
+        assert foreground.cmdline == "sleep 10"
+        assert self.cache.is_descendant(foreground.pid, os.getpid())
+
+    def test_window_attributes(self):
+        sim = simulator.SimulatedBackend()
+        sim.add_window("Navigator.Firefox", "Firefox", pid=os.getpid(),
+                       machine=socket.gethostname())
+        sim.add_window("Navigator.Firefox", "Firefox", pid=os.getpid(),
+                       machine="elsewhere")
+        local, remote = sim.windows()
+
+        assert local.exe == os.readlink("/proc/self/exe")
+        assert local.cwd == os.getcwd()
+        assert remote.exe is None
+        assert remote.cmdline is None
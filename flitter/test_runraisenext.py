@@ -485,5 +485,3 @@ class TestRunRaiseNext(object):
         focused_window = request_other(focused_window, other_window_2)
         focused_window = request_other(focused_window, other_window_3)
         focused_window = request_other(focused_window, other_window_1)
-
-    # TODO: Tests for all the command-line options.
@@ -0,0 +1,222 @@
+"""Tests for simulator.py and the shared code in backend.py."""
+import select
+
+import mock
+
+import flitter.backend as backend
+import flitter.config as config
+import flitter.deadline as deadline
+import flitter.runraisenext as runraisenext
+import flitter.simulator as simulator
+
+
+class TestSimulatedBackend(object):
+
+    """Tests for the simulated window system."""
+
+    def test_generate_is_deterministic(self):
+        titles_1 = [w.title for w in
+                    simulator.SimulatedBackend.generate(50, seed=1).windows()]
+        titles_2 = [w.title for w in
+                    simulator.SimulatedBackend.generate(50, seed=1).windows()]
+
+        assert len(titles_1) == 50
+        assert titles_1 == titles_2
+
+    def test_window_attributes(self):
+        sim = simulator.SimulatedBackend()
+        window_id = sim.add_window("Navigator.Firefox", "Inbox - Firefox",
+                                   desktop=2, pid=42)
+
+        window = sim.windows()[0]
+
+        assert window.window_id == window_id
+        assert window.wm_class == "Navigator.Firefox"
+        assert window.title == "Inbox - Firefox"
+        assert window.desktop == 2
+        assert window.pid == 42
+
+    def test_properties_are_pipelined(self):
+        """Fetching all windows should cost two round trips, however many."""
+        sim = simulator.SimulatedBackend.generate(1000, latency_ms=5)
+
+        windows = sim.windows()
+
+        assert len(windows) == 1000
+        assert sim.round_trips == 2
+        assert sim.now == 0.01
+
+    def test_slow_windows_miss_the_deadline(self):
+        sim = simulator.SimulatedBackend(latency_ms=5)
+        fast = sim.add_window("Navigator.Firefox", "Firefox")
+        slow = sim.add_window("gvim.Gvim", "GVIM")
+        sim.slow[slow] = 100
+
+        windows = sim.windows(deadline=deadline.Deadline(50, clock=sim.clock))
+
+        assert [w.window_id for w in windows] == [fast, slow]
+        assert windows[0].title == "Firefox"
+        assert windows[1].title is None
+        assert sim.now <= 0.05
+
+    def test_root_window_round_trips_miss_the_deadline(self):
+        sim = simulator.SimulatedBackend(latency_ms=5)
+        sim.add_window("Navigator.Firefox", "Firefox")
+        sim.active = sim.client_ids()[0]
+        windows = sim.windows()
+
+        assert sim.focused_window(windows, deadline=deadline.Deadline(
+            50, clock=sim.clock)) is windows[0]
+        assert sim.focused_window(windows, deadline=deadline.Deadline(
+            2, clock=sim.clock)) is None
+        assert sim.current_desktop(deadline=deadline.Deadline(
+            2, clock=sim.clock)) is None
+
+    def test_confirmed_focus_retries_as_pager(self):
+        sim = simulator.SimulatedBackend(focus_stealing_prevention=True)
+        sim.add_window("Navigator.Firefox", "Firefox")
+        window = sim.windows()[0]
+
+        latency = window.focus(confirm_timeout_ms=100)
+
+        assert sim.active == window.window_id
+        assert latency is not None
+
+    def test_unconfirmed_focus(self):
+        sim = simulator.SimulatedBackend(focus_stealing_prevention=True)
+        sim.add_window("Navigator.Firefox", "Firefox")
+        sim.add_window("Navigator.Firefox", "Firefox")
+        window = sim.windows()[0]
+        # Make the window manager drop pager requests too.
+        sim.activate = lambda window_id: None
+
+        assert window.focus(confirm_timeout_ms=100) is None
+        assert sim.now >= 0.2
+
+    def test_perform(self):
+        sim = simulator.SimulatedBackend()
+        sim.add_window("Navigator.Firefox", "Firefox")
+        sim.add_window("Terminal.Terminal", "Terminal")
+        firefox, terminal = sim.windows()
+
+        sim.perform([("minimize", firefox), ("close", terminal)])
+
+        assert [w.window_id for w in sim.windows()] == [firefox.window_id]
+        assert sim.windows()[0].minimized
+
+    def test_events(self):
+        sim = simulator.SimulatedBackend()
+        window_id = sim.add_window("Navigator.Firefox", "Firefox")
+        sim.subscribe([window_id])
+
+        sim.set_title(window_id, "Inbox - Firefox")
+        readable, _, _ = select.select([sim.fileno()], [], [], 0)
+
+        assert readable
+        assert sim.events() == [
+            backend.Event("property", window_id, "_NET_WM_NAME")]
+        assert sim.events() == []
+        sim.close()
+
+    def test_events_read_while_confirming_focus_are_kept(self):
+        sim = simulator.SimulatedBackend(focus_stealing_prevention=True)
+        window_id = sim.add_window("Navigator.Firefox", "Firefox")
+        sim.subscribe([window_id])
+        sim.set_title(window_id, "Inbox - Firefox")
+
+        assert sim.windows()[0].focus(confirm_timeout_ms=100) is not None
+
+        events = sim.pending_events()
+        assert events.count(
+            backend.Event("property", window_id, "_NET_WM_NAME")) == 1
+        assert sim.pending_events() == []
+
+    def test_runraisenext_current_desktop(self):
+        sim = simulator.SimulatedBackend()
+        sim.add_window("Navigator.Firefox", "Firefox", desktop=1)
+        on_current_desktop = sim.add_window("Navigator.Firefox", "Firefox")
+        open_windows = sim.windows()
+
+        matching = runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox"}, None, open_windows, None,
+            None, current_desktop=True, return_matching=True, backend=sim)
+
+        assert [w.window_id for w in matching] == [on_current_desktop]
+
+    def test_window_type_and_state_filters(self):
+        sim = simulator.SimulatedBackend()
+        sim.add_window("xfce4-panel.Xfce4-panel", "Panel",
+                       types=["_NET_WM_WINDOW_TYPE_DOCK"])
+        normal = sim.add_window("Navigator.Firefox", "Firefox",
+                                types=["_NET_WM_WINDOW_TYPE_NORMAL"])
+        untyped = sim.add_window("Navigator.Firefox", "Firefox")
+        sim.add_window("Navigator.Firefox", "Firefox",
+                       states=["_NET_WM_STATE_SKIP_TASKBAR"])
+        urgent = sim.add_window("Navigator.Firefox", "Firefox",
+                                states=["_NET_WM_STATE_DEMANDS_ATTENTION"])
+        open_windows = sim.windows()
+
+        matching = runraisenext.runraisenext(
+            {"wm_class": ".*"}, None, open_windows, None, None,
+            return_matching=True, normal_only=True, ignore_skip_taskbar=True,
+            urgent_first=True)
+
+        assert [w.window_id for w in matching] == [urgent, normal, untyped]
+        # The windows' types and states came in the same batch as everything
+        # else.
+        assert sim.round_trips == 2
+
+    @mock.patch('flitter.runraisenext._dump')
+    @mock.patch('flitter.runraisenext._load')
+    def test_raise_stops_at_first_matching_window(self, load, dump):
+        """Raising an app that isn't focused shouldn't test every window."""
+        class CountingSpec(config.WindowSpec):
+            calls = 0
+
+            def matches(self, window):
+                CountingSpec.calls += 1
+                return super(CountingSpec, self).matches(window)
+
+        load.return_value = []
+        sim = simulator.SimulatedBackend()
+        for i in range(100):
+            sim.add_window("Navigator.Firefox", "Firefox")
+        terminal = sim.add_window("Terminal.Terminal", "Terminal")
+        open_windows = sim.windows()
+        focused = [w for w in open_windows if w.window_id == terminal][0]
+        focused_ids = []
+
+        runraisenext.runraisenext(
+            CountingSpec(wm_class="Navigator.Firefox"), None, open_windows,
+            focused, lambda window: focused_ids.append(window.window_id))
+
+        assert len(focused_ids) == 1
+        # Once for the focused window and once for the first Firefox window,
+        # not once for each of the 100 Firefox windows.
+        assert CountingSpec.calls == 2
+
+    @mock.patch('flitter.runraisenext._dump')
+    @mock.patch('flitter.runraisenext._load')
+    def test_loop_to_next_window(self, load, dump):
+        sim = simulator.SimulatedBackend()
+        first = sim.add_window("Navigator.Firefox", "Firefox")
+        second = sim.add_window("Navigator.Firefox", "Firefox")
+        terminal = sim.add_window("Terminal.Terminal", "Terminal")
+        load.return_value = [first, second, terminal]
+        open_windows = sim.windows()
+        focused_ids = []
+
+        runraisenext.runraisenext(
+            {"wm_class": "Navigator.Firefox"}, None, open_windows,
+            open_windows[0], lambda window: focused_ids.append(
+                window.window_id))
+
+        assert focused_ids == [second]
+
+    def test_unknown_backend(self):
+        try:
+            backend.get_backend("nonexistent")
+        except backend.BackendError:
+            pass
+        else:
+            assert False, "get_backend() should have raised BackendError"
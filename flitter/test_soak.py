@@ -0,0 +1,69 @@
+"""Tests for soak.py."""
+import io
+
+import mock
+
+import flitter.fixtures as fixtures
+import flitter.soak as soak
+
+
+class TestSoak(fixtures.TempDirTestCase):
+
+    """Tests for the soak test harness."""
+
+    def test_short_soak_keeps_state_fresh(self):
+        report = soak.run(duration=600, segments=3, windows=20, terminals=3,
+                          churn_hz=1.0)
+
+        assert report["commands"] > 0
+        assert [segment["mismatches"] for segment in report["segments"]] == [
+            [], [], []]
+
+    def test_stale_cache_is_a_mismatch(self):
+        run = soak.Soak(self.directory, windows=10, terminals=2)
+        try:
+            run._command()
+            # Change a window behind the daemon's back, without an event.
+            window_id = run.sim.client_ids()[0]
+            run.sim._windows[window_id]['_NET_WM_NAME'] = 'Changed'
+
+            assert "cached windows differ from the open windows" in (
+                run.mismatches())
+        finally:
+            run.close()
+
+    def test_unjournaled_mru_order_is_a_mismatch(self):
+        run = soak.Soak(self.directory, windows=10, terminals=2)
+        try:
+            run._command()
+            assert run.mismatches() == []
+            # Reorder the daemon's list without writing it to the journal.
+            journal = run.daemon.displays[soak.DISPLAY].mru
+            journal._window_ids = run.sim.client_ids()[::-1]
+
+            assert "the most-recently-used order is stale" in (
+                run.mismatches())
+        finally:
+            run.close()
+
+    def test_main_with_segments_without_commands(self):
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            assert soak.main(["--hours", "0.01", "--command-hz", "0"]) == 0
+
+        assert "p50      - ms" in stdout.getvalue()
+
+    def test_check(self):
+        def segment(p95, memory):
+            return {"time": 0, "p50": 1.0, "p95": p95, "memory": memory,
+                    "mismatches": []}
+
+        steady = {"segments": [segment(50.0, 0), segment(5.0, 1000),
+                               segment(6.0, 2000)]}
+        drifting = {"segments": [segment(5.0, 0), segment(5.0, 1000),
+                                 segment(50.0, 10 ** 7)]}
+
+        assert soak.check(steady) == []
+        problems = soak.check(drifting)
+        assert len(problems) == 2
+        assert "p95 latency drifted" in problems[0]
+        assert "Memory grew" in problems[1]
@@ -0,0 +1,69 @@
+"""Tests for stats.py."""
+import os
+
+import flitter.fixtures as fixtures
+import flitter.stats as stats
+
+
+class TestStats(fixtures.TempDirTestCase):
+
+    """Tests for collecting and summarizing statistics."""
+
+    def setUp(self):
+        super(TestStats, self).setUp()
+        self.path = os.path.join(self.directory, "flitter.stats")
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+
+        assert stats.percentile(samples, 50) == 50
+        assert stats.percentile(samples, 99) == 99
+        assert stats.percentile(samples, 100) == 100
+        assert stats.percentile([], 50) is None
+
+    def test_latencies_are_bounded(self):
+        """Only the most recent samples of each command should be kept."""
+        stats_ = stats.Stats(size=10)
+
+        for latency in range(100):
+            stats_.record("raise", latency, window_count=5)
+
+        summary = stats_.summary()["commands"]["raise"]
+        assert summary["count"] == 10
+        assert summary["max"] == 99
+        assert stats_.summary()["window_count"] == 5
+
+    def test_cache_hit_rates(self):
+        class Cache(object):
+            hits = 3
+            misses = 1
+        stats_ = stats.Stats()
+
+        stats_.add_cache("classifier", Cache())
+
+        assert stats_.summary()["caches"]["classifier"]["hit_rate"] == 0.75
+
+    def test_stats_file_wraps_around(self):
+        """The stats file should keep only the most recent records."""
+        stats_file = stats.StatsFile(self.path, slots=4)
+
+        for latency in range(10):
+            stats_file.append("raise", latency, 10, 2048)
+
+        assert os.path.getsize(self.path) == (
+            stats._HEADER.size + 4 * stats._RECORD.size)
+        summary = stats_file.read().summary()
+        assert summary["commands"]["raise"]["count"] == 4
+        assert summary["commands"]["raise"]["max"] == 9
+        assert summary["rss_kb"] == 2048
+
+    def test_format_summary(self):
+        stats_ = stats.Stats()
+        stats_.record("raise", 12.5, window_count=3)
+        stats_.count_event("PropertyNotify")
+
+        text = stats.format_summary(stats_.summary())
+
+        assert "raise" in text
+        assert "PropertyNotify events: 1" in text
+        assert "windows: 3" in text
@@ -0,0 +1,67 @@
+"""Tests for window_index.py."""
+import flitter.window_index as window_index
+
+
+class Window(object):
+
+    """A minimal stand-in for a window object."""
+
+    def __init__(self, window_id, wm_class, title):
+        self.window_id = window_id
+        self.wm_class = wm_class
+        self.title = title
+
+
+class TestWindowIndex(object):
+
+    """Tests for the WindowIndex class."""
+
+    def test_search_matches_all_query_words(self):
+        readme = Window(1, "gvim.Gvim", "README.markdown (~/flitter) - GVIM")
+        setup = Window(2, "gvim.Gvim", "setup.py (~/flitter) - GVIM")
+        firefox = Window(3, "Navigator.Firefox", "flitter - GitHub")
+        index = window_index.WindowIndex([readme, setup, firefox])
+
+        assert index.search("flitter readme") == [readme]
+        assert set(w.window_id for w in index.search("gvim flit")) == set(
+            [1, 2])
+        assert index.search("thunderbird") == []
+
+    def test_search_ranks_by_match_quality_then_mru(self):
+        exact = Window(1, "Navigator.Firefox", "Fire safety")
+        prefix_1 = Window(2, "Navigator.Firefox", "Firefox")
+        prefix_2 = Window(3, "Navigator.Firefox", "Firefox")
+        substring = Window(4, "Terminal.Terminal", "campfire")
+        index = window_index.WindowIndex([exact, prefix_1, prefix_2,
+                                          substring])
+
+        results = index.search("fire", mru_order=[substring, prefix_2,
+                                                  prefix_1, exact])
+
+        assert results == [exact, prefix_2, prefix_1, substring]
+
+    def test_short_query_words(self):
+        """Query words too short for the trigram index should still work."""
+        vim = Window(1, "gvim.Gvim", "vi")
+        index = window_index.WindowIndex([vim])
+
+        assert index.search("vi") == [vim]
+
+    def test_update_reindexes_changed_titles(self):
+        terminal = Window(1, "Terminal.Terminal", "vim README")
+        index = window_index.WindowIndex([terminal])
+
+        terminal.title = "htop"
+        index.update(terminal)
+
+        assert index.search("vim") == []
+        assert index.search("htop") == [terminal]
+
+    def test_remove(self):
+        terminal = Window(1, "Terminal.Terminal", "htop")
+        index = window_index.WindowIndex([terminal])
+
+        index.remove(1)
+
+        assert index.search("htop") == []
+        assert len(index) == 0
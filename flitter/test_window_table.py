@@ -0,0 +1,93 @@
+"""Tests for window_table.py."""
+import os
+
+import mock
+
+import flitter.fixtures as fixtures
+import flitter.window_table as window_table
+
+
+def entry(window_id, title="Firefox", specs=(0,)):
+    return window_table.Entry(window_id, 0, 42, 0, window_table.NORMAL,
+                              "Navigator.Firefox", title, list(specs))
+
+
+class TestWindowTable(fixtures.TempDirTestCase):
+
+    """Tests for writing and reading window tables."""
+
+    def setUp(self):
+        super(TestWindowTable, self).setUp()
+        self.path = os.path.join(self.directory, "flitter-:1.table")
+        self.writer = window_table.TableWriter(self.path)
+
+    def tearDown(self):
+        self.writer.close()
+        super(TestWindowTable, self).tearDown()
+
+    def test_round_trip(self):
+        self.writer.write("/flitter.json", ["firefox", "vim"], [
+            entry(1), window_table.Entry(2, None, None, 1, 0, None, None, [])])
+
+        table = window_table.read(self.path)
+
+        assert table.config_path == "/flitter.json"
+        assert table.aliases == ["firefox", "vim"]
+        assert table.entries == [
+            window_table.Entry(1, 0, 42, 0, window_table.NORMAL,
+                               "Navigator.Firefox", "Firefox", ("firefox",)),
+            window_table.Entry(2, None, None, 1, 0, None, None, ())]
+
+    def test_table_grows(self):
+        entries = [entry(i, title="x" * 1000) for i in range(200)]
+
+        self.writer.write(None, ["firefox"], entries)
+
+        assert len(window_table.read(self.path).entries) == 200
+
+    def test_reader_retries_while_the_writer_is_writing(self):
+        self.writer.write(None, ["firefox"], [entry(1)])
+        # Leave the sequence number odd, as if the writer had died mid-write.
+        window_table._SEQUENCE.pack_into(
+            self.writer._map, window_table._SEQUENCE_OFFSET, 3)
+
+        try:
+            window_table.read(self.path)
+        except window_table.TableError:
+            pass
+        else:
+            assert False, "read() should have raised TableError"
+
+    def test_header_is_written_while_the_sequence_is_odd(self):
+        """A reader that sees an even sequence number mustn't see the lengths
+        and counts of a table that's still being written."""
+        header = window_table._HEADER
+        sequences = []
+
+        def pack_into(buffer_, offset, *values):
+            # The sequence number in the table and in the new header.
+            sequences.append((window_table._SEQUENCE.unpack_from(
+                buffer_, window_table._SEQUENCE_OFFSET)[0], values[2]))
+            header.pack_into(buffer_, offset, *values)
+
+        with mock.patch('flitter.window_table._HEADER',
+                        mock.Mock(size=header.size, pack_into=pack_into)):
+            self.writer.write(None, ["firefox"], [entry(1)])
+            self.writer.write(None, ["firefox"], [entry(1), entry(2)])
+
+        assert sequences == [(1, 1), (3, 3)]
+        assert len(window_table.read(self.path).entries) == 2
+
+    @mock.patch('flitter.window_table._writer_is_alive')
+    def test_stale_table(self, writer_is_alive):
+        writer_is_alive.return_value = False
+        self.writer.write(None, ["firefox"], [entry(1)])
+
+        assert window_table.read(self.path) is None
+
+    def test_no_table(self):
+        assert window_table.read(self.path + ".missing") is None
+
+    def test_table_path(self):
+        assert window_table.table_path(":0", "/run/user/1000/flitter.sock") \
+            == "/run/user/1000/flitter-:0.table"
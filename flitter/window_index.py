@@ -0,0 +1,159 @@
+"""A search index over open windows' titles and WM_CLASSes."""
+import re
+
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# How much each kind of match between a query word and a window word is
+# worth. Better kinds of match outrank any number of worse ones for the same
+# query word.
+_EXACT_SCORE = 3
+_PREFIX_SCORE = 2
+_SUBSTRING_SCORE = 1
+
+
+def _words(text):
+    """Return the list of lowercased words in the given text."""
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _trigrams(word):
+    """Return the set of three-letter substrings of the given word."""
+    return set(word[i:i + 3] for i in range(len(word) - 2))
+
+
+def _match_score(query_word, words):
+    """Return how well query_word matches the best of the given words."""
+    score = 0
+    for word in words:
+        if word == query_word:
+            return _EXACT_SCORE
+        elif word.startswith(query_word):
+            score = max(score, _PREFIX_SCORE)
+        elif query_word in word:
+            score = max(score, _SUBSTRING_SCORE)
+    return score
+
+
+class WindowIndex(object):
+
+    """A trigram index over the titles and WM_CLASSes of windows.
+
+    The index is updated incrementally: add(), update() and remove() only
+    touch the index entries of the one window, so a long-running process can
+    keep the index current as windows open, close and change their titles.
+
+    """
+
+    def __init__(self, windows=()):
+        self._windows = {}
+        self._words = {}
+        self._trigrams = {}
+        for window in windows:
+            self.add(window)
+
+    def __len__(self):
+        return len(self._windows)
+
+    def _text(self, window):
+        return u'{0} {1}'.format(window.title or '', window.wm_class or '')
+
+    def add(self, window):
+        """Add the given window to the index."""
+        if window.window_id in self._windows:
+            self.remove(window.window_id)
+        words = _words(self._text(window))
+        self._windows[window.window_id] = window
+        self._words[window.window_id] = (self._text(window), words)
+        for word in words:
+            for trigram in _trigrams(word):
+                self._trigrams.setdefault(trigram, set()).add(
+                    window.window_id)
+
+    def update(self, window):
+        """Re-index the given window if its title or WM_CLASS has changed."""
+        indexed = self._words.get(window.window_id)
+        if indexed is not None and indexed[0] == self._text(window):
+            self._windows[window.window_id] = window
+            return
+        self.add(window)
+
+    def remove(self, window_id):
+        """Remove the window with the given ID from the index."""
+        if window_id not in self._windows:
+            return
+        del self._windows[window_id]
+        _, words = self._words.pop(window_id)
+        for word in words:
+            for trigram in _trigrams(word):
+                window_ids = self._trigrams.get(trigram)
+                if window_ids is None:
+                    continue
+                window_ids.discard(window_id)
+                if not window_ids:
+                    del self._trigrams[trigram]
+
+    def _candidates(self, query_word):
+        """Return the IDs of windows that might contain query_word."""
+        trigrams = _trigrams(query_word)
+        if not trigrams:
+            # Too short to use the index, every window is a candidate.
+            return set(self._windows)
+        candidates = None
+        for trigram in trigrams:
+            window_ids = self._trigrams.get(trigram, set())
+            if candidates is None:
+                candidates = set(window_ids)
+            else:
+                candidates &= window_ids
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, query, mru_order=None):
+        """Return the windows that match the given query, best match first.
+
+        A window matches if every word in the query appears in its title or
+        WM_CLASS, either as a whole word, the start of a word or anywhere
+        within a word. Windows are ranked by how well they match and, among
+        equally good matches, by most-recently-used order.
+
+        :param query: the search query, e.g. "flitter readme"
+        :type query: string
+
+        :param mru_order: the open windows in most-recently-used order
+            (optional)
+        :type mru_order: list of Window objects
+
+        :rtype: list of Window objects
+
+        """
+        query_words = _words(query)
+        if not query_words:
+            return []
+
+        candidates = None
+        for query_word in query_words:
+            window_ids = self._candidates(query_word)
+            candidates = (window_ids if candidates is None
+                          else candidates & window_ids)
+
+        mru_ranks = {}
+        for rank, window in enumerate(mru_order or ()):
+            mru_ranks.setdefault(window.window_id, rank)
+
+        results = []
+        for window_id in candidates:
+            words = self._words[window_id][1]
+            score = 0
+            for query_word in query_words:
+                word_score = _match_score(query_word, words)
+                if not word_score:
+                    break
+                score += word_score
+            else:
+                rank = mru_ranks.get(window_id, len(mru_ranks))
+                results.append((-score, rank, window_id))
+
+        return [self._windows[window_id] for _, _, window_id
+                in sorted(results)]
@@ -0,0 +1,277 @@
+"""A shared-memory table of open windows, published by flitter-daemon.
+
+Read-only consumers (``flitter --print-matching``, panels, scripts) can read
+the daemon's current view of a display's windows straight out of a memory
+mapped file, without a request to the daemon and without any X traffic.
+
+The file is a header followed by the table's data::
+
+    header: magic "FLWT", layout version, sequence number, writer's pid,
+            data length, window count, alias count
+    data:   the config file's path, the config's aliases (sorted), and one
+            record per window in _NET_CLIENT_LIST order
+
+All integers are little-endian and strings are UTF-8, prefixed with their
+length (NONE_LENGTH for None).
+
+The sequence number makes the table a seqlock: the writer makes it odd
+before changing the table and even again afterwards, and readers retry
+if it was odd, or changed, while they were reading. Readers never block the
+writer and never see a half-written table.
+
+"""
+import collections
+import errno
+import mmap
+import os
+import struct
+
+from flitter import client
+
+
+_MAGIC = b'FLWT'
+_LAYOUT_VERSION = 2
+_HEADER = struct.Struct('<4sIQiIII')
+_SEQUENCE_OFFSET = 8
+_SEQUENCE = struct.Struct('<Q')
+_RECORD = struct.Struct('<IiiIBH')
+_LENGTH = struct.Struct('<H')
+
+#: The length that marks a string as None.
+NONE_LENGTH = 0xFFFF
+
+#: The size that table files start at, they grow as needed.
+INITIAL_SIZE = 64 * 1024
+
+#: How many times readers retry when the table changes under them.
+READ_ATTEMPTS = 100
+
+#: Window flags.
+NORMAL = 1
+MINIMIZED = 2
+SKIP_TASKBAR = 4
+URGENT = 8
+IGNORED = 16
+STANDBY = 32
+
+#: One window in the table.
+#:
+#: ``mru_rank`` is the window's position in the most-recently-used list (0 is
+#: the most recently used), ``flags`` are the flags above and ``specs`` are
+#: the aliases of the window specs that the window matches.
+Entry = collections.namedtuple(
+    'Entry', 'window_id desktop pid mru_rank flags wm_class title specs')
+
+#: A consistent snapshot of a table.
+Table = collections.namedtuple('Table', 'config_path aliases entries')
+
+
+class TableError(Exception):
+    pass
+
+
+def table_path(display, socket_path=None):
+    """Return the path to the given display's window table.
+
+    Tables are kept next to the daemon's socket.
+
+    """
+    socket_path = socket_path or client.socket_path()
+    directory, name = os.path.split(socket_path)
+    name = os.path.splitext(name)[0]
+    display = (display or "").replace("/", "_")
+    return os.path.join(directory, "{0}-{1}.table".format(name, display))
+
+
+def _pack_string(string, limit=NONE_LENGTH - 1):
+    if string is None:
+        return _LENGTH.pack(NONE_LENGTH)
+    data = string.encode("utf-8", "replace")[:limit]
+    return _LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(buffer_, offset):
+    length, = _LENGTH.unpack_from(buffer_, offset)
+    offset += _LENGTH.size
+    if length == NONE_LENGTH:
+        return None, offset
+    return (buffer_[offset:offset + length].decode("utf-8", "replace"),
+            offset + length)
+
+
+def window_flags(window, ignored=False, standby=False):
+    """Return the table flags of the given Window object.
+
+    :param ignored: whether the window matches the config's ignore list
+    :param standby: whether the window is a standby window, see standby.py
+
+    """
+    flags = 0
+    if window.normal:
+        flags |= NORMAL
+    if window.minimized:
+        flags |= MINIMIZED
+    if window.skip_taskbar:
+        flags |= SKIP_TASKBAR
+    if window.urgent:
+        flags |= URGENT
+    if ignored:
+        flags |= IGNORED
+    if standby:
+        flags |= STANDBY
+    return flags
+
+
+class TableWriter(object):
+
+    """The writing end of a window table."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        os.ftruncate(self._fd, INITIAL_SIZE)
+        self._map = mmap.mmap(self._fd, INITIAL_SIZE, mmap.MAP_SHARED,
+                              mmap.PROT_READ | mmap.PROT_WRITE)
+        self._sequence = 0
+        _HEADER.pack_into(self._map, 0, _MAGIC, _LAYOUT_VERSION,
+                          self._sequence, os.getpid(), 0, 0, 0)
+
+    def write(self, config_path, aliases, entries):
+        """Replace the table's contents.
+
+        :param config_path: the path of the config file that the windows were
+            classified with, or None
+        :param aliases: the config's aliases, sorted
+        :type aliases: list of strings
+        :param entries: the windows
+        :type entries: list of Entry, with specs given as indices into
+            aliases
+
+        """
+        parts = [_pack_string(config_path)]
+        parts.extend(_pack_string(alias) for alias in aliases)
+        for entry in entries:
+            specs = entry.specs
+            parts.append(_RECORD.pack(
+                entry.window_id,
+                -1 if entry.desktop is None else entry.desktop,
+                -1 if entry.pid is None else entry.pid,
+                entry.mru_rank, entry.flags, len(specs)))
+            parts.append(_pack_string(entry.wm_class))
+            parts.append(_pack_string(entry.title))
+            parts.append(struct.pack('<{0}H'.format(len(specs)), *specs))
+        data = b''.join(parts)
+
+        size = _HEADER.size + len(data)
+        if size > len(self._map):
+            new_size = max(size, len(self._map) * 2)
+            os.ftruncate(self._fd, new_size)
+            self._map.resize(new_size)
+
+        # The whole header, with its lengths and counts, is written while the
+        # sequence number is still odd. Making it even is the last write, so
+        # a reader that sees the even number sees everything before it.
+        self._sequence += 1
+        _SEQUENCE.pack_into(self._map, _SEQUENCE_OFFSET, self._sequence)
+        self._map[_HEADER.size:size] = data
+        _HEADER.pack_into(self._map, 0, _MAGIC, _LAYOUT_VERSION,
+                          self._sequence, os.getpid(), len(data),
+                          len(entries), len(aliases))
+        self._sequence += 1
+        _SEQUENCE.pack_into(self._map, _SEQUENCE_OFFSET, self._sequence)
+
+    def close(self):
+        """Close and remove the table, so that readers don't use stale data."""
+        self._map.close()
+        os.close(self._fd)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def _writer_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        # EPERM means it's alive but it's someone else's process.
+        return err.errno == errno.EPERM
+    return True
+
+
+def _parse(buffer_, alias_count, window_count, offset):
+    config_path, offset = _unpack_string(buffer_, offset)
+    aliases = []
+    for i in range(alias_count):
+        alias, offset = _unpack_string(buffer_, offset)
+        aliases.append(alias)
+    entries = []
+    for i in range(window_count):
+        window_id, desktop, pid, mru_rank, flags, spec_count = (
+            _RECORD.unpack_from(buffer_, offset))
+        offset += _RECORD.size
+        wm_class, offset = _unpack_string(buffer_, offset)
+        title, offset = _unpack_string(buffer_, offset)
+        specs = struct.unpack_from('<{0}H'.format(spec_count), buffer_,
+                                   offset)
+        offset += 2 * spec_count
+        entries.append(Entry(
+            window_id, None if desktop == -1 else desktop,
+            None if pid == -1 else pid, mru_rank, flags, wm_class, title,
+            tuple(aliases[index] for index in specs)))
+    return Table(config_path, aliases, entries)
+
+
+def read(path):
+    """Read a consistent snapshot of the window table at the given path.
+
+    Returns None if there's no table there, or if the daemon that wrote it
+    isn't running any more.
+
+    :raises TableError: if the table is corrupt, or kept changing while it
+        was being read
+
+    :rtype: Table
+
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        map_ = None
+        for attempt in range(READ_ATTEMPTS):
+            if map_ is None:
+                size = os.fstat(fd).st_size
+                if size < _HEADER.size:
+                    return None
+                map_ = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ)
+            (magic, version, sequence, pid, length, window_count,
+             alias_count) = _HEADER.unpack_from(map_, 0)
+            if magic != _MAGIC or version != _LAYOUT_VERSION:
+                raise TableError("{0} isn't a flitter window table".format(
+                    path))
+            if not _writer_is_alive(pid):
+                return None
+            if sequence % 2:
+                # The writer is in the middle of writing.
+                continue
+            if _HEADER.size + length > len(map_):
+                # The table has grown since we mapped it.
+                map_.close()
+                map_ = None
+                continue
+            try:
+                table = _parse(map_, alias_count, window_count, _HEADER.size)
+            except (struct.error, IndexError, UnicodeDecodeError):
+                table = None
+            if _SEQUENCE.unpack_from(map_, _SEQUENCE_OFFSET)[0] == sequence:
+                if table is None:
+                    raise TableError("{0} is corrupt".format(path))
+                return table
+        raise TableError("{0} kept changing while it was being read".format(
+            path))
+    finally:
+        if map_ is not None:
+            map_.close()
+        os.close(fd)
@@ -0,0 +1,272 @@
+"""The xcffib (XCB) backend.
+
+XCB hands back a cookie for every request without waiting for its reply, so
+all of a batch's requests are pipelined: sent together, with replies read
+afterwards. Unlike python-xlib it can also check for a reply without
+blocking, which is what deadlines need.
+
+"""
+import logging
+import select
+import struct
+
+try:
+    import xcffib
+    import xcffib.xproto as xproto
+except ImportError:  # pragma: no cover
+    xcffib = None
+
+from flitter import backend
+
+log = logging.getLogger(__name__)
+
+#: The X protocol's ClientMessage event (format 32): response type, format,
+#: sequence number, window, message type and five 32-bit data items.
+_CLIENT_MESSAGE = struct.Struct('=BBHII5I')
+_CLIENT_MESSAGE_TYPE = 33
+
+#: The X protocol's STRING atom.
+_STRING = 31
+
+
+def _decode(format_, type_, data):
+    """Return the decoded value of a property from its raw bytes."""
+    if format_ == 8:
+        if type_ == _STRING:
+            return data.decode('ISO-8859-1')
+        return data.decode('UTF-8', 'replace')
+    code = 'I' if format_ == 32 else 'H'
+    return struct.unpack('={0}{1}'.format(len(data) * 8 // format_, code),
+                         data)
+
+
+class XCBBackend(backend.Backend):
+
+    """A backend that talks to X through xcffib."""
+
+    def __init__(self, display=None):
+        if xcffib is None:
+            raise backend.BackendError(
+                "The xcb backend needs xcffib: pip install xcffib")
+        super(XCBBackend, self).__init__(display)
+        self.conn = xcffib.connect(display=display)
+        self.root = self.conn.get_setup().roots[self.conn.pref_screen].root
+        self._atoms = {}
+        self._atom_names = {}
+
+    # Atoms.
+
+    def atoms(self, names):
+        """Return the atoms for the given names, interning them in one batch."""
+        cookies = [(name, self.conn.core.InternAtom(False, len(name), name))
+                   for name in names if name not in self._atoms]
+        for name, cookie in cookies:
+            atom = cookie.reply().atom
+            self._atoms[name] = atom
+            self._atom_names[atom] = name
+        return [self._atoms[name] for name in names]
+
+    def atom(self, name):
+        return self.atoms([name])[0]
+
+    def _atom_name(self, atom):
+        name = self._atom_names.get(atom)
+        if name is None:
+            name = self.conn.core.GetAtomName(atom).reply().name.to_string()
+            self._atom_names[atom] = name
+        return name
+
+    # Properties.
+
+    def _get_property(self, window_id, atom, offset=0):
+        return self.conn.core.GetProperty(
+            False, window_id, atom, xproto.GetPropertyType.Any, offset,
+            backend.PROPERTY_LENGTH)
+
+    def _root_property(self, name, deadline=None):
+        return self.fetch_properties([self.root], [name],
+                                     deadline=deadline)[self.root].get(name)
+
+    def client_ids(self):
+        return list(self._root_property('_NET_CLIENT_LIST') or ())
+
+    def active_window_id(self, deadline=None):
+        value = self._root_property('_NET_ACTIVE_WINDOW', deadline)
+        if not value or not value[0]:
+            return None
+        return value[0]
+
+    def current_desktop(self, deadline=None):
+        value = self._root_property('_NET_CURRENT_DESKTOP', deadline)
+        if value:
+            return value[0]
+        return None
+
+    def supported_hints(self):
+        return [self._atom_name(atom)
+                for atom in self._root_property('_NET_SUPPORTED') or ()]
+
+    def _poll_for_reply(self, cookie):
+        """Return the cookie's reply if it has arrived, None if it hasn't.
+
+        Never blocks. Raises xcffib.Error if the request failed.
+
+        """
+        reply_p = xcffib.ffi.new("void **")
+        error_p = xcffib.ffi.new("xcb_generic_error_t **")
+        if not xcffib.lib.xcb_poll_for_reply(
+                self.conn._conn, cookie.sequence, reply_p, error_p):
+            return None
+        try:
+            self.conn._process_error(error_p[0])
+        finally:
+            if error_p[0] != xcffib.ffi.NULL:
+                xcffib.c_free(error_p[0])
+        data = xcffib.ffi.gc(reply_p[0], xcffib.c_free)
+        reply = xcffib.ffi.cast("xcb_generic_reply_t *", data)
+        return cookie.reply_type(xcffib.CffiUnpacker(
+            data, known_max=32 + reply.length * 4))
+
+    def _reply(self, cookie, deadline):
+        """Return the cookie's reply, or None if the deadline passes first."""
+        if deadline is None:
+            return cookie.reply()
+        fd = self.conn.get_file_descriptor()
+        while True:
+            reply = self._poll_for_reply(cookie)
+            if reply is not None:
+                return reply
+            if deadline.expired():
+                return None
+            select.select([fd], [], [], deadline.remaining())
+
+    def fetch_properties(self, window_ids, names=backend.WINDOW_PROPERTIES,
+                         deadline=None):
+        """Fetch the given properties of all of the given windows.
+
+        Every GetProperty request is sent before any reply is read, so the
+        whole batch costs one round trip. Replies that are given up on
+        because of the deadline are discarded, so XCB doesn't keep them.
+
+        See Backend.fetch_properties().
+
+        """
+        atoms = list(zip(names, self.atoms(names)))
+        cookies = [(window_id, name, atom,
+                    self._get_property(window_id, atom))
+                   for window_id in window_ids for name, atom in atoms]
+        self.conn.flush()
+
+        properties = dict((window_id, {}) for window_id in window_ids)
+        timed_out = []
+        for window_id, name, atom, cookie in cookies:
+            if timed_out:
+                cookie.discard_reply()
+                timed_out.append((window_id, name))
+                continue
+            try:
+                reply = self._reply(cookie, deadline)
+            except xcffib.Error:
+                # For example BadWindow, if the window was closed after we got
+                # the client list.
+                continue
+            if reply is None:
+                cookie.discard_reply()
+                timed_out.append((window_id, name))
+                continue
+            if not reply.type:
+                # The window doesn't have this property.
+                continue
+            value = reply.value.buf()
+            while reply is not None and reply.bytes_after:
+                cookie = self._get_property(window_id, atom, len(value) // 4)
+                self.conn.flush()
+                reply = self._reply(cookie, deadline)
+                if reply is None:
+                    cookie.discard_reply()
+                else:
+                    value += reply.value.buf()
+            if reply is None:
+                timed_out.append((window_id, name))
+                continue
+            properties[window_id][name] = _decode(reply.format, reply.type,
+                                                  value)
+
+        if timed_out:
+            backend.log_missed_deadline(log, timed_out, deadline)
+
+        return properties
+
+    # Requests.
+
+    def _client_message(self, window_id, name, data):
+        data = (list(data) + [0] * 5)[:5]
+        event = _CLIENT_MESSAGE.pack(_CLIENT_MESSAGE_TYPE, 32, 0, window_id,
+                                     self.atom(name), *data)
+        self.conn.core.SendEvent(
+            False, self.root,
+            xproto.EventMask.SubstructureRedirect |
+            xproto.EventMask.SubstructureNotify,
+            event)
+
+    def send(self, action, window):
+        if action == "raise":
+            self._client_message(
+                window.window_id, '_NET_ACTIVE_WINDOW',
+                [backend.SOURCE_APPLICATION, xcffib.CurrentTime])
+        elif action == "raise-as-pager":
+            self._client_message(window.window_id, '_NET_ACTIVE_WINDOW',
+                                 [backend.SOURCE_PAGER, xcffib.CurrentTime])
+        elif action == "minimize":
+            self._client_message(window.window_id, 'WM_CHANGE_STATE',
+                                 [backend.ICONIC_STATE])
+        elif action == "close":
+            self._client_message(window.window_id, '_NET_CLOSE_WINDOW',
+                                 [xcffib.CurrentTime, backend.SOURCE_PAGER])
+        elif action == "move-to-current-desktop":
+            self._client_message(
+                window.window_id, '_NET_WM_DESKTOP',
+                [self.current_desktop(), backend.SOURCE_PAGER])
+        else:
+            raise ValueError("Unknown window action: {0}".format(action))
+
+    def flush(self):
+        self.conn.flush()
+
+    # Events.
+
+    def subscribe(self, window_ids=()):
+        for window_id in [self.root] + list(window_ids):
+            self.conn.core.ChangeWindowAttributes(
+                window_id, xproto.CW.EventMask,
+                [xproto.EventMask.PropertyChange])
+        self.conn.flush()
+
+    def fileno(self):
+        return self.conn.get_file_descriptor()
+
+    def events(self):
+        events = []
+        while True:
+            event = self.conn.poll_for_event()
+            if event is None:
+                return events
+            if not isinstance(event, xproto.PropertyNotifyEvent):
+                continue
+            name = self._atom_name(event.atom)
+            if event.window != self.root:
+                events.append(backend.Event("property", event.window, name))
+            elif name == '_NET_ACTIVE_WINDOW':
+                events.append(backend.Event("active", None, name))
+            elif name == '_NET_CLIENT_LIST':
+                events.append(backend.Event("clients", None, name))
+
+    def wait(self, deadline):
+        select.select([self.fileno()], [], [], deadline.remaining())
+
+    def close(self):
+        self.conn.disconnect()
+
+
+#: The backend class, for backend.get_backend().
+Backend = XCBBackend
@@ -42,9 +42,14 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.6',
     ],
 
+    # The daemon needs selectors and --stats needs tracemalloc.
+    python_requires='>=3.5',
+
     # What does your project relate to?
     keywords='',
 
@@ -79,6 +84,7 @@ setup(
     entry_points={
         'console_scripts': [
             'flitter=flitter.runraisenext:main',
+            'flitter-daemon=flitter.daemon:main',
         ],
     },
 )